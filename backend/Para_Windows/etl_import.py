@@ -1,4 +1,5 @@
 import os
+import sys
 import pandas as pd
 from sqlalchemy import create_engine, text
 import io
@@ -6,6 +7,12 @@ import time
 from tqdm import tqdm
 import zipfile
 
+# Mesmo controle de bloco do backend/etl_import.py (etl_memoria: orçamento de RSS; sem /proc
+# usa o tracemalloc), para as duas importações se comportarem igual
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from etl_memoria import ControleBloco, orcamento_por_processo
+from etl_transcoder import ler_blocos
+
 # --- CONFIGURAÇÕES ---
 DB_USER = "user_cnpj"
 DB_PASS = "password_cnpj"
@@ -15,7 +22,8 @@ DB_NAME = "cnpj_dados"
 # Timeout aumentado para garantir estabilidade em conexões lentas
 DATABASE_URL = f"postgresql+pg8000://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 PASTA_DADOS = "./dados"
-TAMANHO_CHUNK = 20000  # Tamanho seguro para 16GB RAM
+# Importação num processo só: ele fica com o orçamento de memória inteiro (ETL_MEMORIA_MB)
+ORCAMENTO_PROCESSO = orcamento_por_processo(1)
 
 # --- DEFINIÇÃO DAS COLUNAS ---
 COLUNAS_EMPRESAS = ["cnpj_basico", "razao_social", "natureza_juridica", "qualificacao_responsavel", "capital_social", "porte_empresa", "ente_federativo_responsavel"]
@@ -58,27 +66,24 @@ def processar_csv(caminho_csv, tabela, colunas):
     except:
         pass
 
-    # Leitura em blocos para economizar RAM
-    chunks = pd.read_csv(
-        caminho_csv, sep=';', encoding='latin-1', header=None, names=colunas,
-        dtype=str, chunksize=TAMANHO_CHUNK, quotechar='"', on_bad_lines='warn'
-    )
-
     total_linhas = 0
-    with engine.connect() as conn:
+    controle = ControleBloco(ORCAMENTO_PROCESSO)
+    with engine.connect() as conn, open(caminho_csv, 'rb') as arquivo:
         conn.execute(text("SET synchronous_commit = off;"))
-            
+
+        # Blocos de registros completos; o tamanho de cada um vem do controle (RSS e vazão)
         with tqdm(total=tamanho_arquivo, unit='B', unit_scale=True, desc="    Importando DB") as barra:
-            for df_chunk in chunks:
+            inicio_bloco = time.perf_counter()
+            for bloco in ler_blocos(arquivo, controle):
+                df_chunk = pd.read_csv(io.BytesIO(bloco), sep=';', encoding='latin-1', header=None, names=colunas,
+                                       dtype=str, quotechar='"', on_bad_lines='warn')
                 df_chunk = limpar_dados(df_chunk)
-                
+
                 # Sistema de Retry (Tenta 3x se a conexão cair)
                 tentativas = 3
                 while tentativas > 0:
                     try:
                         inserir_via_copy(conn, df_chunk, tabela)
-                        bytes_chunk = df_chunk.memory_usage(index=True, deep=True).sum()
-                        barra.update(int(bytes_chunk * 0.35)) # Estimativa visual
                         total_linhas += len(df_chunk)
                         break 
                     except Exception as e:
@@ -93,6 +98,15 @@ def processar_csv(caminho_csv, tabela, colunas):
                         if tentativas == 0:
                             print(f"    [X] Falha final no lote. Pulando.")
 
+                barra.update(len(bloco))
+                del df_chunk
+                # Leitura + parse + COPY do bloco
+                controle.registrar(len(bloco), time.perf_counter() - inicio_bloco)
+                inicio_bloco = time.perf_counter()
+
+    if controle.reducoes:
+        print(f"    [!] Bloco reduzido {controle.reducoes}x para caber em {ORCAMENTO_PROCESSO/1024/1024:.0f} MB "
+              f"(pico {controle.pico_rss/1024/1024:.0f} MB, bloco final {controle.tamanho/1024/1024:.0f} MB)")
     return total_linhas
 
 def processar_zip(caminho_zip, tabela, colunas):
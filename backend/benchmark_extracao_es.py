@@ -0,0 +1,39 @@
+import sys
+import time
+
+from etl_sync_es import documentos_postgres, documentos_copy, fatias_postgres, get_postgres_engine, TABELA_LEITURA
+
+# Compara as duas extrações do Postgres do etl_sync_es.py (cursor pg8000 + yield_per contra
+# COPY TO STDOUT), sem Elastic: mede só a leitura até o documento pronto para o bulk, que é o
+# teto da vazão da sincronização (por processo).
+# Uso: python benchmark_extracao_es.py [linhas]   (padrão: o modelo de leitura inteiro)
+
+
+def medir(funcao, limite):
+    inicio = time.time()
+    linhas = 0
+    for fatia in fatias_postgres(get_postgres_engine(), 1):
+        documentos = funcao(fatia)
+        for _ in documentos:
+            linhas += 1
+            if limite and linhas >= limite:
+                documentos.close()
+                break
+    return linhas, time.time() - inicio
+
+
+def main():
+    limite = int(sys.argv[1]) if len(sys.argv) > 1 else 0
+    print(f"[*] Lendo {TABELA_LEITURA}" + (f" (até {limite:,} linhas)" if limite else "") + "...\n")
+
+    resultados = {}
+    for nome, funcao in (("cursor", documentos_postgres), ("copy", documentos_copy)):
+        linhas, segundos = medir(funcao, limite)
+        resultados[nome] = linhas / max(segundos, 1e-6)
+        print(f"{nome:<8} {linhas:>12,} linhas  {segundos:>7.2f}s  {resultados[nome]:>12,.0f} linhas/s")
+
+    print(f"\n[OK] COPY {resultados['copy'] / resultados['cursor']:.1f}x mais rápido que o cursor")
+
+
+if __name__ == "__main__":
+    main()
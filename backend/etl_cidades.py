@@ -0,0 +1,49 @@
+import time
+from sqlalchemy import text
+
+import etl_telemetria
+
+# Lista de cidades por UF (filtro de município do frontend), pré-calculada no fim da importação.
+# Antes era um SELECT DISTINCT em estabelecimentos no primeiro acesso de cada UF, guardado num
+# lru_cache de cada worker da API que nunca era invalidado. Tabela comum, e não materialized
+# view: a view ficaria presa à estabelecimentos antiga depois da troca atômica de tabelas.
+
+TABELA_CIDADES = "cidades_por_uf"
+
+def garantir_tabela_cidades(engine):
+    with engine.connect() as conn:
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {TABELA_CIDADES} (
+                uf VARCHAR(2) NOT NULL,
+                municipio VARCHAR(4) NOT NULL,
+                descricao TEXT,
+                estabelecimentos BIGINT NOT NULL,
+                atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (uf, municipio)
+            );
+        """))
+
+def atualizar_cidades(engine):
+    """Recalcula a tabela numa transação só: a API continua lendo a lista anterior até o COMMIT."""
+    garantir_tabela_cidades(engine)
+    print(f"--> {TABELA_CIDADES}: recalculando cidades por UF...")
+    start = time.time()
+    with etl_telemetria.atual().fase("cidades"):
+        with engine.execution_options(isolation_level="READ COMMITTED").begin() as conn:
+            conn.execute(text(f"DELETE FROM {TABELA_CIDADES};"))
+            linhas = conn.execute(text(f"""
+                INSERT INTO {TABELA_CIDADES} (uf, municipio, descricao, estabelecimentos)
+                SELECT e.uf, e.municipio, m.descricao, e.total
+                FROM (SELECT uf, municipio, count(*) AS total FROM estabelecimentos
+                      WHERE uf IS NOT NULL AND municipio IS NOT NULL GROUP BY uf, municipio) e
+                LEFT JOIN municipios m ON m.codigo = e.municipio
+            """)).rowcount
+        with engine.connect() as conn:
+            conn.execute(text(f"ANALYZE {TABELA_CIDADES};"))
+    print(f"    [OK] {linhas:,} cidades em {time.time() - start:.2f}s")
+    etl_telemetria.atual().registrar_item(TABELA_CIDADES, linhas=linhas, segundos=round(time.time() - start, 2))
+
+if __name__ == "__main__":
+    # Recalcular à mão (ex.: depois de mexer em estabelecimentos fora do etl_import.py)
+    from etl_setup_db import get_engine
+    atualizar_cidades(get_engine())
@@ -0,0 +1,145 @@
+import time
+from sqlalchemy import text
+
+# Importação delta: a versão nova é carregada em <tabela>_next (como na troca atômica),
+# mas em vez de trocar a tabela inteira só as diferenças vão para a tabela publicada.
+# Cada linha é identificada pela chave do CNPJ + md5 do conteúdo; as chaves alteradas
+# ficam em etl_alteracoes para as etapas seguintes (Elastic, caches) processarem só elas.
+
+TABELA_ALTERACOES = "etl_alteracoes"
+
+# Chave de cada tabela. Sócios não têm chave própria: são comparados em grupo por empresa
+# (qualquer mudança num sócio regrava todos os sócios daquele cnpj_basico).
+CHAVES = {
+    "estabelecimentos": ["cnpj"],
+    "empresas": ["cnpj_basico"],
+    "socios": ["cnpj_basico"],
+}
+# Dígitos da chave em etl_alteracoes: a chave é numérica, o texto volta com os zeros à esquerda
+DIGITOS_CHAVE = {"estabelecimentos": 14, "empresas": 8, "socios": 8}
+AGRUPADAS = {"socios"}
+
+TAMANHO_LOTE_DELTA = 50000
+
+# Acima dessa fração de linhas alteradas é mais barato trocar a tabela inteira
+FRACAO_MAXIMA_DELTA = 0.5
+
+def garantir_tabela_alteracoes(engine):
+    with engine.connect() as conn:
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {TABELA_ALTERACOES} (
+                id BIGSERIAL PRIMARY KEY,
+                versao TEXT NOT NULL,
+                tabela TEXT NOT NULL,
+                chave TEXT,
+                operacao CHAR(1) NOT NULL,
+                registrado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS idx_alteracoes_versao ON {TABELA_ALTERACOES} (versao, tabela);"))
+
+def _colunas_gravaveis(conn, tabela):
+    # Colunas que aceitam INSERT: as geradas (cnpj) o banco recalcula sozinho
+    return [linha[0] for linha in conn.execute(text(
+        "SELECT column_name FROM information_schema.columns WHERE table_name = :t AND is_generated = 'NEVER' ORDER BY ordinal_position"),
+        {"t": tabela})]
+
+def _impressoes(origem, chave, agrupada):
+    # Impressão digital de cada linha (ou de cada grupo de sócios): chave + md5 do conteúdo
+    colunas = ", ".join(chave)
+    if agrupada:
+        return f"SELECT {colunas}, md5(string_agg(t::text, '|' ORDER BY t::text)) AS h FROM {origem} t GROUP BY {colunas}"
+    return f"SELECT {colunas}, md5(t::text) AS h FROM {origem} t"
+
+def calcular_delta(conn, tabela, nova):
+    """
+    Cria etl_delta_<tabela> com (chave, operacao, lote): I = só na nova, D = só na atual,
+    U = nas duas com conteúdo diferente. Retorna {operacao: quantidade}.
+    """
+    chave = CHAVES[tabela]
+    colunas = ", ".join(chave)
+    agrupada = tabela in AGRUPADAS
+    delta = f"etl_delta_{tabela}"
+
+    conn.execute(text(f"DROP TABLE IF EXISTS {delta};"))
+    conn.execute(text(f"""
+        CREATE UNLOGGED TABLE {delta} AS
+        SELECT d.*, (row_number() OVER (ORDER BY {colunas}) - 1) / {TAMANHO_LOTE_DELTA} AS lote FROM (
+            SELECT {colunas}, CASE WHEN a.h IS NULL THEN 'I' WHEN n.h IS NULL THEN 'D' ELSE 'U' END AS operacao
+            FROM ({_impressoes(nova, chave, agrupada)}) n
+            FULL JOIN ({_impressoes(tabela, chave, agrupada)}) a USING ({colunas})
+            WHERE n.h IS DISTINCT FROM a.h
+        ) d;
+    """))
+    conn.execute(text(f"CREATE INDEX ON {delta} (lote);"))
+    linhas = conn.execute(text(f"SELECT operacao, count(*) FROM {delta} GROUP BY operacao")).all()
+    return {operacao: quantidade for operacao, quantidade in linhas}
+
+def aplicar_lotes(engine, tabela, nova, versao):
+    """Aplica o delta lote a lote: cada lote (DELETE + INSERT + registro das chaves) é uma transação."""
+    chave = CHAVES[tabela]
+    delta = f"etl_delta_{tabela}"
+    juncao = " AND ".join(f"t.{c} = d.{c}" for c in chave)
+    chave_texto = " || ".join(f"lpad(d.{c}::text, {DIGITOS_CHAVE[tabela]}, '0')" for c in chave)
+
+    with engine.connect() as conn:
+        total_lotes = conn.execute(text(f"SELECT coalesce(max(lote) + 1, 0) FROM {delta}")).scalar()
+        colunas = _colunas_gravaveis(conn, tabela)
+    lista_colunas = ", ".join(colunas)
+    selecao = ", ".join(f"t.{c}" for c in colunas)
+
+    engine_transacao = engine.execution_options(isolation_level="READ COMMITTED")
+    for lote in range(total_lotes):
+        with engine_transacao.begin() as conn:
+            conn.execute(text(f"DELETE FROM {tabela} t USING {delta} d WHERE d.lote = :l AND d.operacao IN ('U', 'D') AND {juncao}"), {"l": lote})
+            conn.execute(text(f"INSERT INTO {tabela} ({lista_colunas}) SELECT {selecao} FROM {nova} t JOIN {delta} d ON {juncao} WHERE d.lote = :l AND d.operacao IN ('I', 'U')"), {"l": lote})
+            conn.execute(text(f"INSERT INTO {TABELA_ALTERACOES} (versao, tabela, chave, operacao) SELECT :v, :t, {chave_texto}, d.operacao FROM {delta} d WHERE d.lote = :l"),
+                         {"v": versao, "t": tabela, "l": lote})
+        print(f"\r    -> {tabela}: lote {lote + 1}/{total_lotes}", end="", flush=True)
+    if total_lotes: print()
+
+def ultimo_id_alteracoes(engine):
+    """Maior id de etl_alteracoes (0 se a tabela ainda não existe)."""
+    with engine.connect() as conn:
+        if conn.execute(text("SELECT to_regclass(:t)"), {"t": TABELA_ALTERACOES}).scalar() is None: return 0
+        return conn.execute(text(f"SELECT coalesce(max(id), 0) FROM {TABELA_ALTERACOES}")).scalar()
+
+def registrar_recarga_total(engine, tabela, versao):
+    """Marca que a tabela foi trocada inteira (chave NULL): as etapas seguintes devem reprocessar tudo."""
+    with engine.connect() as conn:
+        conn.execute(text(f"INSERT INTO {TABELA_ALTERACOES} (versao, tabela, chave, operacao) VALUES (:v, :t, NULL, '*')"),
+                     {"v": versao, "t": tabela})
+
+def aplicar_delta(engine, tabela, nova, versao):
+    """
+    Compara `nova` (carga completa da versão) com `tabela` e aplica só as diferenças.
+    Retorna False quando o delta não compensa (tabela vazia ou mudanças demais): aí o chamador troca a tabela inteira.
+    """
+    inicio = time.time()
+    with engine.connect() as conn:
+        if not conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {tabela})")).scalar():
+            return False
+
+        print(f"--> {tabela}: calculando delta...")
+        # Índice temporário na chave da tabela nova (o INSERT por lote busca nela)
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS idx_delta_{tabela} ON {nova} ({', '.join(CHAVES[tabela])});"))
+        contagem = calcular_delta(conn, tabela, nova)
+        total = conn.execute(text(f"SELECT count(*) FROM {nova}")).scalar()
+
+    mudancas = sum(contagem.values())
+    print(f"    {contagem.get('I', 0):,} novas, {contagem.get('U', 0):,} alteradas, {contagem.get('D', 0):,} removidas "
+          f"({mudancas:,} de {total:,} em {time.time() - inicio:.1f}s)")
+    if total and mudancas > FRACAO_MAXIMA_DELTA * total:
+        print(f"    [!] Mudanças demais para delta; a tabela será trocada inteira.")
+        with engine.connect() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS etl_delta_{tabela};"))
+            conn.execute(text(f"DROP INDEX IF EXISTS idx_delta_{tabela};"))
+        return False
+
+    aplicar_lotes(engine, tabela, nova, versao)
+    with engine.connect() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS etl_delta_{tabela};"))
+        conn.execute(text(f"DROP TABLE IF EXISTS {nova};"))
+        conn.execute(text(f"ANALYZE {tabela};"))
+    print(f"    [OK] Delta de {tabela} aplicado em {time.time() - inicio:.1f}s")
+    return True
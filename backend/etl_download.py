@@ -4,7 +4,14 @@ from tqdm import tqdm
 import urllib3
 from datetime import datetime, timedelta
 import json
+import re
 import time
+import hashlib
+import zipfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import etl_telemetria
 
 # Desabilita avisos SSL
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -16,29 +23,73 @@ URL_RAIZ = f"{HOST}{PATH_ROOT}"
 PASTA_DADOS = "./dados"
 ARQUIVO_METADATA = os.path.join(PASTA_DADOS, "metadata.json")
 
+# Quantos arquivos baixar ao mesmo tempo (o servidor da Receita costuma limitar por conexão)
+MAX_DOWNLOADS_SIMULTANEOS = int(os.getenv("ETL_DOWNLOADS_SIMULTANEOS", "4"))
+TAMANHO_BLOCO_DOWNLOAD = 1024 * 1024
+
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Linux; Android 6.0; Nexus 5 Build/MRA58N) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Mobile Safari/537.36"
 }
 
-def obter_versao_local():
+_lock_metadata = threading.Lock()
+
+def carregar_metadata():
+    """
+    Lê o metadata.json. Além da versão, ele guarda o manifesto dos arquivos:
+    {"arquivos": {"Empresas0.zip": {"etag", "last_modified", "tamanho", "sha256", "integro"}}}
+    """
     if os.path.exists(ARQUIVO_METADATA):
         try:
             with open(ARQUIVO_METADATA, 'r') as f:
                 data = json.load(f)
-                return data.get("versao", None)
+                data.setdefault("arquivos", {})
+                return data
         except:
-            return None
-    return None
+            pass
+    return {"versao": None, "arquivos": {}}
+
+def _gravar_metadata(data):
+    # Grava em arquivo temporário e troca, para nunca deixar um JSON pela metade
+    temporario = ARQUIVO_METADATA + ".tmp"
+    with open(temporario, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(temporario, ARQUIVO_METADATA)
+
+def obter_versao_local():
+    return carregar_metadata().get("versao", None)
 
 def salvar_versao_local(versao):
-    with open(ARQUIVO_METADATA, 'w') as f:
-        json.dump({"versao": versao, "ultima_atualizacao": str(datetime.now())}, f)
+    with _lock_metadata:
+        data = carregar_metadata()
+        data["versao"] = versao
+        data["ultima_atualizacao"] = str(datetime.now())
+        _gravar_metadata(data)
+
+def atualizar_manifesto(nome_arquivo, entrada):
+    with _lock_metadata:
+        data = carregar_metadata()
+        if entrada is None: data["arquivos"].pop(nome_arquivo, None)
+        else: data["arquivos"][nome_arquivo] = entrada
+        _gravar_metadata(data)
 
 def encontrar_ultima_versao_online():
+    print("[*] Buscando versão mais recente no servidor...")
+
+    # 1 requisição: a listagem da pasta raiz já traz todas as pastas AAAA-MM
+    try:
+        response = requests.get(f"{URL_RAIZ}/", headers=HEADERS, verify=False, timeout=30)
+        response.raise_for_status()
+        pastas = set(re.findall(r'href="(\d{4}-\d{2})/?"', response.text))
+        if pastas:
+            pasta = max(pastas)
+            print(f"[OK] Última versão encontrada online: {pasta}")
+            return pasta, f"{URL_RAIZ}/{pasta}/"
+    except Exception as e:
+        print(f"[!] Listagem indisponível ({e}). Testando mês a mês...")
+
     data_cursor = datetime.now()
     limite = data_cursor - timedelta(days=730) 
 
-    print("[*] Buscando versão mais recente no servidor...")
     while data_cursor > limite:
         pasta_teste = data_cursor.strftime("%Y-%m")
         url_teste = f"{URL_RAIZ}/{pasta_teste}/"
@@ -65,48 +116,177 @@ def gerar_lista_arquivos():
         arquivos.append(f"Socios{i}.zip")
     return arquivos
 
-def baixar_arquivo(url_base, nome_arquivo, forcar_download=False):
+def calcular_sha256(caminho, hash_obj=None):
+    hash_obj = hash_obj or hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(TAMANHO_BLOCO_DOWNLOAD), b""):
+            hash_obj.update(bloco)
+    return hash_obj
+
+def verificar_zip(caminho):
+    """Confere o CRC de todos os membros do ZIP. Retorna True se estiver íntegro."""
+    try:
+        with zipfile.ZipFile(caminho, 'r') as z:
+            return z.testzip() is None
+    except (zipfile.BadZipFile, OSError):
+        return False
+
+def _mesma_versao_remota(entrada, remoto):
+    # ETag é o validador mais forte; sem ele, Last-Modified + tamanho
+    if not entrada or entrada.get("tamanho") != remoto["tamanho"]:
+        return False
+    if remoto["etag"]:
+        return entrada.get("etag") == remoto["etag"]
+    if remoto["last_modified"]:
+        return entrada.get("last_modified") == remoto["last_modified"]
+    return False
+
+_lock_barras = threading.Lock()
+_posicoes_livres = list(range(MAX_DOWNLOADS_SIMULTANEOS))
+
+def _reservar_posicao_barra():
+    # Cada download paralelo ganha uma linha própria no terminal
+    with _lock_barras:
+        return _posicoes_livres.pop(0) if _posicoes_livres else 0
+
+def _liberar_posicao_barra(posicao):
+    with _lock_barras:
+        _posicoes_livres.append(posicao)
+        _posicoes_livres.sort()
+
+def baixar_arquivo(url_base, nome_arquivo, manifesto=None):
+    """
+    Baixa um arquivo retomando downloads interrompidos via HTTP Range.
+    O conteúdo vai para '<arquivo>.part' e só é renomeado quando completo.
+    Só baixa se o ETag/Last-Modified do servidor mudou em relação ao manifesto.
+    Retorna o número de bytes transferidos (0 se já estava completo) ou None em caso de falha.
+    """
     url = f"{url_base}{nome_arquivo}"
     caminho_arquivo = os.path.join(PASTA_DADOS, nome_arquivo)
+    caminho_parcial = caminho_arquivo + ".part"
+    entrada = (manifesto or {}).get(nome_arquivo)
     
-    tamanho_remoto = -1
+    remoto = {"tamanho": -1, "etag": None, "last_modified": None}
     try:
         head = requests.head(url, headers=HEADERS, verify=False, timeout=30)
-        tamanho_remoto = int(head.headers.get('content-length', 0))
+        head.raise_for_status()
+        remoto = {
+            "tamanho": int(head.headers.get('content-length', -1)),
+            "etag": head.headers.get('etag'),
+            "last_modified": head.headers.get('last-modified'),
+        }
     except:
         pass
+    tamanho_remoto = remoto["tamanho"]
 
     if os.path.exists(caminho_arquivo):
         tamanho_local = os.path.getsize(caminho_arquivo)
-        if not forcar_download and tamanho_remoto != -1 and tamanho_local == tamanho_remoto:
-            print(f"[Ignorado] {nome_arquivo} já existe e está completo.")
-            return True
+        if _mesma_versao_remota(entrada, remoto) and tamanho_local == entrada["tamanho"] and entrada.get("integro"):
+            print(f"[Ignorado] {nome_arquivo} não mudou no servidor.")
+            return 0
+        if entrada is None and tamanho_remoto != -1 and tamanho_local == tamanho_remoto:
+            # Arquivo baixado antes do manifesto existir: valida e registra sem baixar de novo
+            with etl_telemetria.atual().fase("verificacao"):
+                integro = verificar_zip(caminho_arquivo)
+            if integro:
+                atualizar_manifesto(nome_arquivo, dict(remoto, sha256=calcular_sha256(caminho_arquivo).hexdigest(), integro=True))
+                print(f"[Ignorado] {nome_arquivo} já existe e está completo.")
+                return 0
+
+    # Pedaço de uma versão anterior do arquivo não serve para retomar
+    if os.path.exists(caminho_parcial) and entrada and entrada.get("parcial_de") not in (remoto["etag"] or remoto["last_modified"], None):
+        os.remove(caminho_parcial)
+    atualizar_manifesto(nome_arquivo, {"parcial_de": remoto["etag"] or remoto["last_modified"]})
 
     print(f"[*] Baixando: {nome_arquivo} ({tamanho_remoto / (1024*1024):.2f} MB)")
     
+    posicao = _reservar_posicao_barra()
+    inicio = time.time()
+    transferidos = 0
     tentativas = 3
-    while tentativas > 0:
-        try:
-            response = requests.get(url, headers=HEADERS, stream=True, verify=False, timeout=60)
-            response.raise_for_status()
-            
-            with open(caminho_arquivo, "wb") as arquivo, tqdm(
-                desc=nome_arquivo,
-                total=tamanho_remoto,
-                unit='iB',
-                unit_scale=True,
-                unit_divisor=1024,
-            ) as barra:
-                for dados in response.iter_content(chunk_size=16384):
-                    arquivo.write(dados)
-                    barra.update(len(dados))
-            return True
-        except Exception as e:
-            print(f"[!] Erro no download ({e}). Tentando novamente...")
-            tentativas -= 1
-            time.sleep(5)
-    
-    return False
+    try:
+        while tentativas > 0:
+            ja_baixado = os.path.getsize(caminho_parcial) if os.path.exists(caminho_parcial) else 0
+            headers = dict(HEADERS)
+            if ja_baixado > 0:
+                headers["Range"] = f"bytes={ja_baixado}-"
+                # Se o arquivo mudou no servidor, o If-Range faz ele devolver o arquivo inteiro
+                if remoto["etag"] or remoto["last_modified"]:
+                    headers["If-Range"] = remoto["etag"] or remoto["last_modified"]
+            try:
+                response = requests.get(url, headers=headers, stream=True, verify=False, timeout=60)
+                if response.status_code == 416:
+                    # Range fora do arquivo: o .part já tem tudo (ou é lixo de outra versão)
+                    if tamanho_remoto > 0 and ja_baixado == tamanho_remoto:
+                        hash_obj = calcular_sha256(caminho_parcial)
+                        break
+                    os.remove(caminho_parcial)
+                    continue
+                response.raise_for_status()
+
+                # Servidor ignorou o Range (200 em vez de 206): recomeça do zero
+                modo = "ab"
+                if ja_baixado > 0 and response.status_code != 206:
+                    print(f"[!] {nome_arquivo}: servidor não aceitou retomada, recomeçando.")
+                    ja_baixado, modo = 0, "wb"
+                elif ja_baixado > 0:
+                    print(f"[*] {nome_arquivo}: retomando a partir de {ja_baixado / (1024*1024):.2f} MB")
+
+                # O hash cobre o arquivo inteiro, inclusive o pedaço retomado
+                hash_obj = calcular_sha256(caminho_parcial) if ja_baixado > 0 else hashlib.sha256()
+
+                with open(caminho_parcial, modo) as arquivo, tqdm(
+                    desc=nome_arquivo,
+                    total=tamanho_remoto if tamanho_remoto > 0 else None,
+                    initial=ja_baixado,
+                    unit='iB',
+                    unit_scale=True,
+                    unit_divisor=1024,
+                    position=posicao,
+                    leave=False,
+                ) as barra:
+                    with etl_telemetria.atual().fase("download"):
+                        for dados in response.iter_content(chunk_size=TAMANHO_BLOCO_DOWNLOAD):
+                            arquivo.write(dados)
+                            hash_obj.update(dados)
+                            transferidos += len(dados)
+                            barra.update(len(dados))
+
+                if tamanho_remoto > 0 and os.path.getsize(caminho_parcial) < tamanho_remoto:
+                    raise IOError("conexão encerrada antes do fim do arquivo")
+                break
+            except Exception as e:
+                print(f"[!] Erro no download de {nome_arquivo} ({e}). Tentando novamente...")
+                tentativas -= 1
+                time.sleep(5)
+    finally:
+        _liberar_posicao_barra(posicao)
+
+    if tentativas == 0:
+        return None
+
+    with etl_telemetria.atual().fase("verificacao"):
+        integro = verificar_zip(caminho_parcial)
+    if not integro:
+        print(f"[X] {nome_arquivo}: CRC inválido, arquivo corrompido descartado.")
+        os.remove(caminho_parcial)
+        atualizar_manifesto(nome_arquivo, None)
+        return None
+
+    os.replace(caminho_parcial, caminho_arquivo)
+    atualizar_manifesto(nome_arquivo, {
+        "etag": remoto["etag"],
+        "last_modified": remoto["last_modified"],
+        "tamanho": os.path.getsize(caminho_arquivo),
+        "sha256": hash_obj.hexdigest(),
+        "integro": True,
+    })
+    duracao = max(time.time() - inicio, 1e-6)
+    print(f"[OK] {nome_arquivo}: {transferidos / (1024*1024):.2f} MB em {duracao:.1f}s "
+          f"({transferidos / (1024*1024) / duracao:.2f} MB/s)")
+    etl_telemetria.atual().contar(bytes=transferidos)
+    etl_telemetria.atual().registrar_item(nome_arquivo, bytes=transferidos, segundos=round(duracao, 2))
+    return transferidos
 
 def main():
     if not os.path.exists(PASTA_DADOS):
@@ -117,20 +297,39 @@ def main():
     
     nova_versao = (versao_local != versao_online)
     if nova_versao:
-        print(f"[!] Nova versão detectada: {versao_online}")
+        print(f"[!] Nova versão detectada: {versao_online} (só os arquivos alterados serão baixados)")
     
+    manifesto = carregar_metadata()["arquivos"]
     arquivos = gerar_lista_arquivos()
     sucesso = True
+    total_bytes = 0
     
-    for arq in arquivos:
-        if not baixar_arquivo(url_base, arq, forcar_download=nova_versao):
-            sucesso = False
+    print(f"[*] Baixando {len(arquivos)} arquivos ({MAX_DOWNLOADS_SIMULTANEOS} simultâneos)...")
+    tel = etl_telemetria.iniciar("download")
+    inicio = time.time()
+    with ThreadPoolExecutor(max_workers=MAX_DOWNLOADS_SIMULTANEOS) as executor:
+        futuros = {executor.submit(baixar_arquivo, url_base, arq, manifesto): arq for arq in arquivos}
+        for futuro in as_completed(futuros):
+            try:
+                transferidos = futuro.result()
+            except Exception as e:
+                print(f"[X] {futuros[futuro]}: {e}")
+                transferidos = None
+            if transferidos is None:
+                sucesso = False
+            else:
+                total_bytes += transferidos
+
+    duracao = max(time.time() - inicio, 1e-6)
+    print(f"\n[*] Total transferido: {total_bytes / (1024*1024):.2f} MB em {duracao / 60:.1f} min "
+          f"({total_bytes / (1024*1024) / duracao:.2f} MB/s agregados)")
     
     if sucesso and nova_versao:
         salvar_versao_local(versao_online)
         print("\n[SUCESSO] Todos os arquivos baixados.")
     elif not sucesso:
         print("\n[!] Alguns arquivos falharam.")
+    tel.gravar(versao=versao_online, sucesso=sucesso)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,85 @@
+import json
+from sqlalchemy import text
+
+# Progresso da sincronização do Elastic, no Postgres (como o ledger da importação):
+#  - etl_es_fatias: fatias já enviadas da carga completa em andamento. Se o etl_sync_es.py cair,
+#    a próxima execução continua no mesmo índice novo, só com as fatias que faltam.
+#  - etl_es_marca: último id de etl_alteracoes já refletido no índice publicado. A sincronização
+#    incremental (ETL_ES_INCREMENTAL=1) manda só as alterações depois dele e avança a marca a
+#    cada lote confirmado, então também retoma de onde parou.
+
+TABELA_FATIAS = "etl_es_fatias"
+TABELA_MARCA = "etl_es_marca"
+
+def garantir_progresso(engine):
+    with engine.connect() as conn:
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {TABELA_FATIAS} (
+                indice TEXT NOT NULL,
+                fatia TEXT NOT NULL,
+                origem TEXT NOT NULL,
+                marca BIGINT NOT NULL,
+                documentos BIGINT,
+                concluida BOOLEAN NOT NULL DEFAULT FALSE,
+                atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (indice, fatia)
+            );
+        """))
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {TABELA_MARCA} (
+                alias TEXT PRIMARY KEY,
+                ultimo_id BIGINT NOT NULL,
+                indice TEXT,
+                atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """))
+
+def _texto(fatia):
+    return json.dumps(list(fatia) if isinstance(fatia, tuple) else fatia)
+
+def _fatia(texto):
+    valor = json.loads(texto)
+    return tuple(valor) if isinstance(valor, list) else valor
+
+def registrar_fatias(engine, indice, origem, marca, fatias):
+    with engine.connect() as conn:
+        for fatia in fatias:
+            conn.execute(text(f"""
+                INSERT INTO {TABELA_FATIAS} (indice, fatia, origem, marca) VALUES (:i, :f, :o, :m)
+                ON CONFLICT (indice, fatia) DO NOTHING
+            """), {"i": indice, "f": _texto(fatia), "o": origem, "m": marca})
+
+def carga_pendente(engine):
+    """(indice, origem, marca, fatias pendentes, total de fatias) da última carga completa não terminada, ou None."""
+    with engine.connect() as conn:
+        indice = conn.execute(text(f"""
+            SELECT indice FROM {TABELA_FATIAS}
+            GROUP BY indice HAVING bool_or(NOT concluida) ORDER BY max(atualizado_em) DESC LIMIT 1
+        """)).scalar()
+        if indice is None: return None
+        linhas = conn.execute(text(f"SELECT fatia, origem, marca, concluida FROM {TABELA_FATIAS} WHERE indice = :i"), {"i": indice}).all()
+    pendentes = [_fatia(fatia) for fatia, _, _, concluida in linhas if not concluida]
+    return indice, linhas[0][1], linhas[0][2], pendentes, len(linhas)
+
+def concluir_fatia(engine, indice, fatia, documentos):
+    with engine.connect() as conn:
+        conn.execute(text(f"""
+            UPDATE {TABELA_FATIAS} SET concluida = TRUE, documentos = :d, atualizado_em = CURRENT_TIMESTAMP
+            WHERE indice = :i AND fatia = :f
+        """), {"i": indice, "f": _texto(fatia), "d": documentos})
+
+def descartar_fatias(engine, indice):
+    with engine.connect() as conn:
+        conn.execute(text(f"DELETE FROM {TABELA_FATIAS} WHERE indice = :i"), {"i": indice})
+
+def marca_atual(engine, alias):
+    with engine.connect() as conn:
+        return conn.execute(text(f"SELECT ultimo_id FROM {TABELA_MARCA} WHERE alias = :a"), {"a": alias}).scalar()
+
+def gravar_marca(engine, alias, ultimo_id, indice):
+    with engine.connect() as conn:
+        conn.execute(text(f"""
+            INSERT INTO {TABELA_MARCA} (alias, ultimo_id, indice) VALUES (:a, :u, :i)
+            ON CONFLICT (alias) DO UPDATE SET ultimo_id = EXCLUDED.ultimo_id, indice = EXCLUDED.indice,
+                                              atualizado_em = CURRENT_TIMESTAMP
+        """), {"a": alias, "u": ultimo_id, "i": indice})
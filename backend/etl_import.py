@@ -5,7 +5,20 @@ import io
 import time
 from tqdm import tqdm
 import zipfile
-import gc
+import json
+import requests
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from etl_ledger import (SQL_AVANCAR, SQL_CONCLUIR, garantir_ledger, faixas_registradas, registrar_faixas,
+                        carregar_checkpoint, arquivos_concluidos, linhas_registradas, descartar)
+import etl_telemetria
+import etl_subconjunto
+from etl_memoria import ControleBloco, orcamento_por_processo
+from etl_delta import CHAVES, garantir_tabela_alteracoes, aplicar_delta, registrar_recarga_total
+from etl_cidades import atualizar_cidades
+from etl_leitura import construir_leitura
+from etl_staging import SUFIXO_NOVA, preparar_tabelas_novas, finalizar_tabelas_novas, trocar_tabelas
+from etl_transcoder import (ler_blocos, transcodificar_bloco, reparar_bloco, sql_copy_bytes,
+                            calcular_faixas, contar_registros, abrir_faixa, conversoes_das_colunas, converter_tipos)
 
 # --- CONFIGURAÇÕES ---
 DB_USER = "user_cnpj"
@@ -15,9 +28,46 @@ DB_PORT = "5433"
 DB_NAME = "cnpj_dados"
 DATABASE_URL = f"postgresql+pg8000://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 PASTA_DADOS = "./dados"
+ARQUIVO_METADATA = os.path.join(PASTA_DADOS, "metadata.json")
 
-# Tamanho do lote reduzido para garantir estabilidade em VPS (10k linhas por vez)
-TAMANHO_CHUNK = 10000 
+# Modo streaming: baixa o ZIP e descomprime direto para o COPY, sem ZIP/CSV em disco.
+# ETL_STREAMING_GUARDAR_ZIP=1 mantém uma cópia do ZIP bruto em ./dados (opcional).
+MODO_STREAMING = os.getenv("ETL_STREAMING", "0") == "1"
+STREAMING_GUARDAR_ZIP = os.getenv("ETL_STREAMING_GUARDAR_ZIP", "0") == "1"
+
+# Importação paralela: cada processo tem a sua própria conexão com o Postgres.
+# O limite por tabela evita muitos COPY concorrentes na mesma tabela (locks/WAL).
+PROCESSOS_IMPORTACAO = int(os.getenv("ETL_PROCESSOS", "4"))
+LIMITE_POR_TABELA = {"estabelecimentos": 2, "empresas": 2, "socios": 2}
+LIMITE_PADRAO_TABELA = 1
+
+# CSVs grandes (ex.: Estabelecimentos, vários GB) são divididos em faixas de bytes
+# alinhadas a registros e cada faixa vira uma tarefa do pool, com conexão própria
+# (o limite por tabela acima conta as faixas).
+LIMIAR_DIVISAO_BYTES = int(os.getenv("ETL_DIVIDIR_ACIMA_MB", "1024")) * 1024 * 1024
+PARTES_POR_ARQUIVO = int(os.getenv("ETL_PARTES_POR_ARQUIVO", "4"))
+
+# Troca atômica: importa em <tabela>_next e só troca os nomes no fim (a API segue
+# servindo a versão anterior). ETL_TROCA_ATOMICA=0 volta a gravar direto nas tabelas.
+USAR_TABELAS_NOVAS = os.getenv("ETL_TROCA_ATOMICA", "1") == "1"
+
+# Delta: em vez de trocar empresas/estabelecimentos/sócios inteiras, compara a carga nova
+# com a publicada e aplica só inserções, alterações e remoções (precisa da troca atômica).
+MODO_DELTA = os.getenv("ETL_DELTA", "0") == "1"
+
+# Origem dos dados: "zip" (CSVs da Receita) ou "parquet" (cache gerado pelo etl_parquet.py,
+# já tipado: a importação vira só COPY). Só vale para a importação local, não para o streaming.
+ORIGEM_PARQUET = os.getenv("ETL_ORIGEM", "zip") == "parquet"
+
+# Linha da barra de progresso do processo atual (cada worker usa uma linha)
+POSICAO_BARRA = 0
+
+# Motor de importação: "pandas" (DataFrame por lote) ou "bytes" (etl_transcoder, sem pandas)
+MOTOR_IMPORTACAO = os.getenv("ETL_MOTOR", "pandas")
+
+# Memória do processo atual (cada worker recebe a sua parte do orçamento, ETL_MEMORIA_MB).
+# O tamanho do bloco se ajusta a ela (etl_memoria.ControleBloco) em vez de ser fixo.
+ORCAMENTO_PROCESSO = orcamento_por_processo(1)
 
 # --- DEFINIÇÃO DAS COLUNAS (LAYOUT RECEITA FEDERAL) ---
 
@@ -29,6 +79,17 @@ COLUNAS_SOCIOS = ["cnpj_basico", "identificador_socio", "nome_socio_razao_social
 # 2. Tabelas de Referência (Simples: Código + Descrição)
 COLUNAS_DOMINIO = ["codigo", "descricao"]
 
+# 3. Colunas tipadas no banco (o resto é texto): convertidas uma vez, na importação
+TIPOS_COLUNAS = {
+    "capital_social": "numero",           # NUMERIC
+    "porte_empresa": "codigo",            # SMALLINT
+    "situacao_cadastral": "codigo",       # SMALLINT
+    "data_situacao_cadastral": "data",    # DATE
+    "data_inicio_atividade": "data",
+    "data_situacao_especial": "data",
+    "data_entrada_sociedade": "data",
+}
+
 def get_engine():
     # Timeout de 10 minutos para conexões lentas
     return create_engine(DATABASE_URL, isolation_level="AUTOCOMMIT", connect_args={"timeout": 600})
@@ -44,140 +105,704 @@ def limpar_dados(df):
         df[cols_texto] = df[cols_texto].astype(str).apply(lambda x: x.str.strip().str.replace('\x00', '', regex=False))
     return df
 
-def inserir_via_copy(conn, df, tabela):
-    """
-    Usa o comando COPY do Postgres para inserção ultra-rápida via stream.
-    """
-    output = io.StringIO()
-    # Exporta para CSV em memória (sem header, separado por tabulação)
-    df.to_csv(output, sep='\t', header=False, index=False)
-    output.seek(0)
-    
-    dbapi_conn = conn.connection
-    cursor = dbapi_conn.cursor()
-    
-    columns_str = ",".join(df.columns)
-    sql_copy = f"COPY {tabela} ({columns_str}) FROM STDIN WITH (FORMAT CSV, DELIMITER '\t', NULL '', QUOTE '\"', ESCAPE '\\')"
-    
-    cursor.execute(sql_copy, stream=output)
-    output.close()
-
-def processar_csv(caminho_csv, tabela, colunas):
-    engine = get_engine()
-    tamanho_arquivo = os.path.getsize(caminho_csv)
-    print(f"    -> Processando CSV: {os.path.basename(caminho_csv)} ({tamanho_arquivo/1024/1024:.2f} MB)")
+def converter_bloco_pandas(bloco, colunas, filtro=None):
+    """
+    Caminho pandas: lê um bloco de registros (bytes latin-1) num DataFrame, limpa e
+    exporta em CSV separado por tabulação. Retorna os bytes prontos para o COPY.
+    """
+    tel = etl_telemetria.atual()
+    with tel.fase("parse"):
+        df_chunk = pd.read_csv(io.BytesIO(bloco), sep=';', encoding='latin-1', header=None, names=colunas,
+                               dtype=str, quotechar='"', on_bad_lines='warn')
+    with tel.fase("limpeza"):
+        df_chunk = limpar_dados(df_chunk)
+        if filtro is not None: df_chunk = df_chunk[filtro.mascara(df_chunk)]
+        for i, converter in conversoes_das_colunas(colunas, TIPOS_COLUNAS):
+            df_chunk[colunas[i]] = df_chunk[colunas[i]].map(converter)
+    with tel.fase("serializacao"):
+        output = io.StringIO()
+        # Exporta para CSV em memória (sem header, separado por tabulação)
+        df_chunk.to_csv(output, sep='\t', header=False, index=False)
+        return output.getvalue().encode('utf-8')
 
-    # Tenta configurar sessão para performance (synchronous_commit off)
+def sql_copy_pandas(tabela, colunas):
+    columns_str = ",".join(colunas)
+    return f"COPY {tabela} ({columns_str}) FROM STDIN WITH (FORMAT CSV, DELIMITER '\t', NULL '', QUOTE '\"', ESCAPE '\\')"
+
+def copiar_bloco(conn, sql_copy, dados, checkpoint=None, nova_posicao=None):
+    """
+    COPY de um bloco numa transação própria. Com `checkpoint`, o avanço no ledger entra
+    na mesma transação: ou o bloco inteiro fica gravado (e registrado), ou nada.
+    Retorna o número de linhas inseridas.
+    """
+    cursor = conn.connection.cursor()
+    cursor.execute("BEGIN")
     try:
-        with engine.connect() as conn:
-            conn.execute(text("SET synchronous_commit = off;"))
-            conn.execute(text("SET temp_buffers = '32MB';"))
-    except: pass
-
-    # Leitura em blocos (Chunks)
-    chunks = pd.read_csv(
-        caminho_csv, 
-        sep=';', 
-        encoding='latin-1', 
-        header=None, 
-        names=colunas,
-        dtype=str, 
-        chunksize=TAMANHO_CHUNK, 
-        quotechar='"', 
-        on_bad_lines='warn'
-    )
-
-    linhas_importadas = 0
-    
+        cursor.execute(sql_copy, stream=io.BytesIO(dados))
+        linhas = cursor.rowcount
+        if checkpoint is not None:
+            cursor.execute(SQL_AVANCAR, (nova_posicao, linhas, checkpoint.versao, checkpoint.arquivo, checkpoint.inicio))
+        cursor.execute("COMMIT")
+    except Exception:
+        try: cursor.execute("ROLLBACK")
+        except: pass
+        raise
+    return linhas
+
+def filtro_subconjunto(tabela, colunas):
+    """Filtro do etl_subconjunto para o destino `tabela` (pode ter o sufixo da troca atômica). None = tudo."""
+    sufixo = SUFIXO_NOVA if tabela.endswith(SUFIXO_NOVA) else ""
+    base = tabela[:len(tabela) - len(sufixo)]
+    return etl_subconjunto.filtro_da_tabela(base, colunas, DATABASE_URL, "estabelecimentos" + sufixo)
+
+def pular_bytes(fonte, quantidade):
+    # Para fontes sem seek (stream HTTP): descarta o que já foi importado
+    while quantidade > 0:
+        dados = fonte.read(min(quantidade, 8 * 1024 * 1024))
+        if not dados: break
+        quantidade -= len(dados)
+
+def preparar_csv(caminho_zip, tabela, colunas, versao=None, arquivo=None):
+    """
+    Extrai o CSV do ZIP e divide em faixas [inicio, fim) alinhadas a registros, que o pool importa
+    como tarefas separadas. Com `versao` e `arquivo` a divisão vai para o ledger: numa nova execução
+    o CSV continua do último bloco gravado de cada faixa (com a mesma divisão da primeira vez).
+    Retorna (caminho do CSV, faixas).
+    """
+    with zipfile.ZipFile(caminho_zip, 'r') as z:
+        # Assume que há apenas 1 CSV dentro do ZIP (padrão da Receita)
+        nomes_arquivos = z.namelist()
+        if not nomes_arquivos: raise RuntimeError("ZIP vazio")
+        nome_csv = nomes_arquivos[0]
+        z.extract(nome_csv, PASTA_DADOS)
+    caminho_csv = os.path.join(PASTA_DADOS, nome_csv)
+    tamanho_arquivo = os.path.getsize(caminho_csv)
+    print(f"    -> CSV extraído: {nome_csv} ({tamanho_arquivo/1024/1024:.2f} MB)")
+
+    engine = get_engine()
+    faixas = faixas_registradas(engine, versao, arquivo) if versao else []
+    if faixas:
+        print(f"    -> Retomando a partir do ledger")
+    elif PARTES_POR_ARQUIVO > 1 and tamanho_arquivo > LIMIAR_DIVISAO_BYTES:
+        faixas = calcular_faixas(caminho_csv, PARTES_POR_ARQUIVO, len(colunas))
+    else:
+        faixas = [(0, tamanho_arquivo)]
+    if versao: registrar_faixas(engine, versao, arquivo, tabela, faixas, tamanho_arquivo)
+
+    contiguas = faixas[0][0] == 0 and faixas[-1][1] == tamanho_arquivo and \
+        all(anterior[1] == proxima[0] for anterior, proxima in zip(faixas, faixas[1:]))
+    if not contiguas:
+        raise RuntimeError(f"Faixas não cobrem o arquivo inteiro: {faixas}")
+    if len(faixas) > 1:
+        print(f"    -> Dividido em {len(faixas)} faixas: " + ", ".join(f"{(f - i)/1024/1024:.0f} MB" for i, f in faixas))
+    return caminho_csv, faixas
+
+def _importar_faixa(caminho_csv, inicio, fim, tabela, colunas, conferir, versao=None, arquivo=None, posicao=0):
+    # Executa num processo do pool: importa só os bytes [inicio, fim) do CSV.
+    # Com `conferir`, conta também os registros da faixa para a conferência do arquivo.
+    global POSICAO_BARRA, ORCAMENTO_PROCESSO
+    POSICAO_BARRA = posicao
+    ORCAMENTO_PROCESSO = orcamento_por_processo(PROCESSOS_IMPORTACAO)
+    tel = etl_telemetria.iniciar("importacao")
+    checkpoint = carregar_checkpoint(get_engine(), versao, arquivo, inicio) if versao else None
+    with abrir_faixa(caminho_csv, checkpoint.posicao if checkpoint else inicio, fim) as fonte:
+        linhas = processar_fluxo(fonte, fim - inicio, tabela, colunas, checkpoint)
+    esperadas = contar_registros(caminho_csv, inicio, fim) if conferir else None
+    return linhas, esperadas, tel.exportar()
+
+def conferir_faixas(caminho_csv, faixas, resultados, filtrado):
+    """
+    Fim de um CSV importado em faixas: confere se as linhas inseridas em cada faixa batem com as
+    do CSV. `resultados` tem (linhas, esperadas) por faixa, ou None na faixa que falhou.
+    """
+    for n, resultado in enumerate(resultados):
+        if resultado is None: resultados[n] = (0, contar_registros(caminho_csv, *faixas[n]))
+    # No subconjunto regional as linhas fora do filtro não entram: a diferença é esperada
+    for n, (inseridas, esperadas) in enumerate(resultados):
+        if inseridas != esperadas and not filtrado:
+            print(f"    [!] Faixa {n + 1}: {inseridas:,} de {esperadas:,} linhas inseridas")
+    print(f"    -> Conferência de {os.path.basename(caminho_csv)}: {sum(r[0] for r in resultados):,} linhas inseridas / {sum(r[1] for r in resultados):,} linhas no CSV"
+          + (f" (subconjunto: {etl_subconjunto.descricao()})" if filtrado else ""))
+
+def processar_fluxo(fonte, tamanho_total, tabela, colunas, checkpoint=None):
+    """
+    Importa um CSV da Receita a partir de qualquer arquivo binário (disco ou stream HTTP),
+    em blocos de registros completos, cada um numa transação.
+    `tamanho_total` é usado só na barra de progresso (None se desconhecido).
+    Com `checkpoint`, `fonte` já deve estar na posição gravada no ledger.
+    """
+    if checkpoint is not None and checkpoint.concluido:
+        return checkpoint.linhas
+
+    # Motor "bytes": limpa e converte os bytes latin-1 direto para UTF-8, sem DataFrames
+    motor_bytes = MOTOR_IMPORTACAO == "bytes"
+    if motor_bytes: sql_copy = sql_copy_bytes(tabela, colunas)
+    else: sql_copy = sql_copy_pandas(tabela, colunas)
+    conversoes = conversoes_das_colunas(colunas, TIPOS_COLUNAS)
+    filtro = filtro_subconjunto(tabela, colunas)
+
+    engine = get_engine()
+    posicao = checkpoint.posicao if checkpoint else 0
+    linhas_importadas = checkpoint.linhas if checkpoint else 0
+    linhas_descartadas = 0
+
     with engine.connect() as conn:
         # Garante configuração na conexão ativa
         conn.execute(text("SET synchronous_commit = off;"))
-        
-        with tqdm(total=tamanho_arquivo, unit='B', unit_scale=True, desc="    Importando DB") as barra:
-            for df_chunk in chunks:
-                df_chunk = limpar_dados(df_chunk)
-                
-                # Sistema de Retry (Tenta 3 vezes se o banco cair)
+
+        inicial = posicao - checkpoint.inicio if checkpoint else 0
+        tel = etl_telemetria.atual()
+        controle = ControleBloco(ORCAMENTO_PROCESSO)
+        blocos = ler_blocos(fonte, controle)
+        with tqdm(total=tamanho_total, initial=inicial, unit='B', unit_scale=True, desc="    Importando DB", position=POSICAO_BARRA) as barra:
+            while True:
+                inicio_bloco = time.perf_counter()
+                # Leitura = disco/rede + descompressão (no modo streaming)
+                with tel.fase("leitura"):
+                    bloco = next(blocos, None)
+                if bloco is None: break
+
+                if not motor_bytes: dados = converter_bloco_pandas(bloco, colunas, filtro)
+                else:
+                    with tel.fase("limpeza"):
+                        dados = transcodificar_bloco(bloco)
+                    if conversoes or filtro is not None:
+                        with tel.fase("parse"):
+                            dados = converter_tipos(dados, len(colunas), conversoes, filtro)
+                posicao += len(bloco)
+
+                # Sistema de Retry (Tenta 3 vezes se o banco cair). O bloco é atômico:
+                # uma tentativa que falhou não deixa linhas pela metade no banco.
                 tentativas = 3
-                while tentativas > 0:
+                reparado = False
+                while True:
                     try:
-                        inserir_via_copy(conn, df_chunk, tabela)
-                        
-                        # Atualiza barra de progresso
-                        bytes_chunk = df_chunk.memory_usage(index=True, deep=True).sum()
-                        barra.update(int(bytes_chunk * 0.35)) # 0.35 é um fator de correção estimado csv/dataframe
-                        linhas_importadas += len(df_chunk)
+                        with tel.fase("copy"):
+                            linhas = copiar_bloco(conn, sql_copy, dados, checkpoint, posicao)
+                        linhas_importadas += linhas
+                        tel.contar(bytes=len(bloco), linhas=linhas)
                         break # Sucesso
                     except Exception as e:
+                        # Erro de dados (linha quebrada) no motor bytes: basta reparar o bloco
+                        if motor_bytes and not reparado and ("22P04" in str(e) or "22P02" in str(e)):
+                            reparado = True
+                            dados, descartadas = reparar_bloco(dados, len(colunas))
+                            linhas_descartadas += descartadas
+                            print(f"    [!] Bloco com linhas inválidas ({descartadas} descartadas). Reenviando...")
+                            continue
+                        tentativas -= 1
+                        if tentativas == 0:
+                            # Não pula o bloco: o ledger fica no último bloco gravado para retomar depois
+                            raise RuntimeError(f"Falha crítica no lote (byte {posicao - len(bloco)}): {e}")
                         print(f"    [!] Erro de conexão ({e}). Tentando reconectar em 5s...")
                         time.sleep(5)
-                        tentativas -= 1
                         # Tenta recriar conexão se falhou muito
                         try:
                             if tentativas == 1: conn = engine.connect()
                         except: pass
-                        
-                        if tentativas == 0:
-                            print(f"    [X] Falha crítica no lote. Pulando.")
 
-                # Limpeza de Memória Explícita (Crítico para VPS)
-                del df_chunk
-                gc.collect()
+                barra.update(len(bloco))
+                # Mede RSS e vazão do bloco e escolhe o tamanho do próximo
+                del dados
+                controle.registrar(len(bloco), time.perf_counter() - inicio_bloco)
+
+        if checkpoint is not None:
+            conn.connection.cursor().execute(SQL_CONCLUIR, (checkpoint.versao, checkpoint.arquivo, checkpoint.inicio))
 
+    tel.maximo("pico_rss_mb", round(controle.pico_rss / 1024 / 1024))
+    tel.maximo("bloco_final_mb", round(controle.tamanho / 1024 / 1024))
+    if controle.reducoes:
+        print(f"    [!] Bloco reduzido {controle.reducoes}x para caber em {ORCAMENTO_PROCESSO/1024/1024:.0f} MB "
+              f"(pico RSS {controle.pico_rss/1024/1024:.0f} MB, bloco final {controle.tamanho/1024/1024:.0f} MB)")
+    if linhas_descartadas:
+        print(f"    [!] {linhas_descartadas} linhas descartadas por formato inválido.")
     return linhas_importadas
 
-def processar_zip(caminho_zip, tabela, colunas):
-    print(f"\n{'='*60}\n[*] ARQUIVO: {os.path.basename(caminho_zip)}\n    -> Tabela Destino: {tabela}\n{'='*60}")
+def processar_remoto(url_base, arquivo, tabela, colunas, versao=None):
+    """
+    Modo streaming: o corpo HTTP é descomprimido em memória e vai direto para o COPY.
+    Em disco fica, no máximo, a cópia do ZIP bruto (ETL_STREAMING_GUARDAR_ZIP=1).
+    """
+    from etl_download import HEADERS, atualizar_manifesto
+    from etl_stream import abrir_csv_remoto
+
+    print(f"\n{'='*60}\n[*] ARQUIVO (stream): {arquivo}\n    -> Tabela Destino: {tabela}\n{'='*60}")
+    caminho_copia = os.path.join(PASTA_DADOS, arquivo)
+    copia = None
     try:
-        with zipfile.ZipFile(caminho_zip, 'r') as z:
-            # Assume que há apenas 1 CSV dentro do ZIP (padrão da Receita)
-            nomes_arquivos = z.namelist()
-            if not nomes_arquivos: return
-            
-            nome_csv = nomes_arquivos[0]
-            # Extrai
-            z.extract(nome_csv, PASTA_DADOS)
-            caminho_csv = os.path.join(PASTA_DADOS, nome_csv)
-            
-            # Processa
-            processar_csv(caminho_csv, tabela, colunas)
-            
-            # Limpa disco imediatamente
-            os.remove(caminho_csv)
-            gc.collect()
-            
+        checkpoint = None
+        if versao:
+            engine = get_engine()
+            registrar_faixas(engine, versao, arquivo, tabela, [(0, None)], None)
+            checkpoint = carregar_checkpoint(engine, versao, arquivo)
+            if checkpoint.concluido: return checkpoint.linhas
+
+        response = requests.get(f"{url_base}{arquivo}", headers=HEADERS, stream=True, verify=False, timeout=60)
+        response.raise_for_status()
+        if STREAMING_GUARDAR_ZIP: copia = open(caminho_copia + ".part", 'wb')
+
+        fonte, bruto = abrir_csv_remoto(response, copia=copia)
+        print(f"    -> CSV remoto: {bruto.nome}")
+        if checkpoint is not None and checkpoint.posicao:
+            # O stream não tem seek: descomprime e descarta o que já está no banco
+            print(f"    -> Retomando do byte {checkpoint.posicao:,} (ledger)")
+            pular_bytes(fonte, checkpoint.posicao)
+        linhas = processar_fluxo(fonte, bruto.tamanho_descomprimido, tabela, colunas, checkpoint)
+        print(f"    -> {bruto.bytes_comprimidos/1024/1024:.2f} MB baixados, {bruto.bytes_descomprimidos/1024/1024:.2f} MB descomprimidos")
+
+        if copia is not None:
+            sha256 = bruto.drenar_copia()
+            copia.close()
+            os.replace(caminho_copia + ".part", caminho_copia)
+            atualizar_manifesto(arquivo, {
+                "etag": response.headers.get('etag'),
+                "last_modified": response.headers.get('last-modified'),
+                "tamanho": os.path.getsize(caminho_copia),
+                "sha256": sha256,
+                "integro": True,
+            })
+        return linhas
     except Exception as e:
-        print(f"    [X] Falha ao processar ZIP {caminho_zip}: {e}")
+        print(f"    [X] Falha ao processar {arquivo} em streaming: {e}")
+    finally:
+        if copia is not None and not copia.closed:
+            copia.close()
+            os.remove(caminho_copia + ".part")
+
+def processar_parquet(tabela_cache, arquivo, tabela, colunas, versao=None):
+    """
+    Importa um ZIP já convertido pelo etl_parquet.py: os tipos já estão certos, então cada lote
+    do Parquet vira CSV UTF-8 e vai direto para o COPY. No ledger a posição é em linhas
+    (não em bytes); por isso o arquivo entra como <nome>.parquet, separado do ZIP.
+    """
+    import etl_parquet
+
+    print(f"\n{'='*60}\n[*] ARQUIVO (parquet): {arquivo}\n    -> Tabela Destino: {tabela}\n{'='*60}")
+    nome_base = arquivo[:-len(".parquet")]
+    engine = get_engine()
+    checkpoint = None
+    if versao:
+        registrar_faixas(engine, versao, arquivo, tabela, [(0, None)], None)
+        checkpoint = carregar_checkpoint(engine, versao, arquivo)
+        if checkpoint.concluido: return checkpoint.linhas
+
+    sql_copy = sql_copy_bytes(tabela, colunas)
+    filtro = filtro_subconjunto(tabela, colunas)
+    # Só UFs no filtro: as partições das outras UFs nem são lidas
+    particoes = etl_subconjunto.UFS if filtro is not None and tabela_cache == "estabelecimentos" and not etl_subconjunto.MUNICIPIOS else None
+    posicao = checkpoint.posicao if checkpoint else 0
+    linhas_importadas = checkpoint.linhas if checkpoint else 0
+    total = etl_parquet.linhas_convertidas(tabela_cache, nome_base, versao)
+    tel = etl_telemetria.atual()
+
+    with engine.connect() as conn:
+        conn.execute(text("SET synchronous_commit = off;"))
+        lotes = etl_parquet.ler_lotes(tabela_cache, nome_base, colunas, versao, pular=posicao, particoes=particoes)
+        with tqdm(total=total, initial=posicao, unit=' linhas', unit_scale=True, desc="    Importando DB", position=POSICAO_BARRA) as barra:
+            while True:
+                with tel.fase("leitura"):
+                    proximo = next(lotes, None)
+                if proximo is None: break
+                fim, lote = proximo
+                if filtro is not None: lote = lote.filter(filtro.mascara_arrow(lote))
+                with tel.fase("serializacao"):
+                    dados = etl_parquet.lote_para_csv(lote)
+                anterior, posicao = posicao, fim
+
+                tentativas = 3
+                while True:
+                    try:
+                        with tel.fase("copy"):
+                            linhas = copiar_bloco(conn, sql_copy, dados, checkpoint, posicao)
+                        linhas_importadas += linhas
+                        tel.contar(bytes=len(dados), linhas=linhas)
+                        break
+                    except Exception as e:
+                        tentativas -= 1
+                        if tentativas == 0:
+                            raise RuntimeError(f"Falha crítica no lote (linha {anterior}): {e}")
+                        print(f"    [!] Erro de conexão ({e}). Tentando reconectar em 5s...")
+                        time.sleep(5)
+                        try:
+                            if tentativas == 1: conn = engine.connect()
+                        except: pass
+                barra.update(posicao - anterior)
+
+        if checkpoint is not None:
+            conn.connection.cursor().execute(SQL_CONCLUIR, (checkpoint.versao, checkpoint.arquivo, checkpoint.inicio))
+    return linhas_importadas
+
+def tarefas_do_parquet():
+    """Tarefas (arquivo, tabela no cache, tabela, colunas) para cada ZIP convertido da versão local."""
+    import etl_parquet
+    if not etl_parquet.disponivel(): return []
+    tarefas = []
+    for tabela_cache in etl_parquet.tabelas_disponiveis():
+        for nome_base in etl_parquet.arquivos_convertidos(tabela_cache):
+            arquivo = nome_base + ".parquet"
+            tabela, colunas = tabela_do_arquivo(arquivo)
+            if tabela: tarefas.append((arquivo, tabela_cache, tabela, colunas))
+    return tarefas
+
+def tabela_do_arquivo(arquivo):
+    """Mapeia o nome do ZIP da Receita para (tabela, colunas). Retorna (None, None) se desconhecido."""
+    # Tabelas Principais
+    if "Empresas" in arquivo: return "empresas", COLUNAS_EMPRESAS
+    if "Estabelecimentos" in arquivo: return "estabelecimentos", COLUNAS_ESTABELECIMENTOS
+    if "Socios" in arquivo: return "socios", COLUNAS_SOCIOS
+
+    # Tabelas de Domínio (Referência)
+    if "Cnaes" in arquivo: return "cnaes", COLUNAS_DOMINIO
+    if "Naturezas" in arquivo: return "naturezas", COLUNAS_DOMINIO
+    if "Municipios" in arquivo: return "municipios", COLUNAS_DOMINIO
+    if "Qualificacoes" in arquivo: return "qualificacoes", COLUNAS_DOMINIO # ESSENCIAL PARA O EXPORTAR
+    if "Paises" in arquivo: return "paises", COLUNAS_DOMINIO
+    if "Motivos" in arquivo: return "motivos", COLUNAS_DOMINIO
+    return None, None
+
+def main_streaming():
+    from etl_download import encontrar_ultima_versao_online, gerar_lista_arquivos
+
+    if not os.path.exists(PASTA_DADOS):
+        os.makedirs(PASTA_DADOS)
+
+    versao, url_base = encontrar_ultima_versao_online()
+    arquivos = [a for a in gerar_lista_arquivos() if tabela_do_arquivo(a)[0]]
+    print(f"--- Iniciando Importação em Streaming da versão {versao} ({len(arquivos)} arquivos) ---")
+
+    tarefas = [(arquivo, url_base) + tabela_do_arquivo(arquivo) for arquivo in arquivos]
+    tel = etl_telemetria.iniciar("importacao")
+    inicio = time.time()
+    resumo = importar_e_publicar(tarefas, versao)
+    imprimir_resumo(resumo, time.time() - inicio)
+    tel.gravar(versao=versao, modo="streaming", motor=MOTOR_IMPORTACAO, processos=PROCESSOS_IMPORTACAO)
+
+    print("\n[FIM] Processamento concluído com sucesso!")
+
+def carregar_manifesto():
+    # Manifesto gravado pelo etl_download.py (ETag, tamanho, hash e CRC de cada ZIP)
+    try:
+        with open(ARQUIVO_METADATA, 'r') as f:
+            return json.load(f).get("arquivos", {})
+    except:
+        return {}
+
+def _importar_arquivo(arquivo, origem, tabela, colunas, versao=None, posicao=0):
+    # Executa dentro de um processo do pool (engine/conexão própria): arquivo inteiro numa tarefa
+    # (streaming: `origem` é a URL da pasta da versão; Parquet: a tabela no cache).
+    # `versao` identifica o arquivo no ledger (None = sem checkpoint).
+    global POSICAO_BARRA, ORCAMENTO_PROCESSO
+    POSICAO_BARRA = posicao
+    ORCAMENTO_PROCESSO = orcamento_por_processo(PROCESSOS_IMPORTACAO)
+    tel = etl_telemetria.iniciar("importacao")
+    inicio = time.time()
+    destino = tabela + SUFIXO_NOVA if USAR_TABELAS_NOVAS else tabela
+    if MODO_STREAMING: linhas = processar_remoto(origem, arquivo, destino, colunas, versao)
+    else: linhas = processar_parquet(origem, arquivo, destino, colunas, versao)
+    segundos = time.time() - inicio
+    tel.registrar_item(arquivo, tabela=tabela, linhas=linhas, bytes=tel.bytes, segundos=round(segundos, 2),
+                       pico_rss_mb=tel.maximos.get("pico_rss_mb"))
+    return linhas, segundos, tel.exportar()
+
+def _preparar_arquivo(arquivo, caminho_zip, tabela, colunas, versao=None, posicao=0):
+    # Executa num processo do pool: extrai o ZIP local e divide o CSV em faixas (sem COPY nem barra)
+    print(f"\n{'='*60}\n[*] ARQUIVO: {arquivo}\n    -> Tabela Destino: {tabela}\n{'='*60}")
+    destino = tabela + SUFIXO_NOVA if USAR_TABELAS_NOVAS else tabela
+    return preparar_csv(caminho_zip, destino, colunas, versao, arquivo)
+
+class _ArquivoEmFaixas:
+    """Estado, no processo principal, de um ZIP local extraído cujas faixas estão no pool."""
+
+    def __init__(self, tarefa):
+        self.arquivo, self.origem, self.tabela, self.colunas = tarefa
+        self.inicio = time.time()
+        self.caminho_csv = None
+        self.faixas = []
+        self.resultados = []
+        self.restantes = 0
+        self.falhas = 0
+        self.bytes = 0
+        self.pico_rss_mb = None
+
+def importar_em_paralelo(tarefas, versao=None):
+    """
+    Agenda as tarefas (arquivo, origem, tabela, colunas) num pool só de processos.
+    ZIP local: uma tarefa extrai e divide o CSV e cada faixa vira outra tarefa do mesmo pool, então
+    o limite de importações simultâneas por tabela vale para os COPY de verdade (faixas), e não por
+    arquivo: no máximo ETL_PROCESSOS processos e LIMITE_POR_TABELA COPY na mesma tabela.
+    Arquivos abertos (CSV extraído) por tabela ficam no mesmo limite, para não encher o disco.
+    Retorna a lista de (arquivo, tabela, linhas, segundos).
+    """
+    em_faixas = not MODO_STREAMING and not ORIGEM_PARQUET
+    pendentes = list(tarefas)
+    prontas = []          # (arquivo em faixas, n) esperando vaga, na ordem dos arquivos
+    em_execucao = {}
+    copias, abertos = {}, {}
+    posicoes_livres = list(range(PROCESSOS_IMPORTACAO))
+    resumo = []
+    limite = lambda tabela: LIMITE_POR_TABELA.get(tabela, LIMITE_PADRAO_TABELA)
+    destino = lambda tabela: tabela + SUFIXO_NOVA if USAR_TABELAS_NOVAS else tabela
+
+    def fechar(estado):
+        # Todas as faixas voltaram: confere, apaga o CSV e entra no resumo
+        abertos[estado.tabela] -= 1
+        segundos = time.time() - estado.inicio
+        if len(estado.faixas) > 1:
+            filtrado = etl_subconjunto.ativo() and estado.tabela in {"estabelecimentos"} | etl_subconjunto.DEPENDENTES
+            conferir_faixas(estado.caminho_csv, estado.faixas, estado.resultados, filtrado)
+        if estado.falhas:
+            print(f"    [X] {estado.arquivo}: {estado.falhas} faixa(s) falharam; o ledger guarda o progresso para retomar")
+        linhas = None if estado.falhas else sum(r[0] for r in estado.resultados)
+        # Limpa disco imediatamente (a retomada extrai de novo e continua pelo ledger)
+        if os.path.exists(estado.caminho_csv): os.remove(estado.caminho_csv)
+        etl_telemetria.atual().registrar_item(estado.arquivo, tabela=estado.tabela, linhas=linhas, bytes=estado.bytes,
+                                              segundos=round(segundos, 2), pico_rss_mb=estado.pico_rss_mb)
+        resumo.append((estado.arquivo, estado.tabela, linhas, segundos))
+
+    with ProcessPoolExecutor(max_workers=PROCESSOS_IMPORTACAO) as executor:
+        def disparar(chave, tabela, funcao, *args):
+            # Cada processo ocupado tem uma linha de barra de progresso
+            posicao = posicoes_livres.pop(0)
+            em_execucao[executor.submit(funcao, *args, posicao=posicao)] = (chave, tabela, posicao)
+
+        while pendentes or prontas or em_execucao:
+            # Primeiro as faixas dos arquivos já abertos (terminam o arquivo e liberam o disco)
+            for item in list(prontas):
+                if not posicoes_livres: break
+                estado, n = item
+                if copias.get(estado.tabela, 0) >= limite(estado.tabela): continue
+                inicio, fim = estado.faixas[n]
+                disparar(item, estado.tabela, _importar_faixa, estado.caminho_csv, inicio, fim,
+                         destino(estado.tabela), estado.colunas, len(estado.faixas) > 1, versao, estado.arquivo)
+                copias[estado.tabela] = copias.get(estado.tabela, 0) + 1
+                prontas.remove(item)
+            # Depois arquivos novos, mantendo a ordem
+            for tarefa in list(pendentes):
+                if not posicoes_livres: break
+                arquivo, origem, tabela, colunas = tarefa
+                if em_faixas:
+                    if abertos.get(tabela, 0) >= limite(tabela): continue
+                    disparar(_ArquivoEmFaixas(tarefa), tabela, _preparar_arquivo, arquivo, origem, tabela, colunas, versao)
+                    abertos[tabela] = abertos.get(tabela, 0) + 1
+                else:
+                    if copias.get(tabela, 0) >= limite(tabela): continue
+                    disparar(arquivo, tabela, _importar_arquivo, arquivo, origem, tabela, colunas, versao)
+                    copias[tabela] = copias.get(tabela, 0) + 1
+                pendentes.remove(tarefa)
+
+            concluidos, _ = wait(list(em_execucao), return_when=FIRST_COMPLETED)
+            for futuro in concluidos:
+                chave, tabela, posicao = em_execucao.pop(futuro)
+                posicoes_livres.append(posicao)
+                posicoes_livres.sort()
+                if isinstance(chave, _ArquivoEmFaixas):
+                    # Arquivo extraído e dividido: as faixas entram na fila
+                    estado = chave
+                    try:
+                        estado.caminho_csv, estado.faixas = futuro.result()
+                    except Exception as e:
+                        print(f"    [X] Falha ao processar ZIP {estado.arquivo}: {e}")
+                        abertos[tabela] -= 1
+                        resumo.append((estado.arquivo, tabela, None, time.time() - estado.inicio))
+                        continue
+                    estado.resultados = [None] * len(estado.faixas)
+                    estado.restantes = len(estado.faixas)
+                    prontas.extend((estado, n) for n in range(len(estado.faixas)))
+                    continue
+
+                copias[tabela] -= 1
+                if isinstance(chave, tuple):
+                    estado, n = chave
+                    try:
+                        linhas, esperadas, metricas = futuro.result()
+                        etl_telemetria.atual().mesclar(metricas)
+                        estado.resultados[n] = (linhas, esperadas)
+                        estado.bytes += metricas["bytes"]
+                        pico = metricas["maximos"].get("pico_rss_mb")
+                        if pico is not None: estado.pico_rss_mb = max(estado.pico_rss_mb or 0, pico)
+                    except Exception as e:
+                        print(f"    [X] {estado.arquivo}: faixa {n + 1}/{len(estado.faixas)} falhou: {e}")
+                        estado.falhas += 1
+                    estado.restantes -= 1
+                    if not estado.restantes: fechar(estado)
+                    continue
+
+                try:
+                    linhas, segundos, metricas = futuro.result()
+                    etl_telemetria.atual().mesclar(metricas)
+                except Exception as e:
+                    print(f"    [X] {chave}: {e}")
+                    linhas, segundos = None, 0.0
+                resumo.append((chave, tabela, linhas, segundos))
+
+    return resumo
+
+def tabelas_para_retomar(engine, tabelas, versao):
+    """
+    Tabelas <tabela>_next deixadas por uma execução interrompida da mesma versão.
+    Se o Postgres caiu, a tabela UNLOGGED volta vazia e o ledger dela não vale mais.
+    """
+    retomar = []
+    with engine.connect() as conn:
+        for tabela in tabelas:
+            nova = tabela + SUFIXO_NOVA
+            if not conn.execute(text("SELECT to_regclass(:t)"), {"t": nova}).scalar(): continue
+            if not linhas_registradas(engine, versao, nova): continue
+            if conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {nova})")).scalar():
+                retomar.append(tabela)
+    return retomar
+
+def importar_e_publicar(tarefas, versao):
+    """
+    Importa as tarefas com checkpoint no ledger e, com a troca atômica ligada, publica as tabelas novas.
+    Arquivos já concluídos nesta versão são pulados; os interrompidos continuam de onde pararam.
+    Tabela com algum arquivo que falhou não é publicada: a API continua com a versão anterior.
+    """
+    tabelas = sorted({tabela for _, _, tabela, _ in tarefas})
+    engine = get_engine()
+    garantir_ledger(engine)
+
+    if USAR_TABELAS_NOVAS:
+        retomar = tabelas_para_retomar(engine, tabelas, versao)
+        for tabela in retomar:
+            print(f"[*] Retomando {tabela}{SUFIXO_NOVA} (importação anterior interrompida)")
+        recriar = [tabela for tabela in tabelas if tabela not in retomar]
+        for tabela in recriar:
+            descartar(engine, tabela + SUFIXO_NOVA)
+        preparar_tabelas_novas(engine, recriar)
+
+    sufixo = SUFIXO_NOVA if USAR_TABELAS_NOVAS else ""
+    concluidos = arquivos_concluidos(engine, versao, [tabela + sufixo for tabela in tabelas])
+    pendentes = []
+    for tarefa in tarefas:
+        if tarefa[0] in concluidos: print(f"[Ledger] {tarefa[0]} já importado na versão {versao}")
+        else: pendentes.append(tarefa)
+    if etl_subconjunto.ativo():
+        # Subconjunto: estabelecimentos primeiro, porque empresas e sócios são filtrados pelos CNPJs deles
+        print(f"[*] Subconjunto regional: {etl_subconjunto.descricao()}")
+        primeiro = [t for t in pendentes if t[2] == "estabelecimentos"]
+        resumo = importar_em_paralelo(primeiro, versao)
+        falhou = any(linhas is None for _, _, linhas, _ in resumo)
+        depois = []
+        for tarefa in pendentes:
+            if tarefa in primeiro: continue
+            if falhou and tarefa[2] in etl_subconjunto.DEPENDENTES:
+                print(f"    [X] {tarefa[0]}: não importado (estabelecimentos falharam, o filtro depende deles)")
+                resumo.append((tarefa[0], tarefa[2], None, 0.0))
+            else: depois.append(tarefa)
+        resumo += importar_em_paralelo(depois, versao)
+    else:
+        resumo = importar_em_paralelo(pendentes, versao)
+
+    if not USAR_TABELAS_NOVAS:
+        if MODO_DELTA: print("[!] ETL_DELTA ignorado: o delta precisa da troca atômica (ETL_TROCA_ATOMICA=1).")
+        registrar_recargas(engine, tabelas, versao)
+        atualizar_derivadas(engine, tabelas)
+        return resumo
+
+    falhas = {tabela for _, tabela, linhas, _ in resumo if linhas is None}
+    publicar = [tabela for tabela in tabelas if tabela not in falhas]
+    for tabela in sorted(falhas):
+        print(f"[!] {tabela} não será publicada (arquivo com falha). Rode de novo para retomar de onde parou.")
+
+    if MODO_DELTA and publicar:
+        print(f"\n{'='*60}\n[*] Aplicando delta da versão {versao}\n{'='*60}")
+        garantir_tabela_alteracoes(engine)
+        for tabela in [t for t in publicar if t in CHAVES]:
+            with etl_telemetria.atual().fase("delta"):
+                aplicado = aplicar_delta(engine, tabela, tabela + SUFIXO_NOVA, versao)
+            if aplicado: publicar.remove(tabela)
+
+    if publicar:
+        print(f"\n{'='*60}\n[*] Preparando tabelas novas para publicação\n{'='*60}")
+        finalizar_tabelas_novas(engine, publicar)
+        trocar_tabelas(engine, publicar)
+        registrar_recargas(engine, publicar, versao)
+    atualizar_derivadas(engine, [tabela for tabela in tabelas if tabela not in falhas])
+    return resumo
+
+def registrar_recargas(engine, tabelas, versao):
+    """Tabelas regravadas inteiras: o Elastic incremental (etl_alteracoes) precisa saber que tudo mudou."""
+    garantir_tabela_alteracoes(engine)
+    for tabela in [t for t in tabelas if t in CHAVES]:
+        registrar_recarga_total(engine, tabela, versao)
+
+# Tabelas da API calculadas a partir das importadas, e de quais dependem
+DERIVADAS = [
+    ("cidades por UF", atualizar_cidades, {"estabelecimentos", "municipios"}),
+    ("modelo de leitura", construir_leitura, {"estabelecimentos", "empresas", "socios", "naturezas", "municipios", "qualificacoes"}),
+]
+
+def atualizar_derivadas(engine, tabelas):
+    for descricao, atualizar, dependencias in DERIVADAS:
+        if not dependencias & set(tabelas): continue
+        try:
+            atualizar(engine)
+        except Exception as e:
+            print(f"[!] Erro ao atualizar {descricao}: {e}")
+
+def imprimir_resumo(resumo, duracao_total):
+    print(f"\n{'='*60}\n[*] RESUMO DA IMPORTAÇÃO\n{'='*60}")
+    print(f"{'Arquivo':<24}{'Tabela':<18}{'Linhas':>12}{'Tempo':>10}{'Linhas/s':>12}")
+    for arquivo, tabela, linhas, segundos in sorted(resumo, key=lambda r: -r[3]):
+        if linhas is None:
+            print(f"{arquivo:<24}{tabela:<18}{'FALHOU':>12}{segundos:>9.1f}s{'-':>12}")
+        else:
+            print(f"{arquivo:<24}{tabela:<18}{linhas:>12,}{segundos:>9.1f}s{linhas / max(segundos, 1e-6):>12,.0f}")
+    total_linhas = sum(r[2] or 0 for r in resumo)
+    print(f"Total: {total_linhas:,} linhas em {duracao_total / 60:.1f} min ({PROCESSOS_IMPORTACAO} processos)")
 
 def main():
     if not os.path.exists(PASTA_DADOS):
         print(f"[Erro] Pasta {PASTA_DADOS} não encontrada.")
         return
 
+    # Versão baixada pelo etl_download.py: chave dos checkpoints no ledger
+    from etl_download import obter_versao_local
+    versao = obter_versao_local() or "local"
+
+    if ORIGEM_PARQUET:
+        tarefas = tarefas_do_parquet()
+        print(f"--- Iniciando Importação do cache Parquet da versão {versao} ({len(tarefas)} arquivos) ---")
+        if not tarefas:
+            print("[Erro] Cache vazio: rode antes o etl_parquet.py.")
+            return
+        tel = etl_telemetria.iniciar("importacao")
+        inicio = time.time()
+        resumo = importar_e_publicar(tarefas, versao)
+        imprimir_resumo(resumo, time.time() - inicio)
+        tel.gravar(versao=versao, modo="parquet", processos=PROCESSOS_IMPORTACAO)
+        print("\n[FIM] Processamento concluído com sucesso!")
+        return
+
     arquivos = sorted([f for f in os.listdir(PASTA_DADOS) if f.endswith(".zip")])
     print(f"--- Iniciando Importação Completa ({len(arquivos)} arquivos encontrados) ---")
-    print("OBS: Certifique-se de que os arquivos já processados foram removidos ou movidos, senão serão duplicados.")
+
+    manifesto = carregar_manifesto()
+    tarefas = []
 
     for arquivo in arquivos:
         caminho = os.path.join(PASTA_DADOS, arquivo)
+
+        # O download já conferiu o CRC; arquivo marcado como não íntegro não entra no banco
+        if arquivo in manifesto and not manifesto[arquivo].get("integro"):
+            print(f"[!] {arquivo} ignorado: download incompleto ou CRC inválido (rode o etl_download.py)")
+            continue
         
         # Mapeamento Inteligente de Arquivos
-        if "Empresas" in arquivo: processar_zip(caminho, "empresas", COLUNAS_EMPRESAS)
-        elif "Estabelecimentos" in arquivo: processar_zip(caminho, "estabelecimentos", COLUNAS_ESTABELECIMENTOS)
-        elif "Socios" in arquivo: processar_zip(caminho, "socios", COLUNAS_SOCIOS)
-        
-        # Tabelas de Domínio (Referência)
-        elif "Cnaes" in arquivo: processar_zip(caminho, "cnaes", COLUNAS_DOMINIO)
-        elif "Naturezas" in arquivo: processar_zip(caminho, "naturezas", COLUNAS_DOMINIO)
-        elif "Municipios" in arquivo: processar_zip(caminho, "municipios", COLUNAS_DOMINIO)
-        elif "Qualificacoes" in arquivo: processar_zip(caminho, "qualificacoes", COLUNAS_DOMINIO) # ESSENCIAL PARA O EXPORTAR
-        elif "Paises" in arquivo: processar_zip(caminho, "paises", COLUNAS_DOMINIO)
-        elif "Motivos" in arquivo: processar_zip(caminho, "motivos", COLUNAS_DOMINIO)
-        
+        tabela, colunas = tabela_do_arquivo(arquivo)
+        if tabela: tarefas.append((arquivo, caminho, tabela, colunas))
         else:
             print(f"[Ignorado] {arquivo} (Não corresponde a uma tabela conhecida)")
 
+    tel = etl_telemetria.iniciar("importacao")
+    inicio = time.time()
+    resumo = importar_e_publicar(tarefas, versao)
+    imprimir_resumo(resumo, time.time() - inicio)
+    tel.gravar(versao=versao, modo="local", motor=MOTOR_IMPORTACAO, processos=PROCESSOS_IMPORTACAO)
+
     print("\n[FIM] Processamento concluído com sucesso!")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if MODO_STREAMING: main_streaming()
+    else: main()
\ No newline at end of file
@@ -0,0 +1,91 @@
+from sqlalchemy import text
+
+# Ledger da importação: para cada arquivo (e faixa de bytes) de uma versão, guarda até
+# onde o CSV já foi gravado no banco. O COPY de cada bloco e o avanço da posição são
+# feitos na mesma transação, então uma importação interrompida recomeça exatamente
+# do último bloco confirmado, sem duplicar linhas.
+
+TABELA_LEDGER = "etl_importacao_ledger"
+
+class Checkpoint:
+    """Linha do ledger: faixa [inicio, fim) do CSV de `arquivo`, já confirmada até `posicao`."""
+
+    def __init__(self, versao, arquivo, inicio, fim, posicao, linhas, concluido):
+        self.versao = versao
+        self.arquivo = arquivo
+        self.inicio = inicio
+        self.fim = fim
+        self.posicao = posicao
+        self.linhas = linhas
+        self.concluido = concluido
+
+def garantir_ledger(engine):
+    with engine.connect() as conn:
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {TABELA_LEDGER} (
+                versao TEXT NOT NULL,
+                arquivo TEXT NOT NULL,
+                inicio BIGINT NOT NULL,
+                fim BIGINT,
+                tamanho BIGINT,
+                tabela TEXT NOT NULL,
+                posicao BIGINT NOT NULL,
+                linhas BIGINT NOT NULL DEFAULT 0,
+                concluido BOOLEAN NOT NULL DEFAULT FALSE,
+                atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (versao, arquivo, inicio)
+            );
+        """))
+
+def faixas_registradas(engine, versao, arquivo):
+    """Faixas gravadas numa execução anterior (a retomada reaproveita a mesma divisão)."""
+    with engine.connect() as conn:
+        linhas = conn.execute(text(f"SELECT inicio, fim FROM {TABELA_LEDGER} WHERE versao = :v AND arquivo = :a ORDER BY inicio"),
+                              {"v": versao, "a": arquivo}).all()
+    return [(inicio, fim) for inicio, fim in linhas]
+
+def registrar_faixas(engine, versao, arquivo, tabela, faixas, tamanho):
+    with engine.connect() as conn:
+        for inicio, fim in faixas:
+            conn.execute(text(f"""
+                INSERT INTO {TABELA_LEDGER} (versao, arquivo, inicio, fim, tamanho, tabela, posicao)
+                VALUES (:v, :a, :i, :f, :t, :tab, :i)
+                ON CONFLICT (versao, arquivo, inicio) DO NOTHING
+            """), {"v": versao, "a": arquivo, "i": inicio, "f": fim, "t": tamanho, "tab": tabela})
+
+def carregar_checkpoint(engine, versao, arquivo, inicio=0):
+    with engine.connect() as conn:
+        linha = conn.execute(text(f"SELECT fim, posicao, linhas, concluido FROM {TABELA_LEDGER} WHERE versao = :v AND arquivo = :a AND inicio = :i"),
+                             {"v": versao, "a": arquivo, "i": inicio}).first()
+    if linha is None: return None
+    return Checkpoint(versao, arquivo, inicio, linha[0], linha[1], linha[2], linha[3])
+
+def arquivos_concluidos(engine, versao, tabelas):
+    """Arquivos da versão, gravados em uma de `tabelas`, com todas as faixas concluídas e cobrindo o CSV inteiro."""
+    with engine.connect() as conn:
+        linhas = conn.execute(text(f"""
+            SELECT arquivo FROM {TABELA_LEDGER} WHERE versao = :v AND tabela = ANY(:t)
+            GROUP BY arquivo
+            HAVING bool_and(concluido) AND (max(tamanho) IS NULL OR sum(fim - inicio) = max(tamanho))
+        """), {"v": versao, "t": list(tabelas)}).all()
+    return {linha[0] for linha in linhas}
+
+def linhas_registradas(engine, versao, tabela):
+    with engine.connect() as conn:
+        return conn.execute(text(f"SELECT coalesce(sum(linhas), 0) FROM {TABELA_LEDGER} WHERE versao = :v AND tabela = :t"),
+                            {"v": versao, "t": tabela}).scalar()
+
+def descartar(engine, tabela, versao=None):
+    """Apaga o progresso gravado para `tabela` (de uma versão ou de todas)."""
+    with engine.connect() as conn:
+        if versao is None:
+            conn.execute(text(f"DELETE FROM {TABELA_LEDGER} WHERE tabela = :t"), {"t": tabela})
+        else:
+            conn.execute(text(f"DELETE FROM {TABELA_LEDGER} WHERE versao = :v AND tabela = :t"), {"v": versao, "t": tabela})
+
+# SQL executado no cursor pg8000 (paramstyle "format"), dentro da transação do bloco
+SQL_AVANCAR = (f"UPDATE {TABELA_LEDGER} SET posicao = %s, linhas = linhas + %s, atualizado_em = CURRENT_TIMESTAMP "
+               f"WHERE versao = %s AND arquivo = %s AND inicio = %s")
+
+SQL_CONCLUIR = (f"UPDATE {TABELA_LEDGER} SET concluido = TRUE, atualizado_em = CURRENT_TIMESTAMP "
+                f"WHERE versao = %s AND arquivo = %s AND inicio = %s")
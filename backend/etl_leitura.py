@@ -0,0 +1,147 @@
+import time
+from sqlalchemy import text
+
+import etl_telemetria
+from etl_optimize_db import construir_indices, conexoes_indices, configurar_manutencao, particoes_da_tabela, executar_em_paralelo
+from etl_staging import SUFIXO_NOVA, trocar_tabelas
+from etl_delta import ultimo_id_alteracoes
+
+# Modelo de leitura da API: uma linha por estabelecimento com os dados da empresa, as descrições
+# (natureza jurídica, município) e os sócios já agregados. O /empresa/{cnpj} vira uma busca pela
+# chave e o /exportar uma leitura sem JOIN nem subconsulta por linha.
+#
+# Reconstruído inteiro no fim de cada importação (em <tabela>_next, publicado pela troca atômica
+# do etl_staging). Não é particionada: a busca por CNPJ é uma sondagem só na chave primária, e os
+# filtros da exportação usam os índices do etl_optimize_db (UF + município + situação etc.).
+# Sócios ficam repetidos em cada estabelecimento da empresa: ocupa mais disco, mas é o que
+# permite servir tudo com uma linha só.
+#
+#   python etl_leitura.py   (reconstrói à mão)
+
+TABELA_LEITURA = "leitura_estabelecimentos"
+
+# Colunas além das de estabelecimentos
+COLUNAS_EXTRAS = """
+    razao_social TEXT,
+    natureza_juridica VARCHAR(4),
+    capital_social NUMERIC(18,2),
+    porte_empresa SMALLINT,
+    natureza_juridica_texto TEXT,
+    municipio_texto TEXT,
+    socios JSONB,
+    socios_texto TEXT
+"""
+
+# Sócios agregados por empresa, calculados uma vez antes de preencher o modelo
+TABELA_SOCIOS_AGREGADOS = "etl_leitura_socios"
+
+# Último id de etl_alteracoes já refletido no modelo publicado. O etl_sync_es.py não passa dessa
+# marca: alteração registrada depois dela ainda não está no modelo (ou a reconstrução falhou).
+TABELA_MARCA_LEITURA = "etl_leitura_marca"
+
+def criar_tabela_leitura(conn, sufixo="", unlogged=False):
+    """<tabela><sufixo> com as colunas de estabelecimentos (o cnpj vira coluna comum) mais COLUNAS_EXTRAS."""
+    tipo = "UNLOGGED TABLE" if unlogged else "TABLE"
+    conn.execute(text(f"""
+        CREATE {tipo} IF NOT EXISTS {TABELA_LEITURA}{sufixo} (
+            LIKE estabelecimentos INCLUDING DEFAULTS, {COLUNAS_EXTRAS}
+        );
+    """))
+
+def _expressao_socio(coluna, tipo):
+    # Mesmo formato que a API devolvia (texto da Receita): datas AAAAMMDD, cnpj_basico com 8 dígitos
+    if tipo == "date": return f"to_char(s.{coluna}, 'YYYYMMDD')"
+    if coluna == "cnpj_basico": return f"lpad(s.{coluna}::text, 8, '0')"
+    return f"s.{coluna}"
+
+def agregar_socios(conn):
+    colunas = conn.execute(text(
+        "SELECT column_name, data_type FROM information_schema.columns WHERE table_name = 'socios' ORDER BY ordinal_position")).all()
+    objeto = ", ".join(f"'{coluna}', {_expressao_socio(coluna, tipo)}" for coluna, tipo in colunas)
+    conn.execute(text(f"DROP TABLE IF EXISTS {TABELA_SOCIOS_AGREGADOS};"))
+    conn.execute(text(f"""
+        CREATE UNLOGGED TABLE {TABELA_SOCIOS_AGREGADOS} AS
+        SELECT s.cnpj_basico,
+               jsonb_agg(jsonb_build_object({objeto})) AS socios,
+               string_agg(s.nome_socio_razao_social || ' (' || COALESCE(qual.descricao, '') || ')', '; ') AS socios_texto
+        FROM socios s LEFT JOIN qualificacoes qual ON s.qualificacao_socio = qual.codigo
+        GROUP BY s.cnpj_basico
+    """))
+    conn.execute(text(f"ALTER TABLE {TABELA_SOCIOS_AGREGADOS} ADD PRIMARY KEY (cnpj_basico);"))
+    conn.execute(text(f"ANALYZE {TABELA_SOCIOS_AGREGADOS};"))
+
+def _preencher(conn, origem):
+    tel = etl_telemetria.atual()
+    print(f"--> {TABELA_LEITURA}{SUFIXO_NOVA}: {origem}...")
+    start = time.time()
+    with tel.fase("leitura"):
+        linhas = conn.execute(text(f"""
+            INSERT INTO {TABELA_LEITURA}{SUFIXO_NOVA}
+            SELECT est.*, emp.razao_social, emp.natureza_juridica, emp.capital_social, emp.porte_empresa,
+                   nat.descricao, mun.descricao, s.socios, s.socios_texto
+            FROM {origem} est
+            LEFT JOIN empresas emp ON est.cnpj_basico = emp.cnpj_basico
+            LEFT JOIN naturezas nat ON emp.natureza_juridica = nat.codigo
+            LEFT JOIN municipios mun ON est.municipio = mun.codigo
+            LEFT JOIN {TABELA_SOCIOS_AGREGADOS} s ON s.cnpj_basico = est.cnpj_basico
+        """)).rowcount
+    print(f"    [OK] {origem}: {linhas:,} linhas em {time.time() - start:.2f}s")
+    tel.registrar_item(f"{TABELA_LEITURA}:{origem}", linhas=linhas, segundos=round(time.time() - start, 2))
+
+def gravar_marca_leitura(engine, ultimo_id):
+    with engine.connect() as conn:
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {TABELA_MARCA_LEITURA} (
+                tabela TEXT PRIMARY KEY,
+                ultimo_id BIGINT NOT NULL,
+                atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """))
+        conn.execute(text(f"""
+            INSERT INTO {TABELA_MARCA_LEITURA} (tabela, ultimo_id) VALUES (:t, :u)
+            ON CONFLICT (tabela) DO UPDATE SET ultimo_id = EXCLUDED.ultimo_id, atualizado_em = CURRENT_TIMESTAMP
+        """), {"t": TABELA_LEITURA, "u": ultimo_id})
+
+def alteracoes_refletidas(engine):
+    """Último id de etl_alteracoes refletido no modelo de leitura publicado (None se nunca foi gravado)."""
+    with engine.connect() as conn:
+        if conn.execute(text("SELECT to_regclass(:t)"), {"t": TABELA_MARCA_LEITURA}).scalar() is None: return None
+        return conn.execute(text(f"SELECT ultimo_id FROM {TABELA_MARCA_LEITURA} WHERE tabela = :t"),
+                            {"t": TABELA_LEITURA}).scalar()
+
+def construir_leitura(engine):
+    """Reconstrói o modelo de leitura a partir das tabelas publicadas e troca pela versão atual."""
+    print(f"\n{'='*60}\n[*] Modelo de leitura ({TABELA_LEITURA})\n{'='*60}")
+    start = time.time()
+    # Lida antes das tabelas de origem: tudo até aqui já está publicado e entra no modelo novo
+    marca = ultimo_id_alteracoes(engine)
+    with engine.connect() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {TABELA_LEITURA}{SUFIXO_NOVA};"))
+        criar_tabela_leitura(conn, SUFIXO_NOVA, unlogged=True)
+        configurar_manutencao(conn)
+        print("--> Agregando sócios por empresa...")
+        with etl_telemetria.atual().fase("leitura"):
+            agregar_socios(conn)
+        # Uma tarefa por partição de estabelecimentos, em paralelo
+        origens = particoes_da_tabela(conn, "estabelecimentos") or ["estabelecimentos"]
+
+    executar_em_paralelo(engine, [(origem, lambda c, o=origem: _preencher(c, o)) for origem in origens], conexoes_indices())
+
+    with engine.connect() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {TABELA_SOCIOS_AGREGADOS};"))
+    construir_indices(engine, [TABELA_LEITURA], SUFIXO_NOVA)
+    with engine.connect() as conn:
+        nova = TABELA_LEITURA + SUFIXO_NOVA
+        with etl_telemetria.atual().fase("set_logged"):
+            conn.execute(text(f"ALTER TABLE {nova} SET LOGGED;"))
+        with etl_telemetria.atual().fase("analyze"):
+            conn.execute(text(f"ANALYZE {nova};"))
+    trocar_tabelas(engine, [TABELA_LEITURA])
+    gravar_marca_leitura(engine, marca)
+    print(f"    [OK] Modelo de leitura em {time.time() - start:.2f}s")
+
+if __name__ == "__main__":
+    from etl_setup_db import get_engine
+    tel = etl_telemetria.iniciar("leitura")
+    construir_leitura(get_engine())
+    tel.gravar()
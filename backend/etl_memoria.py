@@ -0,0 +1,105 @@
+import os
+import gc
+import tracemalloc
+
+from etl_transcoder import TAMANHO_BLOCO
+
+# Orçamento de memória da importação. Em vez de um tamanho de lote fixo (bom numa máquina,
+# OOM em outra), cada processo mede o próprio RSS e a vazão do COPY a cada bloco e ajusta
+# o tamanho do próximo bloco dentro da sua parte do orçamento.
+
+# Total para o ETL inteiro (todos os processos). 0 = automático: FRACAO_RAM_AUTOMATICA da RAM
+# disponível (considera o limite do cgroup quando roda em container).
+ORCAMENTO_MEMORIA_MB = int(os.getenv("ETL_MEMORIA_MB", "0"))
+FRACAO_RAM_AUTOMATICA = 0.5
+ORCAMENTO_MINIMO = 256 * 1024 * 1024
+
+TAMANHO_BLOCO_MIN = 1024 * 1024
+TAMANHO_BLOCO_MAX = int(os.getenv("ETL_BLOCO_MAX_MB", "64")) * 1024 * 1024
+
+# Acima dessa fração do orçamento o bloco cai pela metade
+FRACAO_LIMITE = 0.9
+# Queda de vazão (em relação ao bloco anterior) que inverte o sentido do ajuste
+TOLERANCIA_VAZAO = 0.95
+
+def memoria_total():
+    """RAM que o processo pode usar, em bytes (RAM física ou limite do cgroup, o menor). None se desconhecida."""
+    try:
+        total = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return None
+    for caminho in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(caminho) as f:
+                limite = f.read().strip()
+            if limite.isdigit(): total = min(total, int(limite))
+        except OSError:
+            pass
+    return total
+
+def memoria_residente():
+    """RSS do processo atual em bytes. Sem /proc (Windows/macOS) usa a memória rastreada pelo tracemalloc."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        if not tracemalloc.is_tracing(): tracemalloc.start()
+        return tracemalloc.get_traced_memory()[0]
+
+def orcamento_por_processo(processos):
+    """Parte do orçamento de cada um dos `processos` que importam ao mesmo tempo."""
+    if ORCAMENTO_MEMORIA_MB:
+        total = ORCAMENTO_MEMORIA_MB * 1024 * 1024
+    else:
+        total = (memoria_total() or 4 * 1024 * 1024 * 1024) * FRACAO_RAM_AUTOMATICA
+    return max(int(total // max(processos, 1)), ORCAMENTO_MINIMO)
+
+class ControleBloco:
+    """
+    Tamanho do próximo bloco lido do CSV. Chamável: `ler_blocos(fonte, controle)` pergunta
+    o tamanho antes de cada leitura, e `registrar()` recebe o resultado de cada bloco.
+
+    Sobe (x2) ou desce (/2) o bloco seguindo a vazão: se a vazão caiu, inverte o sentido.
+    Só cresce se a estimativa de RSS com o bloco maior couber no orçamento; se o RSS
+    passar de FRACAO_LIMITE do orçamento, corta o bloco pela metade na hora.
+    """
+
+    def __init__(self, orcamento, inicial=TAMANHO_BLOCO):
+        self.orcamento = orcamento
+        self.tamanho = max(TAMANHO_BLOCO_MIN, min(inicial, TAMANHO_BLOCO_MAX))
+        self.fator = 2
+        self.ultima_vazao = 0.0
+        self.rss_base = memoria_residente()
+        self.pico_rss = self.rss_base
+        self.reducoes = 0
+
+    def __call__(self):
+        return self.tamanho
+
+    def registrar(self, bytes_bloco, segundos):
+        rss = memoria_residente()
+        self.pico_rss = max(self.pico_rss, rss)
+        limite = FRACAO_LIMITE * self.orcamento
+
+        if rss > limite:
+            # Estourou: bloco menor e devolve ao alocador o lixo dos blocos anteriores
+            self.tamanho = max(TAMANHO_BLOCO_MIN, self.tamanho // 2)
+            self.fator = 2
+            self.ultima_vazao = 0.0
+            self.reducoes += 1
+            gc.collect()
+            return
+
+        # Bloco curto (fim do arquivo/faixa) não diz nada sobre a vazão do tamanho atual
+        if bytes_bloco < self.tamanho // 2: return
+
+        vazao = bytes_bloco / max(segundos, 1e-6)
+        if vazao < self.ultima_vazao * TOLERANCIA_VAZAO:
+            self.fator = 0.5 if self.fator > 1 else 2
+        self.ultima_vazao = vazao
+
+        novo = int(self.tamanho * self.fator)
+        # Memória do bloco cresce ~proporcional ao tamanho: estima o RSS com o bloco novo
+        if self.fator > 1 and self.rss_base + (rss - self.rss_base) * self.fator > limite:
+            return
+        self.tamanho = max(TAMANHO_BLOCO_MIN, min(novo, TAMANHO_BLOCO_MAX))
@@ -1,6 +1,13 @@
+import os
+import sys
+import json
 import time
+from concurrent.futures import ThreadPoolExecutor
 from sqlalchemy import create_engine, text
 
+import etl_telemetria
+from etl_memoria import memoria_total
+
 # --- CONFIGURAÇÕES ---
 DB_USER = "user_cnpj"
 DB_PASS = "password_cnpj"
@@ -9,55 +16,360 @@ DB_PORT = "5433"
 DB_NAME = "cnpj_dados"
 DATABASE_URL = f"postgresql+pg8000://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
+# Chaves primárias: CNPJ nas tabelas principais (cnpj BIGINT de 14 dígitos nos estabelecimentos,
+# cnpj_basico INTEGER nas empresas) e código nas de referência. Em tabela particionada a chave
+# fica em cada partição (a do pai teria que incluir a UF).
+# Nome: <tabela>_pkey (ou <partição>_pkey), com o sufixo da tabela nova no fim.
+CHAVES_PRIMARIAS = {
+    "empresas": "cnpj_basico",
+    "estabelecimentos": "cnpj",
+    "leitura_estabelecimentos": "cnpj",
+    "qualificacoes": "codigo",
+    "cnaes": "codigo",
+    "naturezas": "codigo",
+    "municipios": "codigo",
+    "paises": "codigo",
+    "motivos": "codigo",
+}
+
+# Índices por tabela: (descrição, nome, colunas), tirados dos filtros que a API usa
+# (ver PLANOS_API). O etl_staging.py cria os mesmos índices nas tabelas novas antes da troca.
+# CNPJ e códigos já são cobertos pelas chaves primárias. Os filtros da exportação ficam no
+# modelo de leitura (etl_leitura.py), que é o que a API lê; as tabelas da importação só
+# precisam das chaves (joins do modelo de leitura e do delta) e do índice de sócios.
+INDICES = {
+    "socios": [
+        ("Índice: Sócios", "idx_socios_basico", "cnpj_basico"),
+    ],
+    "leitura_estabelecimentos": [
+        ("Índice: UF + Município + Situação", "idx_leitura_uf_municipio_situacao", "uf, municipio, situacao_cadastral"),
+        ("Índice: Data Início", "idx_leitura_data_inicio", "data_inicio_atividade"),
+        ("Índice: Capital Social", "idx_leitura_capital", "capital_social"),
+        ("Índice: Nome Fantasia (trigramas)", "idx_leitura_fantasia_trgm", "nome_fantasia gin_trgm_ops"),
+        ("Índice: Razão Social (trigramas)", "idx_leitura_razao_trgm", "razao_social gin_trgm_ops"),
+    ],
+}
+
+# Índices que não são B-Tree. GIN com pg_trgm atende o ILIKE '%texto%' da busca por nome.
+METODOS_INDICE = {
+    "idx_leitura_fantasia_trgm": "gin",
+    "idx_leitura_razao_trgm": "gin",
+}
+
+# Consultas com o formato das da API (src/main.py), conferidas com EXPLAIN no fim da otimização:
+# (descrição, SQL, parâmetros de exemplo). Seq Scan em tabela grande aqui é índice faltando.
+PLANOS_API = [
+    ("Detalhes por CNPJ", "SELECT * FROM leitura_estabelecimentos WHERE cnpj = :c", {"c": 191000101}),
+    ("Exportar: UF + município + situação",
+     "SELECT cnpj FROM leitura_estabelecimentos WHERE uf = :uf AND municipio = :m AND situacao_cadastral = :s",
+     {"uf": "SP", "m": "7107", "s": 2}),
+    ("Exportar: data de início",
+     "SELECT cnpj FROM leitura_estabelecimentos WHERE data_inicio_atividade >= CAST(:di AS DATE)", {"di": "2024-01-01"}),
+    ("Exportar: nome fantasia ou razão social",
+     "SELECT cnpj FROM leitura_estabelecimentos WHERE nome_fantasia ILIKE :q OR razao_social ILIKE :q",
+     {"q": "%padaria%"}),
+]
+# Tabelas com menos linhas que isso podem ser lidas inteiras sem problema
+LINHAS_SEQ_SCAN_ACEITAVEL = 100000
+
+_trgm = None
+
+# Construção em paralelo: cada conexão cria uma chave ou índice por vez (uma partição por tarefa,
+# as maiores primeiro), e dentro de cada CREATE INDEX o Postgres ainda usa workers paralelos.
+# 0 = automático, pelo tamanho da máquina (o Postgres roda no mesmo host, via Docker).
+CONEXOES_INDICES = int(os.getenv("ETL_CONEXOES_INDICES", "0"))
+WORKERS_MANUTENCAO = int(os.getenv("ETL_WORKERS_MANUTENCAO", "0"))
+# maintenance_work_mem de cada conexão (MB). Automático: FRACAO_RAM_MANUTENCAO da RAM dividida entre as conexões
+MEMORIA_MANUTENCAO_MB = int(os.getenv("ETL_MEMORIA_MANUTENCAO_MB", "0"))
+FRACAO_RAM_MANUTENCAO = 0.25
+MEMORIA_MANUTENCAO_MIN_MB = 64
+MEMORIA_MANUTENCAO_MAX_MB = 2048
+
 def get_engine():
     # Timeout de 10 min para criação de indices pesados
     return create_engine(DATABASE_URL, isolation_level="AUTOCOMMIT", connect_args={"timeout": 600})
 
-def otimizar_banco():
-    engine = get_engine()
-    print(f"[*] Otimizando banco (Perfil: VPS 8GB RAM)")
-    
-    comandos = [
-        # Reduzido para 256MB para não matar o Elastic/System
-        ("Ajustando work_mem temporário (256MB)", 
-         "SET maintenance_work_mem = '256MB';"),
-
-        # Índices Essenciais (B-Tree apenas)
-        ("Índice: Empresas (CNPJ Básico)", 
-         "CREATE INDEX IF NOT EXISTS idx_empresa_basico ON empresas (cnpj_basico);"),
-
-        ("Índice: Estabelecimentos (CNPJ Completo)", 
-         "CREATE INDEX IF NOT EXISTS idx_cnpj_completo ON estabelecimentos (cnpj_basico, cnpj_ordem, cnpj_dv);"),
-
-        ("Índice: UF", 
-         "CREATE INDEX IF NOT EXISTS idx_uf ON estabelecimentos (uf);"),
-         
-        ("Índice: Data Início", 
-         "CREATE INDEX IF NOT EXISTS idx_data_inicio ON estabelecimentos (data_inicio_atividade);"),
-
-        ("Índice: Sócios", 
-         "CREATE INDEX IF NOT EXISTS idx_socios_basico ON socios (cnpj_basico);")
-    ]
+def conexoes_indices():
+    return CONEXOES_INDICES or max(1, min(4, (os.cpu_count() or 2) // 2))
 
-    with engine.connect() as conn:
-        start_global = time.time()
-        
-        for descricao, sql in comandos:
-            print(f"--> {descricao}...")
-            start = time.time()
+def parametros_manutencao(conexoes=1):
+    """(maintenance_work_mem em MB, max_parallel_maintenance_workers) de cada uma das `conexoes`."""
+    memoria = MEMORIA_MANUTENCAO_MB
+    if not memoria:
+        total = memoria_total() or 8 * 1024 * 1024 * 1024
+        memoria = int(total * FRACAO_RAM_MANUTENCAO / conexoes) // (1024 * 1024)
+    memoria = max(MEMORIA_MANUTENCAO_MIN_MB, min(memoria, MEMORIA_MANUTENCAO_MAX_MB))
+    # Os workers dividem a memória do líder; o total de núcleos é dividido entre as conexões
+    workers = WORKERS_MANUTENCAO or max(0, min(4, (os.cpu_count() or 2) // conexoes - 1))
+    return memoria, workers
+
+def configurar_manutencao(conn, conexoes=1):
+    memoria, workers = parametros_manutencao(conexoes)
+    conn.execute(text(f"SET maintenance_work_mem = '{memoria}MB';"))
+    conn.execute(text(f"SET max_parallel_maintenance_workers = {workers};"))
+
+def particoes_da_tabela(conn, relacao):
+    """Partições de `relacao` (lista vazia se não for particionada)."""
+    return [linha[0] for linha in conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(:t) ORDER BY 1"),
+        {"t": relacao})]
+
+def base_da_particao(particao, sufixo):
+    """'estabelecimentos_ma_next' -> 'estabelecimentos_ma' (sem o sufixo da tabela nova)."""
+    return particao[:len(particao) - len(sufixo)] if sufixo else particao
+
+def remover_duplicadas(conn, relacao, colunas):
+    """Apaga linhas com chave nula ou repetida (fica a última carregada). Retorna quantas saíram."""
+    nulas = " OR ".join(f"{c.strip()} IS NULL" for c in colunas.split(","))
+    removidas = conn.execute(text(f"DELETE FROM {relacao} WHERE {nulas}")).rowcount
+    removidas += conn.execute(text(f"""
+        DELETE FROM {relacao} WHERE ctid IN (
+            SELECT ctid FROM (SELECT ctid, row_number() OVER (PARTITION BY {colunas} ORDER BY ctid DESC) AS n FROM {relacao}) d
+            WHERE n > 1)
+    """)).rowcount
+    return removidas
+
+def _criar_chave(conn, tabela, relacao, sufixo):
+    colunas = CHAVES_PRIMARIAS[tabela]
+    tel = etl_telemetria.atual()
+    nome = f"{base_da_particao(relacao, sufixo)}_pkey{sufixo}"
+    atual = conn.execute(text("SELECT pg_get_constraintdef(oid) FROM pg_constraint WHERE conname = :n"), {"n": nome}).scalar()
+    if atual == f"PRIMARY KEY ({colunas})": return
+    if atual:
+        print(f"--> Chave primária antiga em {relacao}: {atual}, removendo...")
+        conn.execute(text(f"ALTER TABLE {relacao} DROP CONSTRAINT {nome};"))
+    print(f"--> Chave primária: {relacao} ({colunas})...")
+    start = time.time()
+    sql = f"ALTER TABLE {relacao} ADD CONSTRAINT {nome} PRIMARY KEY ({colunas});"
+    try:
+        with tel.fase("indices"):
             try:
                 conn.execute(text(sql))
-                print(f"    [OK] {time.time() - start:.2f}s")
-            except Exception as e:
-                print(f"    [!] {e}")
-        
-        print("--> Executando VACUUM ANALYZE (pode demorar)...")
+            except Exception:
+                # Chave repetida/nula na carga (ex.: registro duplicado no arquivo da Receita)
+                removidas = remover_duplicadas(conn, relacao, colunas)
+                if not removidas: raise
+                print(f"    [!] {relacao}: {removidas:,} linhas com chave repetida ou nula removidas")
+                conn.execute(text(sql))
+        print(f"    [OK] {nome}: {time.time() - start:.2f}s")
+        tel.registrar_item(nome, tabela=relacao, segundos=round(time.time() - start, 2))
+    except Exception as e:
+        print(f"    [!] {nome}: {e}")
+
+def _tarefas_chaves(conn, tabela, sufixo):
+    if tabela not in CHAVES_PRIMARIAS: return []
+    return [(relacao, lambda c, r=relacao: _criar_chave(c, tabela, r, sufixo))
+            for relacao in particoes_da_tabela(conn, tabela + sufixo) or [tabela + sufixo]]
+
+def criar_chave_primaria(conn, tabela, sufixo=""):
+    """
+    Cria a chave primária de `tabela + sufixo` (em cada partição, se for particionada).
+    Se a carga trouxe chave duplicada ou nula, remove essas linhas e tenta de novo.
+    Chave já existente em outras colunas (esquema antigo) é recriada nas colunas atuais.
+    """
+    for _, tarefa in _tarefas_chaves(conn, tabela, sufixo):
+        tarefa(conn)
+
+def garantir_trgm(conn):
+    """Extensão pg_trgm (índices de trigramas). False se o servidor não tiver ou o usuário não puder criá-la."""
+    global _trgm
+    if _trgm is None:
         try:
-            conn.execute(text("VACUUM ANALYZE;"))
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm;"))
+            _trgm = True
         except Exception as e:
-            print(f"    [!] Erro no Vacuum: {e}")
+            print(f"    [!] pg_trgm indisponível, índices de trigramas ignorados: {getattr(e, 'orig', e)}")
+            _trgm = False
+    return _trgm
+
+def _criar_indice(conn, relacao, nome, metodo, colunas, pai=None):
+    tel = etl_telemetria.atual()
+    print(f"--> Índice {nome} ({relacao})...")
+    start = time.time()
+    try:
+        with tel.fase("indices"):
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {nome} ON {relacao} USING {metodo} ({colunas});"))
+            if pai: conn.execute(text(f"ALTER INDEX {pai} ATTACH PARTITION {nome};"))
+        print(f"    [OK] {nome}: {time.time() - start:.2f}s")
+        tel.registrar_item(nome, tabela=relacao, segundos=round(time.time() - start, 2))
+    except Exception as e:
+        print(f"    [!] {nome}: {e}")
+
+def _tarefas_indices(conn, tabela, sufixo):
+    """
+    Índices de `tabela` em `tabela + sufixo` (ex.: estabelecimentos_next), com o mesmo sufixo
+    no nome de cada índice. Em tabela particionada o índice do pai é criado aqui (ON ONLY, vazio)
+    e cada partição vira uma tarefa: <índice>_<uf><sufixo>, anexado ao do pai.
+    """
+    particoes = particoes_da_tabela(conn, tabela + sufixo)
+    tarefas = []
+    for descricao, nome, colunas in INDICES.get(tabela, []):
+        if "gin_trgm_ops" in colunas and not garantir_trgm(conn): continue
+        metodo = METODOS_INDICE.get(nome, "btree")
+        if not particoes:
+            tarefas.append((tabela + sufixo, lambda c, n=nome, m=metodo, col=colunas:
+                            _criar_indice(c, tabela + sufixo, n + sufixo, m, col)))
+            continue
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {nome}{sufixo} ON ONLY {tabela}{sufixo} USING {metodo} ({colunas});"))
+        for particao in particoes:
+            parte = base_da_particao(particao, sufixo)[len(tabela) + 1:]
+            tarefas.append((particao, lambda c, p=particao, n=f"{nome}_{parte}{sufixo}", m=metodo, col=colunas, pai=nome + sufixo:
+                            _criar_indice(c, p, n, m, col, pai)))
+    return tarefas
+
+def executar_em_paralelo(engine, tarefas, conexoes):
+    """Roda as tarefas (relação, função(conn)) em `conexoes` conexões, das relações maiores para as menores."""
+    with engine.connect() as conn:
+        tamanhos = dict(conn.execute(text("SELECT relname, pg_total_relation_size(oid) FROM pg_class WHERE relkind = 'r'")).all())
+    tarefas = sorted(tarefas, key=lambda t: -tamanhos.get(t[0], 0))
 
-        print(f"\n[SUCESSO] Otimização finalizada em {time.time() - start_global:.2f}s!")
+    def rodar(tarefa):
+        with engine.connect() as conn:
+            configurar_manutencao(conn, conexoes)
+            tarefa[1](conn)
+
+    with ThreadPoolExecutor(max_workers=conexoes) as executor:
+        list(executor.map(rodar, tarefas))
+
+def construir_indices(engine, tabelas, sufixo=""):
+    """
+    Chaves primárias e índices de `tabelas` (+ sufixo) em paralelo. Primeiro todas as chaves,
+    depois os índices: ADD PRIMARY KEY bloqueia a tabela, CREATE INDEX não bloqueia outro CREATE INDEX.
+    """
+    conexoes = conexoes_indices()
+    memoria, workers = parametros_manutencao(conexoes)
+    print(f"--> {conexoes} conexões, maintenance_work_mem {memoria}MB e até {workers} workers paralelos por índice")
+    start = time.time()
+    with engine.connect() as conn:
+        chaves = [t for tabela in tabelas for t in _tarefas_chaves(conn, tabela, sufixo)]
+    executar_em_paralelo(engine, chaves, conexoes)
+    with engine.connect() as conn:
+        indices = [t for tabela in tabelas for t in _tarefas_indices(conn, tabela, sufixo)]
+    executar_em_paralelo(engine, indices, conexoes)
+    print(f"    [OK] Chaves e índices em {time.time() - start:.2f}s")
+    etl_telemetria.atual().registrar_item("construir_indices", tabelas=list(tabelas), conexoes=conexoes,
+                                          maintenance_work_mem_mb=memoria, workers=workers,
+                                          segundos=round(time.time() - start, 2))
+
+def relacoes_alteradas(conn, tabelas):
+    """
+    {relação: (linhas novas/mortas desde o último VACUUM, linhas alteradas desde o último ANALYZE)}
+    das `tabelas` e partições com escrita pendente, pelas estatísticas do Postgres.
+    """
+    relacoes = {r for tabela in tabelas for r in particoes_da_tabela(conn, tabela) or [tabela]}
+    return {relname: (escritas, modificadas) for relname, escritas, modificadas in conn.execute(text(
+        "SELECT relname, n_ins_since_vacuum + n_dead_tup, n_mod_since_analyze FROM pg_stat_user_tables"))
+        if relname in relacoes and (escritas or modificadas)}
+
+def _manter_relacao(conn, relacao, escritas, modificadas):
+    # Só ANALYZE quando não há linha nova nem morta (nada para o VACUUM fazer)
+    comando = "VACUUM ANALYZE" if escritas else "ANALYZE"
+    tel = etl_telemetria.atual()
+    print(f"--> {comando} {relacao} ({escritas:,} linhas novas/mortas, {modificadas:,} alteradas)...")
+    start = time.time()
+    with tel.fase("vacuum" if escritas else "analyze"):
+        conn.execute(text(f"{comando} {relacao};"))
+    print(f"    [OK] {relacao}: {time.time() - start:.2f}s")
+    tel.registrar_item(relacao, comando=comando, segundos=round(time.time() - start, 2))
+
+def manter_tabelas(engine, tabelas):
+    """
+    VACUUM/ANALYZE só do que a última importação escreveu (em vez do VACUUM do banco inteiro),
+    em paralelo como os índices. Tabela particionada: só as partições alteradas, e ANALYZE do pai.
+    """
+    with engine.connect() as conn:
+        alteradas = relacoes_alteradas(conn, tabelas)
+        pais = [tabela for tabela in tabelas if set(particoes_da_tabela(conn, tabela)) & set(alteradas)]
+    if not alteradas:
+        print("--> Nenhuma tabela alterada desde a última manutenção")
+        return
+    executar_em_paralelo(engine, [(relacao, lambda c, r=relacao, e=e, m=m: _manter_relacao(c, r, e, m))
+                                   for relacao, (e, m) in alteradas.items()], conexoes_indices())
+    # Estatísticas do pai particionado (o autovacuum não faz ANALYZE nele)
+    with engine.connect() as conn:
+        for pai in pais:
+            print(f"--> ANALYZE {pai}...")
+            start = time.time()
+            with etl_telemetria.atual().fase("analyze"):
+                conn.execute(text(f"ANALYZE {pai};"))
+            print(f"    [OK] {pai}: {time.time() - start:.2f}s")
+
+def _nos_do_plano(no):
+    yield no
+    for filho in no.get("Plans", []):
+        yield from _nos_do_plano(filho)
+
+def verificar_planos(conn):
+    """
+    EXPLAIN das consultas de PLANOS_API: mostra os índices usados e avisa de Seq Scan em tabela
+    grande. Retorna quantas consultas ficaram com Seq Scan.
+    """
+    tel = etl_telemetria.atual()
+    linhas = dict(conn.execute(text("SELECT relname, reltuples::bigint FROM pg_class WHERE relkind IN ('r', 'p')")).all())
+    problemas = 0
+    print("--> Conferindo planos das consultas da API (EXPLAIN)...")
+    for descricao, sql, parametros in PLANOS_API:
+        plano = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"), parametros).scalar()
+        if isinstance(plano, str): plano = json.loads(plano)
+        nos = list(_nos_do_plano(plano[0]["Plan"]))
+        indices = sorted({no["Index Name"] for no in nos if "Index Name" in no})
+        sequenciais = sorted({no["Relation Name"] for no in nos if no["Node Type"] == "Seq Scan"
+                              and linhas.get(no["Relation Name"], 0) >= LINHAS_SEQ_SCAN_ACEITAVEL})
+        if sequenciais:
+            problemas += 1
+            print(f"    [!] {descricao}: Seq Scan em {', '.join(sequenciais)}")
+        else:
+            print(f"    [OK] {descricao}: {', '.join(indices) or 'tabelas pequenas'}")
+        tel.registrar_item(descricao, indices=indices, seq_scan=sequenciais)
+    return problemas
+
+def otimizar_banco():
+    engine = get_engine()
+    tel = etl_telemetria.iniciar("otimizacao")
+    tabelas = list(dict.fromkeys([*CHAVES_PRIMARIAS, *INDICES]))
+    print(f"[*] Otimizando banco ({(memoria_total() or 0) / 1024 ** 3:.0f}GB RAM, {os.cpu_count()} núcleos)")
+    start_global = time.time()
+
+    construir_indices(engine, tabelas)
+
+    print("--> Manutenção das tabelas alteradas...")
+    try:
+        manter_tabelas(engine, tabelas)
+    except Exception as e:
+        print(f"    [!] Erro no Vacuum: {e}")
+
+    # Depois do ANALYZE: o planejador já tem as estatísticas novas
+    with engine.connect() as conn:
+        verificar_planos(conn)
+
+    print(f"\n[SUCESSO] Otimização finalizada em {time.time() - start_global:.2f}s!")
+    tel.gravar()
+
+def manter_ufs(ufs):
+    """Manutenção só das partições de algumas UFs (ex.: depois de recarregar um estado)."""
+    engine = get_engine()
+    tel = etl_telemetria.iniciar("otimizacao")
+    with engine.connect() as conn:
+        configurar_manutencao(conn)
+        for uf in ufs:
+            particao = f"estabelecimentos_{uf.lower()}"
+            if not conn.execute(text("SELECT to_regclass(:t)"), {"t": particao}).scalar():
+                print(f"[!] Partição {particao} não existe (estabelecimentos ainda não é particionada?)")
+                continue
+            print(f"--> {particao}: REINDEX + VACUUM ANALYZE...")
+            start = time.time()
+            with tel.fase("reindex"):
+                conn.execute(text(f"REINDEX TABLE {particao};"))
+            with tel.fase("vacuum"):
+                conn.execute(text(f"VACUUM ANALYZE {particao};"))
+            print(f"    [OK] {time.time() - start:.2f}s")
+            tel.registrar_item(particao, segundos=round(time.time() - start, 2))
+    tel.gravar(ufs=ufs)
 
 if __name__ == "__main__":
-    otimizar_banco()
\ No newline at end of file
+    # python etl_optimize_db.py MA PI -> só as partições dessas UFs
+    # python etl_optimize_db.py explain -> só confere os planos das consultas da API
+    if sys.argv[1:] == ["explain"]:
+        with get_engine().connect() as conn: verificar_planos(conn)
+    elif len(sys.argv) > 1: manter_ufs([uf.upper() for uf in sys.argv[1:]])
+    else: otimizar_banco()
@@ -0,0 +1,306 @@
+import os
+import time
+import json
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import etl_telemetria
+from etl_transcoder import ler_blocos, transcodificar_bloco, reparar_bloco, conversoes_das_colunas, converter_tipos
+
+# Cache colunar de cada versão: cada ZIP da Receita é convertido uma vez (latin-1 -> tipos
+# do banco) para Parquet comprimido, em dados/parquet/<versao>/<tabela>/. Estabelecimentos
+# ficam particionados por UF (uf=SP/...). Importação (ETL_ORIGEM=parquet), etl_sync_es e
+# análises leem daqui só as colunas/UFs que precisam, sem reprocessar os CSVs.
+#
+# Análise ad-hoc:
+#   import etl_parquet, pyarrow.dataset as ds
+#   tabela = etl_parquet.abrir_tabela("estabelecimentos").to_table(
+#       columns=["cnpj_basico", "municipio"], filter=ds.field("uf") == "SC")
+#
+# Opcional: precisa do pyarrow (pip install pyarrow).
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+    import pyarrow.dataset as ds
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+
+PASTA_DADOS = "./dados"
+PASTA_PARQUET = os.path.join(PASTA_DADOS, "parquet")
+
+COMPRESSAO = os.getenv("ETL_PARQUET_COMPRESSAO", "zstd")
+PROCESSOS_CONVERSAO = int(os.getenv("ETL_PROCESSOS", "4"))
+
+# Blocos maiores que os da importação: aqui não há transação nem COPY esperando
+TAMANHO_BLOCO_PARQUET = 32 * 1024 * 1024
+# Linhas acumuladas por partição antes de gravar um row group
+LINHAS_POR_GRUPO = 500000
+# Linhas por lote na leitura (importação / Elastic)
+LINHAS_POR_LOTE = 100000
+
+PARTICOES = {"estabelecimentos": "uf"}
+PARTICAO_NULA = "__HIVE_DEFAULT_PARTITION__"
+
+TIPOS_ARROW = {"data": "date32", "numero": "decimal", "codigo": "int16"}
+
+def disponivel():
+    if pa is None:
+        print("[!] pyarrow não instalado: o cache Parquet precisa dele (pip install pyarrow).")
+        return False
+    return True
+
+def pasta_versao(versao=None):
+    if versao is None:
+        from etl_download import obter_versao_local
+        versao = obter_versao_local() or "local"
+    return os.path.join(PASTA_PARQUET, versao)
+
+def _nome_base(arquivo):
+    return os.path.basename(arquivo).rsplit(".", 1)[0]
+
+def esquema(colunas, tipos):
+    """Schema Arrow das colunas: mesmos tipos do banco (DATE, NUMERIC(18,2), SMALLINT); o resto é texto."""
+    campos = []
+    for coluna in colunas:
+        tipo = TIPOS_ARROW.get(tipos.get(coluna))
+        if tipo == "date32": campos.append(pa.field(coluna, pa.date32()))
+        elif tipo == "decimal": campos.append(pa.field(coluna, pa.decimal128(18, 2)))
+        elif tipo == "int16": campos.append(pa.field(coluna, pa.int16()))
+        else: campos.append(pa.field(coluna, pa.string()))
+    return pa.schema(campos)
+
+def _ler_bloco(dados, schema):
+    # Campo vazio = NULL (como o FORCE_NULL do COPY); "NA", "NULL" etc. continuam texto
+    return pa_csv.read_csv(
+        pa.py_buffer(dados),
+        read_options=pa_csv.ReadOptions(column_names=schema.names, block_size=len(dados) + 1),
+        parse_options=pa_csv.ParseOptions(delimiter=';', quote_char='"', newlines_in_values=True),
+        convert_options=pa_csv.ConvertOptions(column_types=schema, null_values=[""],
+                                              strings_can_be_null=True, quoted_strings_can_be_null=True),
+    )
+
+class _Gravador:
+    """Um ParquetWriter por partição, gravando em arquivos ocultos até o fim da conversão."""
+
+    def __init__(self, pasta_tabela, nome_base, schema, particao):
+        self.pasta_tabela = pasta_tabela
+        self.nome_base = nome_base
+        self.particao = particao
+        self.schema = schema.remove(schema.get_field_index(particao)) if particao else schema
+        self.escritores = {}
+        self.pendentes = {}
+        self.linhas = 0
+
+    def _caminhos(self, valor):
+        pasta = os.path.join(self.pasta_tabela, f"{self.particao}={valor}") if self.particao else self.pasta_tabela
+        return os.path.join(pasta, f".{self.nome_base}.parquet"), os.path.join(pasta, f"{self.nome_base}.parquet")
+
+    def adicionar(self, tabela):
+        self.linhas += tabela.num_rows
+        if not self.particao:
+            self._acumular(None, tabela)
+            return
+        coluna = tabela[self.particao]
+        restante = tabela.drop_columns([self.particao])
+        for valor in pc.unique(coluna).to_pylist():
+            mascara = pc.is_null(coluna) if valor is None else pc.equal(coluna, valor)
+            self._acumular(PARTICAO_NULA if valor is None else valor, restante.filter(mascara))
+
+    def _acumular(self, valor, tabela):
+        partes = self.pendentes.setdefault(valor, [])
+        partes.append(tabela)
+        if sum(p.num_rows for p in partes) >= LINHAS_POR_GRUPO:
+            self._gravar(valor)
+
+    def _gravar(self, valor):
+        partes = self.pendentes.pop(valor, [])
+        if not partes: return
+        if valor not in self.escritores:
+            temporario, _ = self._caminhos(valor)
+            os.makedirs(os.path.dirname(temporario), exist_ok=True)
+            self.escritores[valor] = pq.ParquetWriter(temporario, self.schema, compression=COMPRESSAO)
+        self.escritores[valor].write_table(pa.concat_tables(partes), row_group_size=LINHAS_POR_GRUPO)
+
+    def fechar(self):
+        for valor in list(self.pendentes):
+            self._gravar(valor)
+        for valor, escritor in self.escritores.items():
+            escritor.close()
+            temporario, final = self._caminhos(valor)
+            os.replace(temporario, final)
+        return sorted(self.escritores, key=str)
+
+def _apagar_conversao(pasta_tabela, nome_base):
+    """Remove arquivos (finais ou parciais) de uma conversão anterior do mesmo ZIP."""
+    for raiz, _, arquivos in os.walk(pasta_tabela):
+        for nome in arquivos:
+            if nome in (f"{nome_base}.parquet", f".{nome_base}.parquet"):
+                os.remove(os.path.join(raiz, nome))
+
+def _marcador(pasta_tabela, nome_base):
+    # Prefixo "_": o pyarrow.dataset ignora o arquivo na leitura
+    return os.path.join(pasta_tabela, f"_{nome_base}.json")
+
+def convertido(pasta, arquivo, caminho_zip):
+    """True se o ZIP já foi convertido para esta versão (mesmo tamanho do ZIP)."""
+    from etl_import import tabela_do_arquivo
+    tabela, _ = tabela_do_arquivo(arquivo)
+    try:
+        with open(_marcador(os.path.join(pasta, tabela), _nome_base(arquivo))) as f:
+            return json.load(f).get("tamanho_zip") == os.path.getsize(caminho_zip)
+    except (OSError, ValueError):
+        return False
+
+def converter_zip(caminho_zip, pasta):
+    """Converte o CSV de um ZIP da Receita para Parquet tipado. Retorna (linhas, métricas da telemetria)."""
+    from etl_import import tabela_do_arquivo, TIPOS_COLUNAS
+
+    tel = etl_telemetria.iniciar("parquet")
+    arquivo = os.path.basename(caminho_zip)
+    tabela, colunas = tabela_do_arquivo(arquivo)
+    nome_base = _nome_base(arquivo)
+    pasta_tabela = os.path.join(pasta, tabela)
+    schema = esquema(colunas, TIPOS_COLUNAS)
+    conversoes = conversoes_das_colunas(colunas, TIPOS_COLUNAS)
+
+    _apagar_conversao(pasta_tabela, nome_base)
+    gravador = _Gravador(pasta_tabela, nome_base, schema, PARTICOES.get(tabela))
+    descartadas = 0
+    inicio = time.time()
+    with zipfile.ZipFile(caminho_zip) as z, z.open(z.namelist()[0]) as fonte:
+        blocos = ler_blocos(fonte, TAMANHO_BLOCO_PARQUET)
+        while True:
+            with tel.fase("leitura"):
+                bloco = next(blocos, None)
+            if bloco is None: break
+            with tel.fase("limpeza"):
+                dados = transcodificar_bloco(bloco)
+            with tel.fase("parse"):
+                if conversoes: dados = converter_tipos(dados, len(colunas), conversoes)
+                try:
+                    lote = _ler_bloco(dados, schema)
+                except pa.ArrowInvalid:
+                    # Linha com número errado de campos: mesmo reparo da importação
+                    dados, n = reparar_bloco(dados, len(colunas))
+                    descartadas += n
+                    lote = _ler_bloco(dados, schema)
+            with tel.fase("gravacao"):
+                gravador.adicionar(lote)
+            tel.contar(bytes=len(bloco), linhas=lote.num_rows)
+    with tel.fase("gravacao"):
+        particoes = gravador.fechar()
+
+    with open(_marcador(pasta_tabela, nome_base), "w") as f:
+        json.dump({"arquivo": arquivo, "tabela": tabela, "linhas": gravador.linhas, "descartadas": descartadas,
+                   "particoes": len(particoes), "tamanho_zip": os.path.getsize(caminho_zip)}, f)
+    segundos = time.time() - inicio
+    tel.registrar_item(arquivo, tabela=tabela, linhas=gravador.linhas, bytes=tel.bytes, segundos=round(segundos, 2))
+    if descartadas: print(f"    [!] {arquivo}: {descartadas} linhas descartadas por formato inválido.")
+    return gravador.linhas, tel.exportar()
+
+# --- Leitura do cache ---
+
+def tabelas_disponiveis(versao=None):
+    pasta = pasta_versao(versao)
+    if not os.path.isdir(pasta): return []
+    return sorted(nome for nome in os.listdir(pasta) if os.path.isdir(os.path.join(pasta, nome)))
+
+def abrir_tabela(tabela, versao=None):
+    """pyarrow.dataset da tabela no cache (com a coluna de partição, ex.: uf)."""
+    pasta = os.path.join(pasta_versao(versao), tabela)
+    particao = PARTICOES.get(tabela)
+    particionamento = ds.partitioning(pa.schema([(particao, pa.string())]), flavor="hive") if particao else None
+    return ds.dataset(pasta, format="parquet", partitioning=particionamento)
+
+def arquivos_convertidos(tabela, versao=None):
+    """Nomes base dos ZIPs convertidos da tabela (um por ZIP, ex.: 'Estabelecimentos0')."""
+    pasta = os.path.join(pasta_versao(versao), tabela)
+    if not os.path.isdir(pasta): return []
+    return sorted(nome[1:-5] for nome in os.listdir(pasta) if nome.startswith("_") and nome.endswith(".json"))
+
+def linhas_convertidas(tabela, nome_base, versao=None):
+    with open(_marcador(os.path.join(pasta_versao(versao), tabela), nome_base)) as f:
+        return json.load(f)["linhas"]
+
+def ler_lotes(tabela, nome_base, colunas, versao=None, pular=0, particoes=None):
+    """
+    Gera (posição, RecordBatch) de um ZIP convertido, na ordem estável (partição, row group), com as
+    colunas em `colunas`. A posição é a linha logo após o lote, contando todos os arquivos do ZIP.
+    `pular` descarta as primeiras linhas (retomada pelo ledger, que conta linhas nesta origem).
+    `particoes` limita aos valores de partição dados (ex.: UFs); as outras contam na posição, sem ler.
+    """
+    pasta_tabela = os.path.join(pasta_versao(versao), tabela)
+    particao = PARTICOES.get(tabela)
+    caminhos = []
+    for raiz, _, arquivos in os.walk(pasta_tabela):
+        if f"{nome_base}.parquet" in arquivos:
+            caminhos.append(os.path.join(raiz, f"{nome_base}.parquet"))
+
+    posicao = 0
+    for caminho in sorted(caminhos):
+        arquivo = pq.ParquetFile(caminho)
+        valor = None
+        if particao:
+            valor = os.path.basename(os.path.dirname(caminho)).split("=", 1)[1]
+            if valor == PARTICAO_NULA: valor = None
+        if posicao + arquivo.metadata.num_rows <= pular or (particoes is not None and valor not in particoes):
+            posicao += arquivo.metadata.num_rows
+            continue
+        for lote in arquivo.iter_batches(batch_size=LINHAS_POR_LOTE, columns=[c for c in colunas if c != particao]):
+            posicao += lote.num_rows
+            if posicao <= pular: continue
+            if posicao - lote.num_rows < pular:
+                lote = lote.slice(pular - (posicao - lote.num_rows))
+            if particao:
+                lote = lote.append_column(particao, pa.array([valor] * lote.num_rows, pa.string()))
+            yield posicao, lote.select(colunas)
+
+def lote_para_csv(lote):
+    """RecordBatch -> bytes CSV (';', aspas, NULL = campo vazio) no formato do COPY do motor bytes."""
+    saida = pa.BufferOutputStream()
+    pa_csv.write_csv(lote, saida, write_options=pa_csv.WriteOptions(include_header=False, delimiter=';'))
+    return saida.getvalue().to_pybytes()
+
+def main():
+    if not disponivel(): return
+    if not os.path.exists(PASTA_DADOS):
+        print(f"[Erro] Pasta {PASTA_DADOS} não encontrada.")
+        return
+
+    from etl_import import tabela_do_arquivo, carregar_manifesto
+    pasta = pasta_versao()
+    manifesto = carregar_manifesto()
+    arquivos = sorted(f for f in os.listdir(PASTA_DADOS) if f.endswith(".zip") and tabela_do_arquivo(f)[0])
+    pendentes = []
+    for arquivo in arquivos:
+        caminho = os.path.join(PASTA_DADOS, arquivo)
+        if arquivo in manifesto and not manifesto[arquivo].get("integro"):
+            print(f"[!] {arquivo} ignorado: download incompleto ou CRC inválido (rode o etl_download.py)")
+        elif convertido(pasta, arquivo, caminho):
+            print(f"[Cache] {arquivo} já convertido")
+        else:
+            pendentes.append(caminho)
+
+    print(f"--- Convertendo {len(pendentes)} ZIPs para Parquet em {pasta} ---")
+    tel = etl_telemetria.iniciar("parquet")
+    inicio = time.time()
+    falhas = 0
+    with ProcessPoolExecutor(max_workers=PROCESSOS_CONVERSAO) as executor:
+        futuros = {executor.submit(converter_zip, caminho, pasta): caminho for caminho in pendentes}
+        for futuro in as_completed(futuros):
+            arquivo = os.path.basename(futuros[futuro])
+            try:
+                linhas, metricas = futuro.result()
+                tel.mesclar(metricas)
+                print(f"    [OK] {arquivo}: {linhas:,} linhas")
+            except Exception as e:
+                falhas += 1
+                print(f"    [X] {arquivo}: {e}")
+
+    print(f"\n[FIM] {len(pendentes) - falhas}/{len(pendentes)} ZIPs convertidos em {(time.time() - inicio) / 60:.1f} min")
+    tel.gravar(pasta=pasta, falhas=falhas)
+
+if __name__ == "__main__":
+    main()
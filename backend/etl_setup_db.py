@@ -10,9 +10,100 @@ DB_NAME = "cnpj_dados"
 
 DATABASE_URL = f"postgresql+pg8000://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
+# Tabelas particionadas (LIST) e a coluna da partição. Estabelecimentos: uma partição por UF,
+# EX (exterior) e uma DEFAULT para o que vier fora disso (inclusive UF vazia).
+PARTICIONADAS = {"estabelecimentos": "uf"}
+UFS = ["AC", "AL", "AM", "AP", "BA", "CE", "DF", "ES", "GO", "MA", "MG", "MS", "MT", "PA", "PB", "PE",
+       "PI", "PR", "RJ", "RN", "RO", "RR", "RS", "SC", "SE", "SP", "TO", "EX"]
+PARTICAO_PADRAO = "outras"
+
+# Chave compacta do estabelecimento: o CNPJ de 14 dígitos num BIGINT, calculado pelo banco a
+# partir das três partes que vêm no arquivo da Receita (o COPY continua igual).
+EXPRESSAO_CNPJ = "cnpj_basico::bigint * 1000000 + cnpj_ordem::bigint * 100 + cnpj_dv::bigint"
+
+# Colunas que eram VARCHAR e passaram a ser tipadas: (tabela, coluna, tipo, expressão USING)
+MIGRACOES_TIPOS = [
+    ("empresas", "cnpj_basico", "INTEGER", "etl_inteiro_ou_nulo(cnpj_basico)"),
+    ("estabelecimentos", "cnpj_basico", "INTEGER", "etl_inteiro_ou_nulo(cnpj_basico)"),
+    ("socios", "cnpj_basico", "INTEGER", "etl_inteiro_ou_nulo(cnpj_basico)"),
+    ("empresas", "capital_social", "NUMERIC(18,2)", "etl_numero_ou_nulo(capital_social)"),
+    ("empresas", "porte_empresa", "SMALLINT", "etl_codigo_ou_nulo(porte_empresa)"),
+    ("estabelecimentos", "situacao_cadastral", "SMALLINT", "etl_codigo_ou_nulo(situacao_cadastral)"),
+    ("estabelecimentos", "data_situacao_cadastral", "DATE", "etl_data_ou_nulo(data_situacao_cadastral)"),
+    ("estabelecimentos", "data_inicio_atividade", "DATE", "etl_data_ou_nulo(data_inicio_atividade)"),
+    ("estabelecimentos", "data_situacao_especial", "DATE", "etl_data_ou_nulo(data_situacao_especial)"),
+    ("socios", "data_entrada_sociedade", "DATE", "etl_data_ou_nulo(data_entrada_sociedade)"),
+]
+
+# Mesmas regras do etl_transcoder (valor inválido vira NULL), só para a migração
+FUNCOES_MIGRACAO = [
+    """
+    CREATE OR REPLACE FUNCTION etl_data_ou_nulo(v TEXT) RETURNS DATE AS $$
+    BEGIN
+        IF v IS NULL OR v !~ '^[0-9]{8}$' OR v = '00000000' THEN RETURN NULL; END IF;
+        RETURN to_date(v, 'YYYYMMDD');
+    EXCEPTION WHEN others THEN RETURN NULL;
+    END $$ LANGUAGE plpgsql IMMUTABLE;
+    """,
+    """
+    CREATE OR REPLACE FUNCTION etl_numero_ou_nulo(v TEXT) RETURNS NUMERIC AS $$
+    BEGIN
+        RETURN CAST(NULLIF(REPLACE(REPLACE(TRIM(v), '.', ''), ',', '.'), '') AS NUMERIC(18,2));
+    EXCEPTION WHEN others THEN RETURN NULL;
+    END $$ LANGUAGE plpgsql IMMUTABLE;
+    """,
+    """
+    CREATE OR REPLACE FUNCTION etl_codigo_ou_nulo(v TEXT) RETURNS SMALLINT AS $$
+        SELECT CASE WHEN TRIM(v) ~ '^[0-9]{1,4}$' THEN CAST(TRIM(v) AS SMALLINT) END;
+    $$ LANGUAGE sql IMMUTABLE;
+    """,
+    """
+    CREATE OR REPLACE FUNCTION etl_inteiro_ou_nulo(v TEXT) RETURNS INTEGER AS $$
+        SELECT CASE WHEN TRIM(v) ~ '^[0-9]{1,9}$' THEN CAST(TRIM(v) AS INTEGER) END;
+    $$ LANGUAGE sql IMMUTABLE;
+    """,
+]
+
 def get_engine():
     return create_engine(DATABASE_URL, isolation_level="AUTOCOMMIT")
 
+def criar_particoes(conn, tabela, sufixo="", unlogged=False):
+    """
+    Partições <tabela>_<uf><sufixo> (ex.: estabelecimentos_ma, estabelecimentos_ma_next) de <tabela><sufixo>.
+    `unlogged` para as tabelas novas da importação (viram LOGGED no etl_staging antes da troca).
+    """
+    tipo = "UNLOGGED TABLE" if unlogged else "TABLE"
+    for uf in UFS:
+        conn.execute(text(f"CREATE {tipo} IF NOT EXISTS {tabela}_{uf.lower()}{sufixo} PARTITION OF {tabela}{sufixo} FOR VALUES IN ('{uf}');"))
+    conn.execute(text(f"CREATE {tipo} IF NOT EXISTS {tabela}_{PARTICAO_PADRAO}{sufixo} PARTITION OF {tabela}{sufixo} DEFAULT;"))
+
+def particionada(conn, tabela):
+    return bool(conn.execute(text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:t)"), {"t": tabela}).scalar())
+
+def migrar_tipos(conn):
+    """Converte colunas antigas (texto) para os tipos novos. Reescreve a tabela: só roda uma vez."""
+    pendentes = []
+    for tabela, coluna, tipo, expressao in MIGRACOES_TIPOS:
+        atual = conn.execute(text("SELECT data_type FROM information_schema.columns WHERE table_name = :t AND column_name = :c"),
+                             {"t": tabela, "c": coluna}).scalar()
+        if atual in ("character varying", "character", "text"):
+            pendentes.append((tabela, coluna, tipo, expressao))
+    if not pendentes: return
+
+    for sql in FUNCOES_MIGRACAO:
+        conn.execute(text(sql))
+    # Um ALTER por tabela: todas as colunas mudam numa única reescrita
+    for tabela in dict.fromkeys(p[0] for p in pendentes):
+        alteracoes = [(coluna, tipo, expressao) for t, coluna, tipo, expressao in pendentes if t == tabela]
+        print(f"[*] Migrando {tabela} ({', '.join(c for c, _, _ in alteracoes)}) para tipos novos (pode demorar)...")
+        try:
+            conn.execute(text(f"ALTER TABLE {tabela} " + ", ".join(
+                f"ALTER COLUMN {coluna} TYPE {tipo} USING {expressao}" for coluna, tipo, expressao in alteracoes) + ";"))
+        except Exception as e:
+            print(f"[!] Aviso migração {tabela}: {e}")
+    for funcao in ("etl_data_ou_nulo", "etl_numero_ou_nulo", "etl_codigo_ou_nulo", "etl_inteiro_ou_nulo"):
+        conn.execute(text(f"DROP FUNCTION IF EXISTS {funcao}(TEXT);"))
+
 def criar_tabelas():
     print(f"[*] Conectando ao banco {DB_HOST}:{DB_PORT}...")
     try:
@@ -24,29 +115,30 @@ def criar_tabelas():
             # 1. Tabelas Principais
             conn.execute(text("""
                 CREATE TABLE IF NOT EXISTS empresas (
-                    cnpj_basico VARCHAR(8),
+                    cnpj_basico INTEGER PRIMARY KEY,
                     razao_social TEXT,
                     natureza_juridica VARCHAR(4),
                     qualificacao_responsavel VARCHAR(2),
-                    capital_social VARCHAR(20),
-                    porte_empresa VARCHAR(2),
+                    capital_social NUMERIC(18,2),
+                    porte_empresa SMALLINT,
                     ente_federativo_responsavel TEXT
                 );
             """))
             
-            conn.execute(text("""
+            conn.execute(text(f"""
                 CREATE TABLE IF NOT EXISTS estabelecimentos (
-                    cnpj_basico VARCHAR(8),
+                    cnpj BIGINT GENERATED ALWAYS AS ({EXPRESSAO_CNPJ}) STORED,
+                    cnpj_basico INTEGER,
                     cnpj_ordem VARCHAR(4),
                     cnpj_dv VARCHAR(2),
                     identificador_matriz_filial CHAR(1),
                     nome_fantasia TEXT,
-                    situacao_cadastral CHAR(2),
-                    data_situacao_cadastral VARCHAR(8),
+                    situacao_cadastral SMALLINT,
+                    data_situacao_cadastral DATE,
                     motivo_situacao_cadastral VARCHAR(2),
                     nome_cidade_exterior TEXT,
                     pais VARCHAR(3),
-                    data_inicio_atividade VARCHAR(8),
+                    data_inicio_atividade DATE,
                     cnae_fiscal_principal VARCHAR(7),
                     cnae_fiscal_secundaria TEXT,
                     tipo_de_logradouro TEXT,
@@ -65,18 +157,23 @@ def criar_tabelas():
                     fax VARCHAR(12),
                     correio_eletronico TEXT,
                     situacao_especial TEXT,
-                    data_situacao_especial VARCHAR(8)
-                );
+                    data_situacao_especial DATE
+                ) PARTITION BY LIST (uf);
             """))
+            if particionada(conn, "estabelecimentos"):
+                criar_particoes(conn, "estabelecimentos")
+            else:
+                # Banco antigo (uma tabela só): a próxima importação com troca atômica publica a versão particionada
+                print("[!] estabelecimentos ainda não é particionada por UF: rode o etl_import.py (ETL_TROCA_ATOMICA=1) para converter.")
             
             conn.execute(text("""
                 CREATE TABLE IF NOT EXISTS socios (
-                    cnpj_basico VARCHAR(8),
+                    cnpj_basico INTEGER,
                     identificador_socio VARCHAR(1),
                     nome_socio_razao_social TEXT,
                     cpf_cnpj_socio VARCHAR(14),
                     qualificacao_socio VARCHAR(2),
-                    data_entrada_sociedade VARCHAR(8),
+                    data_entrada_sociedade DATE,
                     pais VARCHAR(3),
                     representante_legal VARCHAR(11),
                     nome_representante TEXT,
@@ -89,28 +186,42 @@ def criar_tabelas():
             # --- TABELA QUE FALTAVA ---
             conn.execute(text("""
                 CREATE TABLE IF NOT EXISTS qualificacoes (
-                    codigo VARCHAR(4),
+                    codigo VARCHAR(4) PRIMARY KEY,
                     descricao TEXT
                 );
             """))
             
             conn.execute(text("""
                 CREATE TABLE IF NOT EXISTS cnaes (
-                    codigo VARCHAR(7),
+                    codigo VARCHAR(7) PRIMARY KEY,
                     descricao TEXT
                 );
             """))
             
             conn.execute(text("""
                 CREATE TABLE IF NOT EXISTS naturezas (
-                    codigo VARCHAR(4),
+                    codigo VARCHAR(4) PRIMARY KEY,
                     descricao TEXT
                 );
             """))
             
             conn.execute(text("""
                 CREATE TABLE IF NOT EXISTS municipios (
-                    codigo VARCHAR(4),
+                    codigo VARCHAR(4) PRIMARY KEY,
+                    descricao TEXT
+                );
+            """))
+            
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS paises (
+                    codigo VARCHAR(3) PRIMARY KEY,
+                    descricao TEXT
+                );
+            """))
+            
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS motivos (
+                    codigo VARCHAR(2) PRIMARY KEY,
                     descricao TEXT
                 );
             """))
@@ -150,11 +261,42 @@ def criar_tabelas():
                 conn.commit()
             except: pass
 
-            # Índices
-            conn.execute(text("CREATE INDEX IF NOT EXISTS idx_qual_codigo ON qualificacoes (codigo);"))
-            conn.execute(text("CREATE INDEX IF NOT EXISTS idx_cnae_codigo ON cnaes (codigo);"))
-            conn.execute(text("CREATE INDEX IF NOT EXISTS idx_nat_codigo ON naturezas (codigo);"))
-            conn.execute(text("CREATE INDEX IF NOT EXISTS idx_mun_codigo ON municipios (codigo);"))
+            # Trigramas para a busca por nome (ILIKE '%...%') da exportação
+            try:
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm;"))
+            except Exception as e:
+                print(f"[!] Aviso pg_trgm (crie como superusuário: CREATE EXTENSION pg_trgm): {e}")
+
+            # Migração das colunas tipadas (bancos criados com tudo em VARCHAR)
+            migrar_tipos(conn)
+
+            # Chave compacta (BIGINT) em banco criado antes dela. Reescreve estabelecimentos: só roda uma vez.
+            if not conn.execute(text("SELECT 1 FROM information_schema.columns WHERE table_name = 'estabelecimentos' AND column_name = 'cnpj'")).scalar():
+                print("[*] Criando a coluna cnpj (BIGINT) em estabelecimentos (pode demorar)...")
+                try:
+                    conn.execute(text(f"ALTER TABLE estabelecimentos ADD COLUMN cnpj BIGINT GENERATED ALWAYS AS ({EXPRESSAO_CNPJ}) STORED;"))
+                except Exception as e:
+                    print(f"[!] Aviso migração estabelecimentos: {e}")
+
+            # Cidades por UF (pré-calculada no fim da importação; se vazia, preenche agora)
+            from etl_cidades import TABELA_CIDADES, garantir_tabela_cidades, atualizar_cidades
+            garantir_tabela_cidades(engine)
+            if not conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {TABELA_CIDADES})")).scalar():
+                atualizar_cidades(engine)
+
+            # Modelo de leitura da API. Banco com dados e sem o modelo: constrói agora (pode demorar)
+            from etl_leitura import TABELA_LEITURA, criar_tabela_leitura, construir_leitura
+            criar_tabela_leitura(conn)
+            if (not conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {TABELA_LEITURA})")).scalar()
+                    and conn.execute(text("SELECT EXISTS (SELECT 1 FROM estabelecimentos)")).scalar()):
+                construir_leitura(engine)
+
+            # Chaves primárias (CNPJ e códigos). Em banco já criado sem elas, criar_chave_primaria
+            # tira as duplicadas antes; estabelecimentos particionada ganha a chave em cada partição.
+            # Chave antiga em outras colunas (cnpj_basico, cnpj_ordem, cnpj_dv) é trocada pela nova.
+            from etl_optimize_db import CHAVES_PRIMARIAS, criar_chave_primaria
+            for tabela in CHAVES_PRIMARIAS:
+                criar_chave_primaria(conn, tabela)
 
         print("[SUCESSO] Estrutura do banco corrigida (Tabela qualificacoes criada)!")
         
@@ -0,0 +1,98 @@
+import time
+from sqlalchemy import text
+
+import etl_telemetria
+from etl_optimize_db import INDICES, construir_indices, configurar_manutencao, particoes_da_tabela, base_da_particao
+from etl_setup_db import PARTICIONADAS, criar_particoes
+
+# Atualização sem downtime: a importação grava em <tabela>_next (UNLOGGED, sem índices)
+# enquanto a API continua lendo <tabela>. No fim, os nomes são trocados numa transação curta.
+
+SUFIXO_NOVA = "_next"
+SUFIXO_ANTIGA = "_old"
+
+# Tempo máximo esperando o lock da troca (uma consulta longa da API segura a tabela)
+TIMEOUT_LOCK_TROCA = "5s"
+TENTATIVAS_TROCA = 10
+
+def preparar_tabelas_novas(engine, tabelas):
+    """
+    Cria <tabela>_next vazia, UNLOGGED e sem índices, com as mesmas colunas da tabela atual
+    (inclusive as geradas, como o cnpj BIGINT dos estabelecimentos).
+    Tabelas particionadas (estabelecimentos por UF) nascem particionadas mesmo que a atual
+    ainda não seja: a troca converte o banco antigo. O pai não pode ser UNLOGGED, as partições sim.
+    """
+    with engine.connect() as conn:
+        for tabela in tabelas:
+            conn.execute(text(f"DROP TABLE IF EXISTS {tabela}{SUFIXO_NOVA};"))
+            conn.execute(text(f"DROP TABLE IF EXISTS {tabela}{SUFIXO_ANTIGA};"))
+            if tabela in PARTICIONADAS:
+                conn.execute(text(f"CREATE TABLE {tabela}{SUFIXO_NOVA} (LIKE {tabela} INCLUDING DEFAULTS INCLUDING GENERATED) PARTITION BY LIST ({PARTICIONADAS[tabela]});"))
+                criar_particoes(conn, tabela, SUFIXO_NOVA, unlogged=True)
+                print(f"[*] Tabela {tabela}{SUFIXO_NOVA} criada (particionada por {PARTICIONADAS[tabela]}, partições UNLOGGED)")
+            else:
+                conn.execute(text(f"CREATE UNLOGGED TABLE {tabela}{SUFIXO_NOVA} (LIKE {tabela} INCLUDING DEFAULTS INCLUDING GENERATED);"))
+                print(f"[*] Tabela {tabela}{SUFIXO_NOVA} criada (UNLOGGED)")
+
+def finalizar_tabelas_novas(engine, tabelas):
+    """
+    Chaves primárias e índices do etl_optimize_db (todas as tabelas novas juntas, em paralelo),
+    SET LOGGED e ANALYZE em cada uma (a API não é afetada).
+    """
+    tel = etl_telemetria.atual()
+    construir_indices(engine, tabelas, SUFIXO_NOVA)
+    with engine.connect() as conn:
+        configurar_manutencao(conn)
+        for tabela in tabelas:
+            nova = f"{tabela}{SUFIXO_NOVA}"
+            print(f"--> {nova}: SET LOGGED...")
+            start = time.time()
+            with tel.fase("set_logged"):
+                for relacao in particoes_da_tabela(conn, nova) or [nova]:
+                    conn.execute(text(f"ALTER TABLE {relacao} SET LOGGED;"))
+            print(f"    [OK] {time.time() - start:.2f}s")
+
+            print(f"--> {nova}: ANALYZE...")
+            with tel.fase("analyze"):
+                conn.execute(text(f"ANALYZE {nova};"))
+
+def _renomear(conn, tabela, de, para):
+    # Tabela, partições (<tabela>_<uf>), chaves primárias e índices seguem a convenção <nome><sufixo>
+    particoes = [base_da_particao(p, de) for p in particoes_da_tabela(conn, f"{tabela}{de}")]
+    conn.execute(text(f"ALTER TABLE {tabela}{de} RENAME TO {tabela}{para};"))
+    conn.execute(text(f"ALTER INDEX IF EXISTS {tabela}_pkey{de} RENAME TO {tabela}_pkey{para};"))
+    for _, nome, _ in INDICES.get(tabela, []):
+        conn.execute(text(f"ALTER INDEX IF EXISTS {nome}{de} RENAME TO {nome}{para};"))
+    for particao in particoes:
+        parte = particao[len(tabela) + 1:]
+        conn.execute(text(f"ALTER TABLE {particao}{de} RENAME TO {particao}{para};"))
+        conn.execute(text(f"ALTER INDEX IF EXISTS {particao}_pkey{de} RENAME TO {particao}_pkey{para};"))
+        for _, nome, _ in INDICES.get(tabela, []):
+            conn.execute(text(f"ALTER INDEX IF EXISTS {nome}_{parte}{de} RENAME TO {nome}_{parte}{para};"))
+
+def trocar_tabelas(engine, tabelas):
+    """
+    Publica todas as tabelas novas de uma vez: <tabela> -> <tabela>_old e <tabela>_next -> <tabela>
+    numa única transação (só renomeia, leva milissegundos). Depois apaga as antigas.
+    """
+    engine_transacao = engine.execution_options(isolation_level="READ COMMITTED")
+    inicio = time.time()
+    for tentativa in range(1, TENTATIVAS_TROCA + 1):
+        try:
+            with engine_transacao.begin() as conn:
+                conn.execute(text(f"SET LOCAL lock_timeout = '{TIMEOUT_LOCK_TROCA}';"))
+                for tabela in tabelas:
+                    if conn.execute(text("SELECT to_regclass(:t)"), {"t": tabela}).scalar():
+                        _renomear(conn, tabela, "", SUFIXO_ANTIGA)
+                    _renomear(conn, tabela, SUFIXO_NOVA, "")
+            break
+        except Exception as e:
+            print(f"    [!] Troca não conseguiu o lock ({e}). Tentativa {tentativa}/{TENTATIVAS_TROCA}...")
+            if tentativa == TENTATIVAS_TROCA: raise
+            time.sleep(5)
+
+    etl_telemetria.atual().somar_fase("troca", time.time() - inicio)
+    print(f"[OK] Tabelas publicadas: {', '.join(tabelas)}")
+    with engine.connect() as conn:
+        for tabela in tabelas:
+            conn.execute(text(f"DROP TABLE IF EXISTS {tabela}{SUFIXO_ANTIGA};"))
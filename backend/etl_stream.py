@@ -0,0 +1,141 @@
+import io
+import struct
+import zlib
+import hashlib
+
+# Assinaturas do formato ZIP
+ASSINATURA_CABECALHO_LOCAL = b"PK\x03\x04"
+ASSINATURA_DESCRITOR = b"PK\x07\x08"
+CABECALHO_LOCAL = struct.Struct("<4sHHHHHIIIHH")
+
+TAMANHO_BLOCO_REDE = 1024 * 1024
+
+
+class ErroZipStream(Exception):
+    pass
+
+
+class CsvDentroDeZipRemoto(io.RawIOBase):
+    """
+    Lê o primeiro arquivo de um ZIP direto do corpo HTTP, descomprimindo em memória.
+    Nada é gravado em disco, exceto (opcionalmente) uma cópia do ZIP bruto em `copia`.
+
+    Funciona porque o ZIP guarda um cabeçalho local antes dos dados de cada membro;
+    o diretório central (no fim do arquivo) não é necessário para extrair o primeiro CSV.
+    """
+
+    def __init__(self, response, copia=None):
+        self._fonte = response.iter_content(chunk_size=TAMANHO_BLOCO_REDE)
+        self._copia = copia
+        self._hash_bruto = hashlib.sha256() if copia is not None else None
+        self._pendente = b""
+        self._saida = b""
+        self._fim = False
+        self._crc = 0
+        self.bytes_comprimidos = 0
+        self.bytes_descomprimidos = 0
+
+        self._ler_cabecalho()
+
+    # --- leitura do corpo HTTP ---
+
+    def _puxar(self):
+        try:
+            bloco = next(self._fonte)
+        except StopIteration:
+            return False
+        if self._copia is not None:
+            self._copia.write(bloco)
+            self._hash_bruto.update(bloco)
+        self._pendente += bloco
+        return True
+
+    def _ler_exato(self, n):
+        while len(self._pendente) < n:
+            if not self._puxar():
+                raise ErroZipStream("ZIP truncado")
+        dados, self._pendente = self._pendente[:n], self._pendente[n:]
+        return dados
+
+    def _ler_cabecalho(self):
+        campos = CABECALHO_LOCAL.unpack(self._ler_exato(CABECALHO_LOCAL.size))
+        assinatura, _, flags, metodo, _, _, crc, comprimido, descomprimido, tam_nome, tam_extra = campos
+        if assinatura != ASSINATURA_CABECALHO_LOCAL:
+            raise ErroZipStream("Resposta não é um arquivo ZIP")
+
+        self.nome = self._ler_exato(tam_nome).decode("cp437")
+        self._ler_exato(tam_extra)
+        self._metodo = metodo
+        self._tem_descritor = bool(flags & 0x08)
+        self._crc_esperado = None if self._tem_descritor else crc
+        # 0xFFFFFFFF = tamanho real está no extra ZIP64; tratamos como desconhecido
+        self.tamanho_descomprimido = descomprimido if descomprimido not in (0, 0xFFFFFFFF) else None
+        self._restante_armazenado = comprimido
+
+        if metodo == 8:
+            self._inflador = zlib.decompressobj(-zlib.MAX_WBITS)
+        elif metodo != 0 or self._tem_descritor:
+            raise ErroZipStream(f"Método de compressão não suportado ({metodo})")
+
+    # --- descompressão ---
+
+    def _produzir(self):
+        if not self._pendente and not self._puxar():
+            raise ErroZipStream("ZIP truncado")
+        self.bytes_comprimidos += len(self._pendente)
+
+        if self._metodo == 0:
+            dados = self._pendente[:self._restante_armazenado]
+            self._pendente = self._pendente[len(dados):]
+            self._restante_armazenado -= len(dados)
+            if self._restante_armazenado == 0: self._finalizar()
+        else:
+            dados = self._inflador.decompress(self._pendente)
+            self._pendente = b""
+            if self._inflador.eof:
+                self._pendente = self._inflador.unused_data
+                self.bytes_comprimidos -= len(self._pendente)
+                self._finalizar()
+
+        self._crc = zlib.crc32(dados, self._crc)
+        self.bytes_descomprimidos += len(dados)
+        return dados
+
+    def _finalizar(self):
+        self._fim = True
+        if self._tem_descritor:
+            # Descritor: [assinatura opcional] crc(4) + tamanhos (8 ou 16 bytes)
+            inicio = self._ler_exato(4)
+            if inicio == ASSINATURA_DESCRITOR: inicio = self._ler_exato(4)
+            self._crc_esperado = struct.unpack("<I", inicio)[0]
+
+    def readable(self):
+        return True
+
+    def readinto(self, destino):
+        while not self._saida and not self._fim:
+            self._saida = self._produzir()
+        if not self._saida:
+            self._conferir_crc()
+            return 0
+        n = min(len(destino), len(self._saida))
+        destino[:n] = self._saida[:n]
+        self._saida = self._saida[n:]
+        return n
+
+    def _conferir_crc(self):
+        if self._crc_esperado is not None and self._crc_esperado != self._crc:
+            raise ErroZipStream(f"CRC inválido em {self.nome}")
+
+    def drenar_copia(self):
+        """Termina de baixar o ZIP (diretório central incluso) para a cópia local ficar válida."""
+        if self._copia is None: return None
+        while self._puxar():
+            self._pendente = b""
+        return self._hash_bruto.hexdigest()
+
+
+def abrir_csv_remoto(response, copia=None):
+    """Retorna (leitor binário bufferizado, leitor bruto) para o CSV dentro do ZIP remoto."""
+    bruto = CsvDentroDeZipRemoto(response, copia=copia)
+    return io.BufferedReader(bruto, buffer_size=TAMANHO_BLOCO_REDE), bruto
@@ -0,0 +1,99 @@
+import os
+from functools import lru_cache
+from sqlalchemy import text
+
+# Importação de um subconjunto regional (ex.: só o Maranhão). ETL_UFS e/ou ETL_MUNICIPIOS
+# (códigos da Receita, separados por vírgula) limitam os estabelecimentos; empresas e sócios
+# ficam só com os cnpj_basico desses estabelecimentos. O filtro é aplicado em cada bloco,
+# antes do COPY, e o etl_sync_es.py usa o mesmo filtro. Tabelas de domínio vêm inteiras.
+#
+#   ETL_UFS=MA python etl_import.py
+#   ETL_UFS=MA,PI ETL_MUNICIPIOS=9701 python etl_sync_es.py   (MA, PI e Brasília)
+
+UFS = {uf.strip().upper() for uf in os.getenv("ETL_UFS", "").split(",") if uf.strip()}
+MUNICIPIOS = {m.strip().zfill(4) for m in os.getenv("ETL_MUNICIPIOS", "").split(",") if m.strip()}
+
+# Tabelas filtradas pelo cnpj_basico dos estabelecimentos que ficaram
+DEPENDENTES = {"empresas", "socios"}
+
+def ativo():
+    return bool(UFS or MUNICIPIOS)
+
+def descricao():
+    partes = []
+    if UFS: partes.append("UFs " + ",".join(sorted(UFS)))
+    if MUNICIPIOS: partes.append("municípios " + ",".join(sorted(MUNICIPIOS)))
+    return " + ".join(partes)
+
+def condicoes_estabelecimentos():
+    """{coluna: valores} do filtro de estabelecimentos (basta uma condição valer)."""
+    condicoes = {}
+    if UFS: condicoes["uf"] = UFS
+    if MUNICIPIOS: condicoes["municipio"] = MUNICIPIOS
+    return condicoes
+
+class Filtro:
+    """
+    Mantém a linha se alguma condição `coluna in valores` for verdadeira.
+    Chamável com a linha do csv (lista de campos); `mascara`, `mascara_colunas` e `mascara_arrow`
+    fazem o mesmo para DataFrames (motor pandas), blocos do motor bytes e lotes Arrow (cache Parquet).
+    """
+
+    def __init__(self, colunas, condicoes):
+        self.condicoes = [(colunas.index(coluna), coluna, valores) for coluna, valores in condicoes.items()]
+        # value_set do Arrow por coluna, montado no primeiro lote que usa e reaproveitado nos seguintes
+        self._conjuntos_arrow = {}
+
+    def __call__(self, linha):
+        return any(linha[i] in valores for i, _, valores in self.condicoes)
+
+    def mascara(self, df):
+        resultado = None
+        for _, coluna, valores in self.condicoes:
+            condicao = df[coluna].isin(valores)
+            resultado = condicao if resultado is None else resultado | condicao
+        return resultado
+
+    def mascara_colunas(self, coluna):
+        """Para o bloco já separado em colunas (etl_transcoder): `coluna(i)` é a lista de valores do campo i."""
+        resultado = None
+        for i, _, valores in self.condicoes:
+            condicao = [valor in valores for valor in coluna(i)]
+            resultado = condicao if resultado is None else [a or b for a, b in zip(resultado, condicao)]
+        return resultado
+
+    def mascara_arrow(self, lote):
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        resultado = None
+        for _, coluna, valores in self.condicoes:
+            if len(valores) > lote.num_rows:
+                # Conjunto maior que o lote (ex.: milhões de cnpj_basico): o is_in remonta a tabela
+                # hash do value_set a cada chamada, consultar o set do Python linha a linha sai bem mais barato
+                condicao = pa.array([valor in valores for valor in lote.column(coluna).to_pylist()], pa.bool_())
+            else:
+                if coluna not in self._conjuntos_arrow:
+                    self._conjuntos_arrow[coluna] = pa.array(sorted(valores), pa.string())
+                condicao = pc.fill_null(pc.is_in(lote.column(coluna), value_set=self._conjuntos_arrow[coluna]), False)
+            resultado = condicao if resultado is None else pc.or_(resultado, condicao)
+        return resultado
+
+@lru_cache(maxsize=None)
+def carregar_basicos(engine_url, tabela_estabelecimentos):
+    """cnpj_basico dos estabelecimentos já importados (uma vez por processo), com os 8 dígitos do arquivo."""
+    from sqlalchemy import create_engine
+    engine = create_engine(engine_url)
+    with engine.connect() as conn:
+        basicos = frozenset(linha[0] for linha in conn.execute(text(f"SELECT DISTINCT lpad(cnpj_basico::text, 8, '0') FROM {tabela_estabelecimentos}")))
+    engine.dispose()
+    print(f"    -> Subconjunto: {len(basicos):,} CNPJs básicos de {tabela_estabelecimentos}")
+    return basicos
+
+def filtro_da_tabela(tabela, colunas, engine_url, tabela_estabelecimentos):
+    """Filtro para importar `tabela` (nome sem sufixo) ou None se ela entra inteira."""
+    if not ativo(): return None
+    if tabela == "estabelecimentos":
+        return Filtro(colunas, condicoes_estabelecimentos())
+    if tabela in DEPENDENTES:
+        return Filtro(colunas, {"cnpj_basico": carregar_basicos(engine_url, tabela_estabelecimentos)})
+    return None
@@ -0,0 +1,117 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+# Telemetria comum às etapas do ETL (download, importação, otimização e Elastic).
+# Cada etapa acumula bytes, linhas e o tempo gasto em cada fase (ex.: parse, copy,
+# indices, bulk) e no fim grava um relatório JSON em dados/relatorios/, que o
+# painel admin lê pelo /admin/relatorios.
+#
+# Processos filhos (pool de importação) usam o próprio coletor e devolvem
+# `exportar()` para o processo principal somar com `mesclar()`.
+
+PASTA_RELATORIOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dados", "relatorios")
+
+class Telemetria:
+    def __init__(self, etapa):
+        self.etapa = etapa
+        self.inicio = time.time()
+        self.bytes = 0
+        self.linhas = 0
+        self.fases = {}
+        self.itens = []
+        self.maximos = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def fase(self, nome):
+        """Soma o tempo do bloco `with` na fase `nome`."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.somar_fase(nome, time.perf_counter() - inicio)
+
+    def somar_fase(self, nome, segundos):
+        with self._lock:
+            self.fases[nome] = self.fases.get(nome, 0.0) + segundos
+
+    def contar(self, bytes=0, linhas=0):
+        with self._lock:
+            self.bytes += bytes
+            self.linhas += linhas
+
+    def maximo(self, nome, valor):
+        """Guarda o maior valor visto (ex.: pico de RSS entre todos os processos)."""
+        with self._lock:
+            self.maximos[nome] = max(self.maximos.get(nome, valor), valor)
+
+    def registrar_item(self, nome, **dados):
+        """Resultado de uma unidade de trabalho (arquivo, índice, tabela...)."""
+        with self._lock:
+            self.itens.append(dict(nome=nome, **dados))
+
+    def exportar(self):
+        with self._lock:
+            return {"bytes": self.bytes, "linhas": self.linhas, "fases": dict(self.fases), "itens": list(self.itens),
+                    "maximos": dict(self.maximos)}
+
+    def mesclar(self, dados):
+        if not dados: return
+        with self._lock:
+            self.bytes += dados["bytes"]
+            self.linhas += dados["linhas"]
+            for nome, segundos in dados["fases"].items():
+                self.fases[nome] = self.fases.get(nome, 0.0) + segundos
+            self.itens.extend(dados["itens"])
+            for nome, valor in dados.get("maximos", {}).items():
+                self.maximos[nome] = max(self.maximos.get(nome, valor), valor)
+
+    def relatorio(self, **extras):
+        duracao = max(time.time() - self.inicio, 1e-6)
+        dados = self.exportar()
+        return dict({
+            "etapa": self.etapa,
+            "inicio": datetime.fromtimestamp(self.inicio).isoformat(timespec="seconds"),
+            "fim": datetime.now().isoformat(timespec="seconds"),
+            "duracao_s": round(duracao, 2),
+            "bytes": dados["bytes"],
+            "linhas": dados["linhas"],
+            "mb_s": round(dados["bytes"] / 1024 / 1024 / duracao, 2),
+            "linhas_s": round(dados["linhas"] / duracao, 1),
+            # Fases somam o tempo de todos os processos/threads: podem passar da duração total
+            "fases_s": {nome: round(segundos, 2) for nome, segundos in sorted(dados["fases"].items(), key=lambda f: -f[1])},
+            "maximos": dados["maximos"],
+            "itens": dados["itens"],
+        }, **extras)
+
+    def gravar(self, **extras):
+        """Grava dados/relatorios/<etapa>_<AAAAMMDD_HHMMSS>.json e imprime o resumo das fases."""
+        relatorio = self.relatorio(**extras)
+        os.makedirs(PASTA_RELATORIOS, exist_ok=True)
+        nome = f"{self.etapa}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        caminho = os.path.join(PASTA_RELATORIOS, nome)
+        with open(caminho + ".tmp", "w") as f:
+            json.dump(relatorio, f, indent=2, ensure_ascii=False, default=str)
+        os.replace(caminho + ".tmp", caminho)
+
+        print(f"\n[*] Telemetria ({self.etapa}): {relatorio['duracao_s']:.1f}s, "
+              f"{relatorio['mb_s']:.2f} MB/s, {relatorio['linhas_s']:,.0f} linhas/s")
+        for fase, segundos in relatorio["fases_s"].items():
+            print(f"    {fase:<20}{segundos:>10.1f}s")
+        print(f"    Relatório: {caminho}")
+        return caminho
+
+# Coletor do processo atual (cada worker do pool cria o seu)
+_atual = Telemetria("etl")
+
+def iniciar(etapa):
+    global _atual
+    _atual = Telemetria(etapa)
+    return _atual
+
+def atual():
+    return _atual
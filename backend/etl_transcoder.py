@@ -0,0 +1,278 @@
+import re
+import os
+import csv
+import io
+from datetime import date
+from functools import lru_cache
+
+# Motor de importação sem pandas: trabalha direto nos bytes latin-1 da Receita.
+# Cada bloco termina sempre no fim de um registro, então pode ir inteiro para um COPY.
+
+TAMANHO_BLOCO = 8 * 1024 * 1024
+
+# Espaços logo depois da aspa de abertura de um campo. Os padrões começam com um
+# literal de propósito: assim o `re` procura só nos separadores e não em cada byte.
+# Os espaços antes da aspa de fechamento são tratados com o mesmo padrão sobre
+# os bytes invertidos (fechamento vira abertura).
+_PADROES_ABERTURA = (
+    (re.compile(rb';"[ \t]+'), b';"'),
+    (re.compile(rb'\n"[ \t]+'), b'\n"'),
+    (re.compile(rb'\r"[ \t]+'), b'\r"'),
+)
+_RE_ESPACO_INICIO = re.compile(rb'"[ \t]+')
+
+
+def fim_do_ultimo_registro(buffer, inicio=0):
+    """
+    Posição logo após o último '\\n' que está fora de aspas (contando a partir de `inicio`,
+    que precisa ser início de registro). Retorna -1 se não houver registro completo.
+    """
+    pos = buffer.rfind(b'\n', inicio)
+    while pos != -1:
+        if buffer.count(b'"', inicio, pos) % 2 == 0:
+            return pos + 1
+        pos = buffer.rfind(b'\n', inicio, pos)
+    return -1
+
+
+def ler_blocos(fonte, tamanho_bloco=TAMANHO_BLOCO):
+    """
+    Lê um arquivo binário e gera blocos de bytes com registros completos.
+    Uma aspa solta só afeta o próprio bloco: a contagem recomeça a cada bloco.
+    `tamanho_bloco` pode ser chamável (ex.: etl_memoria.ControleBloco): é consultado a cada leitura.
+    """
+    sobra = b""
+    while True:
+        tamanho = tamanho_bloco() if callable(tamanho_bloco) else tamanho_bloco
+        dados = fonte.read(tamanho)
+        if not dados:
+            if sobra: yield sobra
+            return
+        buffer = sobra + dados
+        corte = fim_do_ultimo_registro(buffer)
+        if corte == -1:
+            # Aspas desbalanceadas no bloco todo: corta na última quebra de linha
+            corte = buffer.rfind(b'\n') + 1 if len(buffer) > 4 * tamanho else 0
+        if corte <= 0:
+            sobra = buffer
+            continue
+        sobra = buffer[corte:]
+        yield buffer[:corte]
+
+
+def _registro_valido(janela, pos, num_colunas):
+    """True se `pos` (logo após um '\\n') abre um registro completo com `num_colunas` campos."""
+    fim = janela.find(b'\n', pos)
+    if fim == -1: return False
+    try:
+        campos = next(csv.reader([janela[pos:fim].decode('latin-1')], delimiter=';', quotechar='"'))
+    except (csv.Error, StopIteration):
+        return False
+    return len(campos) == num_colunas
+
+
+def _proximo_registro(arquivo, alvo, num_colunas, tamanho_janela=1024 * 1024):
+    """
+    Primeiro início de registro em `alvo` ou depois dele. Candidatos são '\\n"' (todo campo
+    da Receita vem entre aspas); um '\\n' dentro de um campo só é aceito se a linha
+    seguinte tiver exatamente `num_colunas` campos. Retorna None se não achar.
+    """
+    while True:
+        arquivo.seek(alvo)
+        janela = arquivo.read(tamanho_janela)
+        if len(janela) < 2: return None
+        pos = janela.find(b'\n"')
+        while pos != -1:
+            if _registro_valido(janela, pos + 1, num_colunas):
+                return alvo + pos + 1
+            pos = janela.find(b'\n"', pos + 1)
+        if len(janela) < tamanho_janela: return None
+        # Recua um pouco para não perder um registro cortado na borda da janela
+        alvo += tamanho_janela - 64 * 1024
+
+
+def calcular_faixas(caminho, partes, num_colunas):
+    """
+    Divide o arquivo em até `partes` faixas [inicio, fim) de bytes, cada uma começando
+    no início de um registro. As faixas são contíguas e cobrem o arquivo inteiro.
+    """
+    tamanho = os.path.getsize(caminho)
+    cortes = [0]
+    with open(caminho, 'rb') as arquivo:
+        for i in range(1, partes):
+            corte = _proximo_registro(arquivo, max(tamanho * i // partes - 1, cortes[-1]), num_colunas)
+            if corte is None or corte >= tamanho: break
+            if corte > cortes[-1]: cortes.append(corte)
+    cortes.append(tamanho)
+    return list(zip(cortes[:-1], cortes[1:]))
+
+
+_RE_ENTRE_ASPAS = re.compile(rb'"[^"]*"')
+
+def contar_registros_bloco(bloco):
+    """Registros de um bloco do ler_blocos: '\n' dentro de aspas não conta (mesma paridade do corte)."""
+    if not bloco: return 0
+    total = _RE_ENTRE_ASPAS.sub(b'', bloco).count(b'\n')
+    # Último registro do arquivo sem quebra de linha no fim
+    return total + (not bloco.endswith(b'\n'))
+
+
+def contar_registros(caminho, inicio, fim, tamanho_bloco=TAMANHO_BLOCO):
+    """Registros em [inicio, fim), lidos em blocos como na importação: o total esperado de linhas da faixa."""
+    with abrir_faixa(caminho, inicio, fim) as fonte:
+        return sum(contar_registros_bloco(bloco) for bloco in ler_blocos(fonte, tamanho_bloco))
+
+
+class LeitorFaixa(io.RawIOBase):
+    """Arquivo binário limitado à faixa [inicio, fim) de outro arquivo (EOF no fim da faixa)."""
+
+    def __init__(self, caminho, inicio, fim):
+        self._arquivo = open(caminho, 'rb')
+        self._arquivo.seek(inicio)
+        self._restante = fim - inicio
+
+    def readable(self):
+        return True
+
+    def readinto(self, destino):
+        if self._restante <= 0: return 0
+        n = self._arquivo.readinto(memoryview(destino)[:min(len(destino), self._restante)])
+        self._restante -= n
+        return n
+
+    def close(self):
+        self._arquivo.close()
+        super().close()
+
+
+def abrir_faixa(caminho, inicio, fim):
+    return io.BufferedReader(LeitorFaixa(caminho, inicio, fim), buffer_size=TAMANHO_BLOCO)
+
+
+def _remover_espacos_apos_abertura(bloco):
+    for padrao, troca in _PADROES_ABERTURA:
+        bloco = padrao.sub(troca, bloco)
+    # Primeiro campo do bloco (não tem separador antes)
+    inicio = _RE_ESPACO_INICIO.match(bloco)
+    if inicio:
+        bloco = b'"' + bloco[inicio.end():]
+    return bloco
+
+
+def transcodificar_bloco(bloco):
+    """latin-1 -> UTF-8, sem bytes nulos e sem espaços nas pontas de cada campo entre aspas."""
+    bloco = bloco.translate(None, b'\x00')
+    bloco = _remover_espacos_apos_abertura(bloco)
+    bloco = _remover_espacos_apos_abertura(bloco[::-1])[::-1]
+    return bloco.decode('latin-1').encode('utf-8')
+
+
+def reparar_bloco(bloco_utf8, num_colunas):
+    """
+    Caminho lento, usado só quando o COPY rejeita um bloco: reescreve o bloco
+    descartando linhas com número errado de campos (como o on_bad_lines do pandas).
+    Retorna (bytes corrigidos, linhas descartadas).
+    """
+    saida = io.StringIO()
+    escritor = csv.writer(saida, delimiter=';', quotechar='"', quoting=csv.QUOTE_ALL, lineterminator='\n')
+    descartadas = 0
+    for linha in csv.reader(io.StringIO(bloco_utf8.decode('utf-8')), delimiter=';', quotechar='"'):
+        if len(linha) != num_colunas:
+            descartadas += 1
+            continue
+        escritor.writerow([campo.strip() for campo in linha])
+    return saida.getvalue().encode('utf-8'), descartadas
+
+
+# --- Colunas tipadas (DATE, NUMERIC, SMALLINT) ---
+# A Receita manda tudo como texto: '20150101', '0' / '00000000' para data vazia,
+# '1000,00' para capital e '02' para códigos. A conversão é feita uma vez, aqui,
+# e o COPY já grava o valor tipado (campo vazio = NULL).
+
+@lru_cache(maxsize=None)
+def converter_data(valor):
+    """'AAAAMMDD' -> 'AAAA-MM-DD'; vazio/zerado/inválido -> ''."""
+    if len(valor) != 8 or not valor.isdigit() or valor == "00000000": return ""
+    try:
+        return date(int(valor[:4]), int(valor[4:6]), int(valor[6:])).isoformat()
+    except ValueError:
+        return ""
+
+_RE_NUMERO = re.compile(r'\d+(\.\d+)?')
+
+def converter_numero(valor):
+    """'1.000,50' -> '1000.50'; inválido -> ''."""
+    valor = valor.replace('.', '').replace(',', '.')
+    return valor if _RE_NUMERO.fullmatch(valor) else ""
+
+@lru_cache(maxsize=None)
+def converter_codigo(valor):
+    """'02' -> '2' (SMALLINT); não numérico -> ''."""
+    return str(int(valor)) if valor.isdigit() and len(valor) <= 4 else ""
+
+CONVERSORES = {"data": converter_data, "numero": converter_numero, "codigo": converter_codigo}
+
+def conversoes_das_colunas(colunas, tipos):
+    """[(índice, função)] para as colunas de `colunas` que aparecem em `tipos` ({coluna: tipo})."""
+    return [(i, CONVERSORES[tipos[coluna]]) for i, coluna in enumerate(colunas) if coluna in tipos]
+
+def _campos_entre_aspas(texto, num_colunas):
+    """
+    Partes de texto.split('"') quando o bloco é só de registros com `num_colunas` campos entre
+    aspas (o layout da Receita): campos nos índices ímpares, separadores (';' e '\n') nos pares.
+    None se algum registro foge disso (aspas dentro do campo, campos a mais ou a menos, '\r').
+    """
+    partes = texto.split('"')
+    passo = 2 * num_colunas
+    if partes[0] or (len(partes) - 1) % passo: return None
+    separadores = partes[2::2]
+    registros = len(separadores) // num_colunas
+    if separadores.count(';') != registros * (num_colunas - 1) or separadores[num_colunas - 1::num_colunas].count('\n') != registros:
+        return None
+    return partes
+
+
+def converter_tipos(bloco_utf8, num_colunas, conversoes, filtro=None):
+    """
+    Reescreve um bloco já transcodificado aplicando as conversões de tipo.
+    Com `filtro` (ex.: etl_subconjunto.Filtro), só as linhas aceitas ficam.
+    Caminho normal: o bloco é fatiado nas aspas e só as colunas tipadas (e as do filtro) são
+    tocadas, coluna a coluna. Bloco fora do layout vai pelo csv, linha a linha; lá as linhas com
+    número errado de campos passam intactas (o COPY/reparo cuida delas).
+    """
+    texto = bloco_utf8.decode('utf-8')
+    partes = _campos_entre_aspas(texto, num_colunas)
+    if partes is None:
+        return _converter_tipos_csv(texto, num_colunas, conversoes, filtro)
+
+    passo = 2 * num_colunas
+    if filtro is not None:
+        mascara = filtro.mascara_colunas(lambda i: partes[1 + 2 * i::passo])
+        if not all(mascara):
+            # Cada registro ocupa `passo` partes (campo, separador, ..., último campo, '\n')
+            aceitas = [""]
+            for r, aceita in enumerate(mascara):
+                if aceita: aceitas += partes[1 + r * passo:1 + (r + 1) * passo]
+            partes = aceitas
+    for i, converter in conversoes:
+        partes[1 + 2 * i::passo] = [converter(valor) for valor in partes[1 + 2 * i::passo]]
+    return '"'.join(partes).encode('utf-8')
+
+
+def _converter_tipos_csv(texto, num_colunas, conversoes, filtro=None):
+    saida = io.StringIO()
+    escritor = csv.writer(saida, delimiter=';', quotechar='"', quoting=csv.QUOTE_ALL, lineterminator='\n')
+    for linha in csv.reader(io.StringIO(texto), delimiter=';', quotechar='"'):
+        if len(linha) == num_colunas:
+            if filtro is not None and not filtro(linha): continue
+            for i, converter in conversoes:
+                linha[i] = converter(linha[i])
+        escritor.writerow(linha)
+    return saida.getvalue().encode('utf-8')
+
+
+def sql_copy_bytes(tabela, colunas):
+    # FORCE_NULL: campo vazio ("") vira NULL, igual ao caminho pandas (NULL '')
+    columns_str = ",".join(colunas)
+    return (f"COPY {tabela} ({columns_str}) FROM STDIN WITH "
+            f"(FORMAT CSV, DELIMITER ';', QUOTE '\"', NULL '', FORCE_NULL ({columns_str}))")
@@ -1,13 +1,15 @@
 import os
+import json
 import subprocess
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Query, Depends, status
+from email.utils import formatdate
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Query, Depends, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, Response
 from sqlalchemy import create_engine, text
 from elasticsearch import Elasticsearch
 from typing import Optional, List
-from functools import lru_cache
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, date
+from decimal import Decimal
 from dotenv import load_dotenv
 
 # --- SEGURANÇA & AUTH ---
@@ -34,6 +36,8 @@ app = FastAPI(title="Plataforma de Inteligência - CNPJ & Licitações")
 
 # 1. ELASTICSEARCH
 ELASTIC_HOST = os.getenv("ELASTIC_HOST", "http://localhost:9200")
+# Alias trocado pelo etl_sync_es.py ao fim de cada carga (a busca nunca usa o índice em construção)
+ES_ALIAS = os.getenv("ES_ALIAS", "empresas")
 try:
     es_client = Elasticsearch(ELASTIC_HOST, request_timeout=5)
 except:
@@ -60,6 +64,11 @@ DB_NAME = os.getenv("DB_NAME", "cnpj_dados")
 DATABASE_URL = f"postgresql+pg8000://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 engine = create_engine(DATABASE_URL, pool_size=20, max_overflow=0)
 
+# Cache (navegador/proxy) da lista de cidades por UF, que só muda a cada importação. Vai com ETag e
+# Last-Modified da última atualização da tabela: depois de CACHE_CIDADES_SEGUNDOS (0 = sempre) o
+# navegador revalida e recebe 304 enquanto a lista não mudar
+CACHE_CIDADES_SEGUNDOS = int(os.getenv("CACHE_CIDADES_SEGUNDOS", "0"))
+
 # 4. SEGURANÇA
 SECRET_KEY = os.getenv("SECRET_KEY", "chave_secreta_padrao_insegura")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
@@ -211,18 +220,38 @@ def assinar_plano(tipo_plano: str, user: dict = Depends(get_current_user)):
 # ==============================================================================
 
 def fmt_cnpj(b, o, d): return f"{b}.{o}/{d}" if b else ""
-def fmt_data(d): return f"{d[6:8]}/{d[4:6]}/{d[0:4]}" if d and len(str(d)) == 8 else d
+def fmt_data(d): return d.strftime("%d/%m/%Y") if isinstance(d, date) else d
 def fmt_fone(ddd, num): return f"({ddd}) {num}" if num else ""
-def fmt_situacao(cod): return {'01':'NULA','02':'ATIVA','03':'SUSPENSA','04':'INAPTA','08':'BAIXADA'}.get(cod, cod)
-def fmt_porte(cod): return {'00':'NÃO INFORMADO','01':'MICRO','03':'EPP','05':'DEMAIS'}.get(cod, cod)
+def fmt_situacao(cod): return {1:'NULA',2:'ATIVA',3:'SUSPENSA',4:'INAPTA',8:'BAIXADA'}.get(cod, cod)
+def fmt_porte(cod): return {0:'NÃO INFORMADO',1:'MICRO',3:'EPP',5:'DEMAIS'}.get(cod, cod)
 def fmt_dinheiro(val):
-    if not val: return ""
-    try: return f"R$ {float(val.replace(',', '.')):,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
-    except: return val
+    if val is None or val == "": return ""
+    return f"R$ {val:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+# Colunas SMALLINT que o frontend recebe como código da Receita ('02')
+COLUNAS_CODIGO = ("situacao_cadastral", "porte_empresa")
+# Chaves numéricas (BIGINT/INTEGER) que o frontend recebe com os zeros à esquerda
+DIGITOS_CNPJ = {"cnpj": 14, "cnpj_basico": 8}
 
-@lru_cache(maxsize=32)
-def buscar_cidades_por_uf_cached(uf: str):
-    sql = text("SELECT DISTINCT e.municipio as codigo, m.descricao FROM estabelecimentos e JOIN municipios m ON e.municipio = m.codigo WHERE e.uf = :uf ORDER BY m.descricao")
+def cnpj_numerico(cnpj):
+    """'12.345.678/0001-95' -> 12345678000195 (chave BIGINT do banco). None se não for um CNPJ."""
+    c = cnpj.replace(".", "").replace("/", "").replace("-", "")
+    return int(c) if c.isdigit() and len(c) == 14 else None
+
+def valores_receita(linha):
+    """Campos tipados (DATE/NUMERIC/SMALLINT) de volta ao texto da Receita, formato que o frontend espera."""
+    ret = {}
+    for k, v in linha.items():
+        if isinstance(v, date): v = v.strftime("%Y%m%d")
+        elif isinstance(v, Decimal): v = f"{v:.2f}".replace(".", ",")
+        elif k in COLUNAS_CODIGO and v is not None: v = f"{v:02d}"
+        elif k in DIGITOS_CNPJ and v is not None: v = str(v).zfill(DIGITOS_CNPJ[k])
+        ret[k] = v
+    return ret
+
+def buscar_cidades_por_uf(uf: str):
+    # Tabela pré-calculada pelo etl_import.py (etl_cidades.py): leitura pela chave primária
+    sql = text("SELECT municipio as codigo, descricao, estabelecimentos, atualizado_em FROM cidades_por_uf WHERE uf = :uf ORDER BY descricao")
     with engine.connect() as conn: return conn.execute(sql, {"uf": uf}).mappings().all()
 
 def executar_script(nome_script):
@@ -252,17 +281,53 @@ def home():
     return {"msg": "Plataforma CNPJ & Licitações", "elastic": status}
 
 @app.get("/auxiliar/cidades/{uf}")
-def listar_cidades(uf: str):
-    try: return [{"codigo": c.codigo, "descricao": c.descricao} for c in buscar_cidades_por_uf_cached(uf.upper())]
+def listar_cidades(uf: str, request: Request, response: Response):
+    try: linhas = buscar_cidades_por_uf(uf.upper())
     except: return []
+    cabecalhos = {"Cache-Control": f"public, max-age={CACHE_CIDADES_SEGUNDOS}, must-revalidate" if CACHE_CIDADES_SEGUNDOS else "public, no-cache"}
+    atualizado = max((c.atualizado_em for c in linhas if c.atualizado_em), default=None)
+    if atualizado:
+        # A tabela é recalculada inteira numa transação: o horário dela identifica a versão da lista
+        cabecalhos["ETag"] = f'"{uf.upper()}-{atualizado:%Y%m%d%H%M%S%f}"'
+        cabecalhos["Last-Modified"] = formatdate(atualizado.timestamp(), usegmt=True)
+        if request.headers.get("if-none-match"):
+            nao_mudou = request.headers["if-none-match"] == cabecalhos["ETag"]
+        else:
+            nao_mudou = request.headers.get("if-modified-since") == cabecalhos["Last-Modified"]
+        if nao_mudou: return Response(status_code=304, headers=cabecalhos)
+    response.headers.update(cabecalhos)
+    return [{"codigo": c.codigo, "descricao": c.descricao, "estabelecimentos": c.estabelecimentos} for c in linhas]
+
+# Facetas devolvidas junto com a busca: nome -> (campo no Elastic, quantos valores)
+FACETAS_BUSCA = {
+    "uf": ("uf", 27),
+    "municipio": ("municipio", 50),
+    "situacao": ("situacao_cadastral", 10),
+    "cnae": ("cnae_fiscal_principal", 50),
+}
+
+def apenas_digitos(campo, valor, digitos):
+    """Código no formato do índice (só dígitos, zeros à esquerda): '47.21-1/02' -> '4721102'."""
+    numeros = "".join(c for c in valor if c.isdigit())
+    # Sem dígitos ou com dígitos demais não é um código: completar com zeros buscaria outro
+    if not numeros or len(numeros) > digitos:
+        raise HTTPException(status_code=422, detail=f"'{campo}' inválido: informe um código de até {digitos} dígitos.")
+    return numeros.zfill(digitos)
 
 @app.get("/buscar")
 def buscar_empresa(
     q: Optional[str]=None, page: int=1, limit: int=10, uf: Optional[str]=None, 
     municipio: Optional[str]=None, situacao: Optional[str]=None, data_inicio: Optional[str]=None, 
     data_fim: Optional[str]=None, capital_min: Optional[float]=None, capital_max: Optional[float]=None,
+    cnae: Optional[str]=None, cnae_secundaria: bool=True, porte: Optional[str]=None,
+    natureza: Optional[str]=None, matriz_filial: Optional[str]=None, facetas: bool=True,
     current_user: dict = Depends(get_current_user) # COBRANÇA
 ):
+    # Códigos validados antes da cobrança: filtro inválido devolve 422 sem gastar crédito
+    if porte: porte = apenas_digitos("porte", porte, 2)
+    if natureza: natureza = apenas_digitos("natureza", natureza, 4)
+    if cnae: cnae = apenas_digitos("cnae", cnae, 7)
+
     # Custa 1 crédito
     descontar_creditos(current_user, 1)
 
@@ -278,6 +343,13 @@ def buscar_empresa(
     if uf: filtros.append({"term": {"uf": uf.upper()}})
     if municipio: filtros.append({"term": {"municipio": municipio}})
     if situacao: filtros.append({"term": {"situacao_cadastral": situacao}})
+    if porte: filtros.append({"term": {"porte_empresa": porte}})
+    if natureza: filtros.append({"term": {"natureza_juridica": natureza}})
+    if matriz_filial: filtros.append({"term": {"identificador_matriz_filial": matriz_filial}})
+    if cnae:
+        # CNAE principal ou entre os secundários (cnae_secundaria=false: só o principal)
+        campos_cnae = ["cnae_fiscal_principal", "cnae_fiscal_secundaria"] if cnae_secundaria else ["cnae_fiscal_principal"]
+        filtros.append({"bool": {"should": [{"term": {campo: cnae}} for campo in campos_cnae], "minimum_should_match": 1}})
     
     if data_inicio or data_fim:
         r = {}
@@ -292,7 +364,10 @@ def buscar_empresa(
         filtros.append({"range": {"capital_social": cr}})
 
     try:
-        resp = es_client.search(index="empresas-index", body={"from": offset, "size": limit, "query": {"bool": {"must": must if must else [{"match_all": {}}], "filter": filtros}}})
+        corpo = {"from": offset, "size": limit, "query": {"bool": {"must": must if must else [{"match_all": {}}], "filter": filtros}}}
+        # Contagens por UF, município, situação e CNAE na mesma requisição da busca
+        if facetas: corpo["aggs"] = {nome: {"terms": {"field": campo, "size": tamanho}} for nome, (campo, tamanho) in FACETAS_BUSCA.items()}
+        resp = es_client.search(index=ES_ALIAS, body=corpo)
         items = [{
             "cnpj_basico": h['_source']['cnpj_completo'][:8],
             "cnpj_ordem": h['_source']['cnpj_completo'][8:12],
@@ -303,10 +378,18 @@ def buscar_empresa(
             "uf": h['_source']['uf'],
             "municipio": h['_source']['municipio'],
             "data_inicio_atividade": h['_source']['data_inicio_atividade'],
-            "capital_social": h['_source'].get('capital_social', 0)
+            "capital_social": h['_source'].get('capital_social', 0),
+            "cnae_fiscal_principal": h['_source'].get('cnae_fiscal_principal'),
+            "cnae_fiscal_secundaria": h['_source'].get('cnae_fiscal_secundaria', []),
+            "identificador_matriz_filial": h['_source'].get('identificador_matriz_filial'),
+            "natureza_juridica": h['_source'].get('natureza_juridica'),
+            "porte_empresa": h['_source'].get('porte_empresa')
         } for h in resp['hits']['hits']]
+        contagens = {nome: [{"valor": b["key"], "total": b["doc_count"]} for b in agregacao["buckets"]]
+                     for nome, agregacao in resp.get("aggregations", {}).items()}
         import math
-        return {"items": items, "total": resp['hits']['total']['value'], "page": page, "pages": math.ceil(resp['hits']['total']['value']/limit)}
+        return {"items": items, "total": resp['hits']['total']['value'], "page": page, "pages": math.ceil(resp['hits']['total']['value']/limit),
+                "facetas": contagens}
     except Exception as e: return {"items": [], "total": 0, "error": str(e)}
 
 @app.get("/empresa/{cnpj}")
@@ -314,22 +397,14 @@ def detalhes_empresa(cnpj: str, current_user: dict = Depends(get_current_user)):
     # Custa 1 crédito
     descontar_creditos(current_user, 1)
 
-    c = cnpj.replace(".", "").replace("/", "").replace("-", "")
-    b, o, d = c[:8], c[8:12], c[12:]
+    c = cnpj_numerico(cnpj)
+    if c is None: raise HTTPException(404, "Não encontrada")
+    # Modelo de leitura (etl_leitura.py): empresa, descrições e sócios já na linha do estabelecimento
     with engine.connect() as conn:
-        res = conn.execute(text("""
-            SELECT est.*, emp.razao_social, emp.natureza_juridica, emp.capital_social, emp.porte_empresa,
-            nat.descricao as natureza_juridica_texto, mun.descricao as municipio_texto
-            FROM estabelecimentos est
-            LEFT JOIN empresas emp ON est.cnpj_basico = emp.cnpj_basico
-            LEFT JOIN naturezas nat ON emp.natureza_juridica = nat.codigo
-            LEFT JOIN municipios mun ON est.municipio = mun.codigo
-            WHERE est.cnpj_basico = :b AND est.cnpj_ordem = :o AND est.cnpj_dv = :d LIMIT 1
-        """), {"b": b, "o": o, "d": d}).mappings().fetchone()
-        if not res: raise HTTPException(404, "Não encontrada")
-        socios = conn.execute(text("SELECT * FROM socios WHERE cnpj_basico = :b"), {"b": b}).mappings().all()
-    ret = dict(res)
-    ret["socios"] = [dict(s) for s in socios]
+        res = conn.execute(text("SELECT * FROM leitura_estabelecimentos WHERE cnpj = :c"), {"c": c}).mappings().fetchone()
+    if not res: raise HTTPException(404, "Não encontrada")
+    ret = valores_receita({k: v for k, v in res.items() if k not in ("socios", "socios_texto")})
+    ret["socios"] = res["socios"] or []
     return ret
 
 @app.get("/exportar")
@@ -339,6 +414,9 @@ def exportar_dados(
     capital_min: Optional[float]=None, capital_max: Optional[float]=None,
     current_user: dict = Depends(get_current_user) # COBRANÇA
 ):
+    # Situação validada antes da cobrança: código inválido devolve 422 em vez de exportar sem filtro
+    if situacao: situacao = apenas_digitos("situacao", situacao, 2)
+
     # Custa 10 créditos
     descontar_creditos(current_user, 10)
 
@@ -346,35 +424,32 @@ def exportar_dados(
     p = {}
     if uf: cond.append("est.uf = :uf"); p["uf"] = uf
     if municipio: cond.append("est.municipio = :municipio"); p["municipio"] = municipio
-    if situacao: cond.append("est.situacao_cadastral = :situacao"); p["situacao"] = situacao
-    if data_inicio: cond.append("est.data_inicio_atividade >= :di"); p["di"] = data_inicio.replace("-", "")
-    if data_fim: cond.append("est.data_inicio_atividade <= :df"); p["df"] = data_fim.replace("-", "")
+    if situacao: cond.append("est.situacao_cadastral = :situacao"); p["situacao"] = int(situacao)
+    if data_inicio: cond.append("est.data_inicio_atividade >= CAST(:di AS DATE)"); p["di"] = data_inicio
+    if data_fim: cond.append("est.data_inicio_atividade <= CAST(:df AS DATE)"); p["df"] = data_fim
     
+    # Colunas já tipadas no banco: comparação direta, usando os índices
     if capital_min is not None:
-        cond.append("CAST(REPLACE(emp.capital_social, ',', '.') AS NUMERIC) >= :cmin"); p["cmin"] = capital_min
+        cond.append("est.capital_social >= :cmin"); p["cmin"] = capital_min
     if capital_max is not None:
-        cond.append("CAST(REPLACE(emp.capital_social, ',', '.') AS NUMERIC) <= :cmax"); p["cmax"] = capital_max
+        cond.append("est.capital_social <= :cmax"); p["cmax"] = capital_max
 
     if q:
-        t = q.replace(".", "").replace("/", "").replace("-", "")
-        if t.isdigit() and len(t) == 14:
-            cond.append("est.cnpj_basico = :b AND est.cnpj_ordem = :o AND est.cnpj_dv = :d")
-            p["b"], p["o"], p["d"] = t[:8], t[8:12], t[12:]
+        c = cnpj_numerico(q)
+        if c is not None:
+            cond.append("est.cnpj = :c"); p["c"] = c
         else:
-            cond.append("(est.nome_fantasia ILIKE :q OR emp.razao_social ILIKE :q)"); p["q"] = f"%{q}%"
+            # As duas colunas estão na mesma tabela: cada lado do OR usa o seu índice de trigramas (pg_trgm)
+            cond.append("(est.nome_fantasia ILIKE :q OR est.razao_social ILIKE :q)"); p["q"] = f"%{q}%"
 
+    # Modelo de leitura (etl_leitura.py): descrições e sócios já resolvidos, sem JOIN nem subconsulta por linha
     sql = f"""
-        SELECT est.cnpj_basico, est.cnpj_ordem, est.cnpj_dv, emp.razao_social, est.nome_fantasia,
+        SELECT est.cnpj, est.razao_social, est.nome_fantasia,
         est.situacao_cadastral, est.data_situacao_cadastral, est.data_inicio_atividade,
-        nat.descricao as natureza, emp.capital_social, emp.porte_empresa,
-        est.tipo_de_logradouro, est.logradouro, est.numero, est.complemento, est.bairro, est.cep, est.uf, mun.descricao as munic,
-        est.ddd_1, est.telefone_1, est.correio_eletronico,
-        (SELECT string_agg(nome_socio_razao_social || ' (' || COALESCE(qual.descricao, '') || ')', '; ') 
-         FROM socios s LEFT JOIN qualificacoes qual ON s.qualificacao_socio = qual.codigo WHERE s.cnpj_basico = est.cnpj_basico) as socios
-        FROM estabelecimentos est
-        LEFT JOIN empresas emp ON est.cnpj_basico = emp.cnpj_basico
-        LEFT JOIN naturezas nat ON emp.natureza_juridica = nat.codigo
-        LEFT JOIN municipios mun ON est.municipio = mun.codigo
+        est.natureza_juridica_texto as natureza, est.capital_social, est.porte_empresa,
+        est.tipo_de_logradouro, est.logradouro, est.numero, est.complemento, est.bairro, est.cep, est.uf, est.municipio_texto as munic,
+        est.ddd_1, est.telefone_1, est.correio_eletronico, est.socios_texto as socios
+        FROM leitura_estabelecimentos est
         WHERE {" AND ".join(cond)} LIMIT 50000
     """
     def iterar():
@@ -382,10 +457,11 @@ def exportar_dados(
         with engine.connect() as conn:
             for row in conn.execution_options(yield_per=2000).execute(text(sql), p):
                 r = dict(row._mapping)
+                c = f"{r['cnpj']:014d}"
                 for k,v in r.items(): 
                     if v is None: r[k] = ""
                 l = [
-                    fmt_cnpj(r['cnpj_basico'], r['cnpj_ordem'], r['cnpj_dv']), r['razao_social'], r['nome_fantasia'],
+                    fmt_cnpj(c[:8], c[8:12], c[12:]), r['razao_social'], r['nome_fantasia'],
                     fmt_situacao(r['situacao_cadastral']), fmt_data(r['data_situacao_cadastral']), fmt_data(r['data_inicio_atividade']),
                     r['natureza'], fmt_dinheiro(r['capital_social']), fmt_porte(r['porte_empresa']),
                     f"{r['tipo_de_logradouro']} {r['logradouro']} {r['numero']} {r['complemento']}".strip(),
@@ -450,6 +526,29 @@ def stats():
         s = conn.execute(text("SELECT pg_size_pretty(pg_database_size('cnpj_dados'))")).scalar()
     return {"postgres_empresas": c, "postgres_tamanho": s}
 
+# Relatórios JSON gravados pelo etl_telemetria.py (download, importação, otimização, elastic)
+PASTA_RELATORIOS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dados", "relatorios")
+
+@app.get("/admin/relatorios", dependencies=[Depends(get_current_admin)])
+def listar_relatorios(etapa: Optional[str] = None, limite: int = 20):
+    if not os.path.isdir(PASTA_RELATORIOS): return []
+    nomes = sorted((n for n in os.listdir(PASTA_RELATORIOS) if n.endswith(".json")), key=lambda n: n.split("_", 1)[-1], reverse=True)
+    if etapa: nomes = [n for n in nomes if n.startswith(f"{etapa}_")]
+    resumo = []
+    for nome in nomes[:limite]:
+        try:
+            with open(os.path.join(PASTA_RELATORIOS, nome), encoding="utf-8") as f: rel = json.load(f)
+        except: continue
+        rel.pop("itens", None)
+        resumo.append(dict(rel, arquivo=nome))
+    return resumo
+
+@app.get("/admin/relatorios/{nome}", dependencies=[Depends(get_current_admin)])
+def ler_relatorio(nome: str):
+    caminho = os.path.join(PASTA_RELATORIOS, os.path.basename(nome))
+    if not caminho.endswith(".json") or not os.path.exists(caminho): raise HTTPException(404, "Relatório não encontrado")
+    with open(caminho, encoding="utf-8") as f: return json.load(f)
+
 @app.post("/admin/atualizar", dependencies=[Depends(get_current_admin)])
 def atualizar(bg: BackgroundTasks):
     bg.add_task(lambda: (executar_script("etl_download.py"), executar_script("etl_import.py"), executar_script("etl_sync_es.py")))
@@ -473,7 +572,14 @@ def backup(bg: BackgroundTasks):
 @app.delete("/admin/limpar", dependencies=[Depends(get_current_admin)])
 def limpar():
     with engine.connect() as conn:
-        conn.execute(text("TRUNCATE TABLE socios, estabelecimentos, empresas, cnaes, naturezas, municipios"))
+        conn.execute(text("TRUNCATE TABLE socios, estabelecimentos, empresas, cnaes, naturezas, municipios, cidades_por_uf, leitura_estabelecimentos"))
+        # Sem os dados, os checkpoints da importação não valem mais (o etl_import recria o ledger)
+        conn.execute(text("DROP TABLE IF EXISTS etl_importacao_ledger"))
         conn.commit()
-        if es_client: es_client.indices.delete(index="empresas-index", ignore=[400, 404])
+        if es_client:
+            try:
+                indices = list(es_client.indices.get_alias(name=ES_ALIAS))
+            except Exception:
+                indices = []
+            if indices: es_client.indices.delete(index=",".join(indices), ignore=[400, 404])
     return {"status": "ok"}
\ No newline at end of file
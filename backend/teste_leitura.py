@@ -41,5 +41,17 @@ def ler_amostra():
     print(chunk.head())
     print("\nColunas carregadas com sucesso!")
 
+def ler_amostra_parquet():
+    # Se o cache do etl_parquet.py existir, lê 10 linhas de lá (só as colunas pedidas, já tipadas)
+    import etl_parquet
+    if etl_parquet.pa is None or "estabelecimentos" not in etl_parquet.tabelas_disponiveis():
+        return False
+    colunas = ["cnpj_basico", "nome_fantasia", "situacao_cadastral", "data_inicio_atividade", "uf", "municipio"]
+    tabela = etl_parquet.abrir_tabela("estabelecimentos").head(10, columns=colunas)
+    print(f"Lendo amostra do cache Parquet: {etl_parquet.pasta_versao()}")
+    print(tabela.to_pandas())
+    return True
+
 if __name__ == "__main__":
-    ler_amostra()
\ No newline at end of file
+    if not ler_amostra_parquet():
+        ler_amostra()
\ No newline at end of file
@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+
+# Os módulos do ETL ficam na raiz do backend (os scripts rodam de lá)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def engine():
+    """Postgres do ETL (etl_setup_db). Os testes que precisam de banco são pulados sem ele."""
+    from etl_setup_db import get_engine
+    engine = get_engine()
+    try:
+        with engine.connect():
+            pass
+    except Exception as e:
+        pytest.skip(f"Postgres indisponível: {e}")
+    yield engine
+    engine.dispose()
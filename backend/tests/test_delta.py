@@ -0,0 +1,101 @@
+import pytest
+from sqlalchemy import text
+
+import etl_delta
+
+TABELA = "teste_delta"
+AGRUPADA = "teste_delta_socios"
+ALTERACOES = "teste_delta_alteracoes"
+
+
+@pytest.fixture
+def delta(engine, monkeypatch):
+    """Tabelas descartáveis no lugar de empresas/socios e de etl_alteracoes."""
+    monkeypatch.setattr(etl_delta, "CHAVES", {TABELA: ["cnpj_basico"], AGRUPADA: ["cnpj_basico"]})
+    monkeypatch.setattr(etl_delta, "DIGITOS_CHAVE", {TABELA: 8, AGRUPADA: 8})
+    monkeypatch.setattr(etl_delta, "AGRUPADAS", {AGRUPADA})
+    monkeypatch.setattr(etl_delta, "TABELA_ALTERACOES", ALTERACOES)
+    # Lotes pequenos para o teste passar por mais de uma transação
+    monkeypatch.setattr(etl_delta, "TAMANHO_LOTE_DELTA", 2)
+    tabelas = [TABELA, TABELA + "_next", AGRUPADA, AGRUPADA + "_next", ALTERACOES, "etl_delta_" + TABELA, "etl_delta_" + AGRUPADA]
+
+    def apagar():
+        with engine.connect() as conn:
+            for tabela in tabelas:
+                conn.execute(text(f"DROP TABLE IF EXISTS {tabela}"))
+    apagar()
+    with engine.connect() as conn:
+        for tabela in (TABELA, TABELA + "_next"):
+            conn.execute(text(f"CREATE TABLE {tabela} (cnpj_basico INTEGER PRIMARY KEY, razao_social TEXT)"))
+        for tabela in (AGRUPADA, AGRUPADA + "_next"):
+            conn.execute(text(f"CREATE TABLE {tabela} (cnpj_basico INTEGER, nome_socio TEXT)"))
+    etl_delta.garantir_tabela_alteracoes(engine)
+    yield engine
+    apagar()
+
+
+def inserir(engine, tabela, linhas):
+    with engine.connect() as conn:
+        for linha in linhas:
+            conn.execute(text(f"INSERT INTO {tabela} VALUES (:a, :b)"), {"a": linha[0], "b": linha[1]})
+
+
+def consultar(engine, sql):
+    with engine.connect() as conn:
+        return conn.execute(text(sql)).all()
+
+
+def existe(engine, tabela):
+    return consultar(engine, f"SELECT to_regclass('{tabela}')")[0][0] is not None
+
+
+def test_aplica_insercoes_alteracoes_e_remocoes(delta):
+    atuais = [(i, f"EMPRESA {i}") for i in range(1, 11)]
+    inserir(delta, TABELA, atuais)
+    # 1 removida, 1 alterada, 1 nova; as outras 8 iguais
+    novas = [linha for linha in atuais if linha[0] != 3] + [(11, "EMPRESA 11")]
+    novas[0] = (1, "EMPRESA 1 RENOMEADA")
+    inserir(delta, TABELA + "_next", novas)
+
+    assert etl_delta.aplicar_delta(delta, TABELA, TABELA + "_next", "v2") is True
+    assert consultar(delta, f"SELECT * FROM {TABELA} ORDER BY cnpj_basico") == sorted(novas)
+    assert consultar(delta, f"SELECT versao, tabela, chave, operacao FROM {ALTERACOES} ORDER BY chave") == [
+        ("v2", TABELA, "00000001", "U"), ("v2", TABELA, "00000003", "D"), ("v2", TABELA, "00000011", "I")]
+    assert not existe(delta, TABELA + "_next")
+    assert not existe(delta, "etl_delta_" + TABELA)
+
+
+def test_tabela_agrupada_regrava_o_grupo_inteiro(delta):
+    inserir(delta, AGRUPADA, [(1, "ANA"), (1, "BRUNO"), (2, "CARLA"), (3, "DIEGO"), (4, "EVA"), (5, "FABIO")])
+    inserir(delta, AGRUPADA + "_next", [(1, "ANA"), (1, "BRUNA"), (2, "CARLA"), (3, "DIEGO"), (4, "EVA"), (5, "FABIO")])
+
+    assert etl_delta.aplicar_delta(delta, AGRUPADA, AGRUPADA + "_next", "v2") is True
+    assert consultar(delta, f"SELECT * FROM {AGRUPADA} WHERE cnpj_basico = 1 ORDER BY nome_socio") == [(1, "ANA"), (1, "BRUNA")]
+    assert consultar(delta, f"SELECT chave, operacao FROM {ALTERACOES}") == [("00000001", "U")]
+
+
+def test_mudancas_demais_desistem_do_delta(delta):
+    inserir(delta, TABELA, [(i, "ANTIGA") for i in range(1, 5)])
+    inserir(delta, TABELA + "_next", [(i, "NOVA") for i in range(1, 5)])
+
+    assert etl_delta.aplicar_delta(delta, TABELA, TABELA + "_next", "v2") is False
+    # Nada aplicado: o chamador troca a tabela inteira com a _next, que precisa continuar lá
+    assert consultar(delta, f"SELECT DISTINCT razao_social FROM {TABELA}") == [("ANTIGA",)]
+    assert consultar(delta, f"SELECT count(*) FROM {ALTERACOES}") == [(0,)]
+    assert existe(delta, TABELA + "_next")
+    assert not existe(delta, "etl_delta_" + TABELA)
+
+
+def test_tabela_atual_vazia_desiste_do_delta(delta):
+    inserir(delta, TABELA + "_next", [(1, "NOVA")])
+    assert etl_delta.aplicar_delta(delta, TABELA, TABELA + "_next", "v1") is False
+    assert consultar(delta, f"SELECT count(*) FROM {ALTERACOES}") == [(0,)]
+
+
+def test_sem_mudancas_nao_registra_alteracoes(delta):
+    linhas = [(i, f"EMPRESA {i}") for i in range(1, 4)]
+    inserir(delta, TABELA, linhas)
+    inserir(delta, TABELA + "_next", linhas)
+    assert etl_delta.aplicar_delta(delta, TABELA, TABELA + "_next", "v2") is True
+    assert consultar(delta, f"SELECT count(*) FROM {ALTERACOES}") == [(0,)]
+    assert consultar(delta, f"SELECT count(*) FROM {TABELA}") == [(3,)]
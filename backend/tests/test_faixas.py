@@ -0,0 +1,85 @@
+import os
+
+import pytest
+
+from etl_transcoder import calcular_faixas, contar_registros, abrir_faixa
+
+
+def gravar(tmp_path, dados):
+    caminho = tmp_path / "dados.csv"
+    caminho.write_bytes(dados)
+    return str(caminho)
+
+
+def registros_com_quebra(quantidade):
+    # Um a cada três registros tem '\n' dentro das aspas, às vezes logo antes da aspa de fechamento
+    linhas = []
+    for i in range(quantidade):
+        nome = ["EMPRESA", "LINHA\nQUEBRADA", "FIM DE LINHA\n"][i % 3]
+        linhas.append(f'"{i:08d}";"{nome}";"MA"\n')
+    return "".join(linhas).encode("latin-1")
+
+
+def conferir_cobertura(faixas, tamanho):
+    assert faixas[0][0] == 0 and faixas[-1][1] == tamanho
+    assert all(anterior[1] == proxima[0] for anterior, proxima in zip(faixas, faixas[1:]))
+
+
+def test_faixas_de_arquivo_vazio(tmp_path):
+    caminho = gravar(tmp_path, b"")
+    assert calcular_faixas(caminho, 4, 3) == [(0, 0)]
+    assert contar_registros(caminho, 0, 0) == 0
+
+
+def test_corte_exatamente_no_inicio_de_um_registro(tmp_path):
+    # Registros de tamanho fixo: o alvo de cada corte cai no '\n' que fecha o registro anterior
+    registro = b'"00000001";"EMPRESA";"MA"\n'
+    caminho = gravar(tmp_path, registro * 4)
+    tamanho = len(registro)
+    assert calcular_faixas(caminho, 4, 3) == [(i * tamanho, (i + 1) * tamanho) for i in range(4)]
+
+
+def test_faixas_comecam_em_registros_mesmo_com_quebras_dentro_de_aspas(tmp_path):
+    dados = registros_com_quebra(3000)
+    caminho = gravar(tmp_path, dados)
+    faixas = calcular_faixas(caminho, 7, 3)
+    assert len(faixas) == 7
+    conferir_cobertura(faixas, len(dados))
+    inicios = {0}
+    posicao = 0
+    for i in range(3000):
+        posicao = dados.index(f'"{i:08d}";'.encode(), posicao)
+        inicios.add(posicao)
+    assert all(inicio in inicios for inicio, _ in faixas)
+
+
+def test_contagem_por_faixa_ignora_quebras_dentro_de_aspas(tmp_path):
+    dados = registros_com_quebra(3000)
+    caminho = gravar(tmp_path, dados)
+    assert dados.count(b"\n") > 3000
+    faixas = calcular_faixas(caminho, 5, 3)
+    assert sum(contar_registros(caminho, inicio, fim, tamanho_bloco=512) for inicio, fim in faixas) == 3000
+
+
+def test_mais_partes_que_registros(tmp_path):
+    dados = b'"1";"a";"b"\n"2";"c";"d"\n'
+    caminho = gravar(tmp_path, dados)
+    faixas = calcular_faixas(caminho, 10, 3)
+    conferir_cobertura(faixas, len(dados))
+    assert sum(contar_registros(caminho, inicio, fim) for inicio, fim in faixas) == 2
+
+
+def test_ultimo_registro_sem_quebra_de_linha(tmp_path):
+    caminho = gravar(tmp_path, b'"1";"a"\n"2";"b"')
+    assert contar_registros(caminho, 0, os.path.getsize(caminho)) == 2
+
+
+@pytest.mark.parametrize("partes", [2, 3, 8])
+def test_faixas_lidas_reconstituem_o_arquivo(tmp_path, partes):
+    dados = registros_com_quebra(500)
+    caminho = gravar(tmp_path, dados)
+    lido = b""
+    for inicio, fim in calcular_faixas(caminho, partes, 3):
+        with abrir_faixa(caminho, inicio, fim) as fonte:
+            lido += fonte.read()
+    assert lido == dados
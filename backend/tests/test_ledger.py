@@ -0,0 +1,119 @@
+import pytest
+from sqlalchemy import text
+
+from etl_ledger import (TABELA_LEDGER, garantir_ledger, faixas_registradas, registrar_faixas, carregar_checkpoint,
+                        arquivos_concluidos, SQL_CONCLUIR)
+from etl_import import copiar_bloco
+from etl_transcoder import calcular_faixas, abrir_faixa, ler_blocos, sql_copy_bytes
+
+VERSAO = "teste-ledger"
+TABELA = "teste_ledger_copia"
+COLUNAS = ["cnpj_basico", "nome", "uf"]
+
+
+def registros(quantidade):
+    nomes = ["LINHA\nQUEBRADA", "EMPRESA", "EMPRESA", "EMPRESA"]
+    return "".join(f'"{i:08d}";"{nomes[i % 4]}";"MA"\n' for i in range(quantidade)).encode("latin-1")
+
+
+@pytest.fixture
+def ledger(engine):
+    garantir_ledger(engine)
+    with engine.connect() as conn:
+        conn.execute(text(f"DELETE FROM {TABELA_LEDGER} WHERE versao = :v"), {"v": VERSAO})
+        conn.execute(text(f"DROP TABLE IF EXISTS {TABELA}"))
+        conn.execute(text(f"CREATE TABLE {TABELA} (cnpj_basico TEXT PRIMARY KEY, nome TEXT, uf TEXT)"))
+    yield engine
+    with engine.connect() as conn:
+        conn.execute(text(f"DELETE FROM {TABELA_LEDGER} WHERE versao = :v"), {"v": VERSAO})
+        conn.execute(text(f"DROP TABLE IF EXISTS {TABELA}"))
+
+
+def concluir(engine, arquivo, inicio):
+    with engine.connect() as conn:
+        conn.connection.cursor().execute(SQL_CONCLUIR, (VERSAO, arquivo, inicio))
+
+
+def contar(engine):
+    with engine.connect() as conn:
+        return conn.execute(text(f"SELECT count(*), count(DISTINCT cnpj_basico) FROM {TABELA}")).one()
+
+
+# --- Retomada sem banco: abrir_faixa a partir de uma posição gravada ---
+
+def test_retomada_no_meio_da_faixa_le_apenas_o_restante(tmp_path):
+    dados = registros(300)
+    caminho = tmp_path / "dados.csv"
+    caminho.write_bytes(dados)
+    with abrir_faixa(str(caminho), 0, len(dados)) as fonte:
+        primeiros = next(ler_blocos(fonte, 256))
+    with abrir_faixa(str(caminho), len(primeiros), len(dados)) as fonte:
+        restante = b"".join(ler_blocos(fonte, 256))
+    assert primeiros + restante == dados
+
+
+# --- Ledger no Postgres ---
+
+def test_registrar_faixas_nao_duplica_e_preserva_a_divisao(ledger):
+    registrar_faixas(ledger, VERSAO, "A.zip", TABELA, [(0, 10), (10, 25)], 25)
+    # Uma nova execução com outra divisão não substitui a registrada
+    registrar_faixas(ledger, VERSAO, "A.zip", TABELA, [(0, 25)], 25)
+    assert faixas_registradas(ledger, VERSAO, "A.zip") == [(0, 10), (10, 25)]
+    checkpoint = carregar_checkpoint(ledger, VERSAO, "A.zip", 10)
+    assert (checkpoint.inicio, checkpoint.fim, checkpoint.posicao, checkpoint.linhas, checkpoint.concluido) == (10, 25, 10, 0, False)
+    assert carregar_checkpoint(ledger, VERSAO, "B.zip") is None
+
+
+def test_arquivo_concluido_exige_todas_as_faixas_cobrindo_o_csv(ledger):
+    registrar_faixas(ledger, VERSAO, "A.zip", TABELA, [(0, 10), (10, 25)], 25)
+    registrar_faixas(ledger, VERSAO, "B.zip", TABELA, [(0, 10)], 25)
+    concluir(ledger, "A.zip", 0)
+    concluir(ledger, "B.zip", 0)
+    assert arquivos_concluidos(ledger, VERSAO, [TABELA]) == set()
+    concluir(ledger, "A.zip", 10)
+    # B.zip tem a única faixa concluída, mas ela não cobre o arquivo inteiro
+    assert arquivos_concluidos(ledger, VERSAO, [TABELA]) == {"A.zip"}
+    assert arquivos_concluidos(ledger, VERSAO, ["outra_tabela"]) == set()
+
+
+def test_copiar_bloco_com_erro_nao_avanca_o_checkpoint(ledger):
+    registrar_faixas(ledger, VERSAO, "A.zip", TABELA, [(0, 100)], 100)
+    checkpoint = carregar_checkpoint(ledger, VERSAO, "A.zip")
+    sql = sql_copy_bytes(TABELA, COLUNAS)
+    with ledger.connect() as conn:
+        assert copiar_bloco(conn, sql, b'"1";"X";"MA"\n', checkpoint, 14) == 1
+        # Chave repetida: o COPY falha e o UPDATE do ledger é desfeito junto
+        with pytest.raises(Exception):
+            copiar_bloco(conn, sql, b'"2";"Y";"MA"\n"1";"X";"MA"\n', checkpoint, 40)
+    checkpoint = carregar_checkpoint(ledger, VERSAO, "A.zip")
+    assert (checkpoint.posicao, checkpoint.linhas) == (14, 1)
+    assert contar(ledger) == (1, 1)
+
+
+def test_importacao_interrompida_retoma_sem_duplicar(ledger, tmp_path):
+    dados = registros(400)
+    caminho = str(tmp_path / "dados.csv")
+    with open(caminho, "wb") as f: f.write(dados)
+    faixas = calcular_faixas(caminho, 3, len(COLUNAS))
+    registrar_faixas(ledger, VERSAO, "A.zip", TABELA, faixas, len(dados))
+    sql = sql_copy_bytes(TABELA, COLUNAS)
+
+    def importar(inicio, limite_blocos=None):
+        checkpoint = carregar_checkpoint(ledger, VERSAO, "A.zip", inicio)
+        posicao = checkpoint.posicao
+        with ledger.connect() as conn, abrir_faixa(caminho, posicao, checkpoint.fim) as fonte:
+            for i, bloco in enumerate(ler_blocos(fonte, 300)):
+                if i == limite_blocos: return
+                posicao += len(bloco)
+                copiar_bloco(conn, sql, bloco, checkpoint, posicao)
+        concluir(ledger, "A.zip", inicio)
+
+    # Primeira execução: cai depois de dois blocos de cada faixa
+    for inicio, _ in faixas:
+        importar(inicio, limite_blocos=2)
+    assert arquivos_concluidos(ledger, VERSAO, [TABELA]) == set()
+    for inicio, _ in faixas:
+        importar(inicio)
+    assert contar(ledger) == (400, 400)
+    assert sum(carregar_checkpoint(ledger, VERSAO, "A.zip", inicio).linhas for inicio, _ in faixas) == 400
+    assert arquivos_concluidos(ledger, VERSAO, [TABELA]) == {"A.zip"}
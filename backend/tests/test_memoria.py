@@ -0,0 +1,69 @@
+import pytest
+
+import etl_memoria
+from etl_memoria import ControleBloco, TAMANHO_BLOCO_MIN, TAMANHO_BLOCO_MAX
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def rss(monkeypatch):
+    """RSS simulado: o teste muda rss["valor"] entre um bloco e outro."""
+    atual = {"valor": 100 * MB}
+    monkeypatch.setattr(etl_memoria, "memoria_residente", lambda: atual["valor"])
+    return atual
+
+
+def test_cresce_enquanto_a_vazao_sobe_ate_o_maximo(rss):
+    controle = ControleBloco(1024 * MB, inicial=4 * MB)
+    for _ in range(10):
+        controle.registrar(controle(), 0.1)
+    assert controle() == TAMANHO_BLOCO_MAX
+
+
+def test_queda_de_vazao_inverte_o_sentido(rss):
+    controle = ControleBloco(1024 * MB, inicial=4 * MB)
+    controle.registrar(4 * MB, 0.1)
+    assert controle() == 8 * MB
+    # O bloco maior rendeu menos por segundo: volta a diminuir
+    controle.registrar(8 * MB, 0.4)
+    assert controle() == 4 * MB
+    controle.registrar(4 * MB, 0.1)
+    assert controle() == 2 * MB
+
+
+def test_estouro_do_orcamento_corta_o_bloco_pela_metade(rss):
+    controle = ControleBloco(200 * MB, inicial=16 * MB)
+    rss["valor"] = 190 * MB
+    controle.registrar(16 * MB, 0.1)
+    assert (controle(), controle.reducoes, controle.pico_rss) == (8 * MB, 1, 190 * MB)
+    for _ in range(10):
+        controle.registrar(controle(), 0.1)
+    assert controle() == TAMANHO_BLOCO_MIN
+
+
+def test_nao_cresce_se_a_estimativa_passa_do_orcamento(rss):
+    controle = ControleBloco(200 * MB, inicial=8 * MB)
+    # 100 MB de base + 50 MB do bloco atual: com o bloco dobrado seriam 200 MB, acima de 90% do orçamento
+    rss["valor"] = 150 * MB
+    controle.registrar(8 * MB, 0.1)
+    assert controle() == 8 * MB
+
+
+def test_bloco_curto_nao_mexe_no_tamanho(rss):
+    controle = ControleBloco(1024 * MB, inicial=8 * MB)
+    controle.registrar(1 * MB, 10.0)
+    assert (controle(), controle.ultima_vazao) == (8 * MB, 0.0)
+
+
+def test_tamanho_inicial_fica_entre_os_limites(rss):
+    assert ControleBloco(1024 * MB, inicial=1)() == TAMANHO_BLOCO_MIN
+    assert ControleBloco(1024 * MB, inicial=10 * TAMANHO_BLOCO_MAX)() == TAMANHO_BLOCO_MAX
+
+
+def test_orcamento_dividido_entre_processos(monkeypatch):
+    monkeypatch.setattr(etl_memoria, "ORCAMENTO_MEMORIA_MB", 4096)
+    assert etl_memoria.orcamento_por_processo(4) == 1024 * MB
+    # Nunca abaixo do mínimo, e 0 processos conta como 1
+    assert etl_memoria.orcamento_por_processo(1000) == etl_memoria.ORCAMENTO_MINIMO
+    assert etl_memoria.orcamento_por_processo(0) == 4096 * MB
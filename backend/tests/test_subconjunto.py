@@ -0,0 +1,59 @@
+import pandas as pd
+import pyarrow as pa
+
+import etl_subconjunto
+from etl_subconjunto import Filtro
+
+COLUNAS = ["cnpj_basico", "uf", "municipio"]
+LINHAS = [["00000001", "MA", "0921"], ["00000002", "PI", "1219"], ["00000003", "SP", "9701"], ["00000004", "DF", "9701"]]
+
+
+def filtro():
+    # MA, ou o município 9701 (Brasília)
+    return Filtro(COLUNAS, {"uf": {"MA"}, "municipio": {"9701"}})
+
+
+def test_linha_do_csv():
+    assert [filtro()(linha) for linha in LINHAS] == [True, False, True, True]
+
+
+def test_mascara_pandas():
+    df = pd.DataFrame(LINHAS, columns=COLUNAS)
+    assert filtro().mascara(df).tolist() == [True, False, True, True]
+
+
+def test_mascara_colunas():
+    colunas = list(zip(*LINHAS))
+    assert filtro().mascara_colunas(lambda i: list(colunas[i])) == [True, False, True, True]
+    assert filtro().mascara_colunas(lambda i: []) == []
+
+
+def test_mascara_arrow_com_nulos():
+    lote = pa.RecordBatch.from_pylist([dict(zip(COLUNAS, linha)) for linha in LINHAS] + [{"cnpj_basico": "00000005", "uf": None, "municipio": None}])
+    f = filtro()
+    assert f.mascara_arrow(lote).to_pylist() == [True, False, True, True, False]
+    # Segundo lote reaproveita o value_set montado no primeiro
+    assert set(f._conjuntos_arrow) == {"uf", "municipio"}
+    assert f.mascara_arrow(lote.slice(1, 2)).to_pylist() == [False, True]
+
+
+def test_mascara_arrow_com_conjunto_maior_que_o_lote():
+    basicos = {f"{i:08d}" for i in range(0, 1000, 2)}
+    f = Filtro(COLUNAS, {"cnpj_basico": basicos})
+    lote = pa.RecordBatch.from_pydict({"cnpj_basico": ["00000002", "00000003", None], "uf": ["MA"] * 3, "municipio": ["0921"] * 3})
+    assert f.mascara_arrow(lote).to_pylist() == [True, False, False]
+    # Esse caminho consulta o set do Python e não monta value_set
+    assert f._conjuntos_arrow == {}
+
+
+def test_filtro_da_tabela(monkeypatch):
+    monkeypatch.setattr(etl_subconjunto, "UFS", set())
+    monkeypatch.setattr(etl_subconjunto, "MUNICIPIOS", set())
+    assert etl_subconjunto.filtro_da_tabela("estabelecimentos", COLUNAS, "", "") is None
+
+    monkeypatch.setattr(etl_subconjunto, "UFS", {"MA"})
+    assert etl_subconjunto.filtro_da_tabela("estabelecimentos", COLUNAS, "", "")(LINHAS[0])
+    assert etl_subconjunto.filtro_da_tabela("cnaes", ["codigo", "descricao"], "", "") is None
+    monkeypatch.setattr(etl_subconjunto, "carregar_basicos", lambda url, tabela: frozenset({"00000002"}))
+    dependente = etl_subconjunto.filtro_da_tabela("socios", COLUNAS, "", "estabelecimentos")
+    assert [dependente(linha) for linha in LINHAS] == [False, True, False, False]
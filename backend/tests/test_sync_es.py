@@ -0,0 +1,284 @@
+import queue
+import threading
+
+import pytest
+
+import etl_sync_es
+from etl_sync_es import ControleBulk, BULK_MIN, BULK_MAX, fatias_postgres
+
+FIM_CNPJ = 10 ** 14
+
+
+class ResultadoFalso:
+    def __init__(self, valor):
+        self.valor = valor
+
+    def scalar(self):
+        return self.valor
+
+    def one(self):
+        return self.valor
+
+    def all(self):
+        return self.valor
+
+    def __iter__(self):
+        return iter(self.valor)
+
+
+class EngineFalsa:
+    """engine.connect() cujo execute devolve, em ordem, os valores de `respostas`."""
+
+    def __init__(self, *respostas):
+        self.respostas = list(respostas)
+        self.consultas = []
+
+    def connect(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *erro):
+        return False
+
+    def execute(self, consulta, parametros=None):
+        self.consultas.append((str(consulta), parametros))
+        return ResultadoFalso(self.respostas.pop(0))
+
+
+# --- ControleBulk ---
+
+def test_bulk_cresce_e_inverte_quando_a_vazao_cai():
+    controle = ControleBulk(1000)
+    controle.registrar(1000, 1.0, 0)
+    assert controle() == 2000
+    # O dobro de documentos no triplo do tempo: vazão caiu, volta a diminuir
+    controle.registrar(2000, 3.0, 0)
+    assert controle() == 1000
+
+
+def test_bulk_com_recusa_cai_pela_metade_ate_o_minimo():
+    controle = ControleBulk(1000)
+    controle.registrar(1000, 1.0, 3)
+    assert (controle(), controle.fator, controle.ultima_vazao) == (500, 2, 0.0)
+    for _ in range(10):
+        controle.registrar(controle(), 1.0, 1)
+    assert controle() == BULK_MIN
+
+
+def test_bulk_curto_nao_mexe_no_tamanho():
+    controle = ControleBulk(1000)
+    controle.registrar(10, 0.001, 0)
+    assert controle() == 1000
+
+
+def test_bulk_nao_passa_do_maximo():
+    controle = ControleBulk(BULK_MAX)
+    controle.registrar(BULK_MAX, 1.0, 0)
+    assert controle() == BULK_MAX
+
+
+# --- fatias_postgres ---
+
+def conferir_fatias(fatias):
+    assert fatias[0][0] == 0 and fatias[-1][1] == FIM_CNPJ
+    assert all(anterior[1] == proxima[0] for anterior, proxima in zip(fatias, fatias[1:]))
+
+
+def test_fatias_pelo_histograma():
+    limites = "{" + ",".join(str(v) for v in range(100, 1100, 100)) + "}"
+    fatias = fatias_postgres(EngineFalsa(limites), 5)
+    conferir_fatias(fatias)
+    assert fatias == [(0, 300), (300, 500), (500, 700), (700, 900), (900, FIM_CNPJ)]
+
+
+def test_fatias_com_histograma_repetido_nao_ficam_vazias():
+    fatias = fatias_postgres(EngineFalsa("{5,5,5,5,5}"), 4)
+    assert fatias == [(0, 5), (5, FIM_CNPJ)]
+
+
+def test_fatias_sem_estatisticas_usam_minimo_e_maximo():
+    engine = EngineFalsa(None, (1000, 5000))
+    fatias = fatias_postgres(engine, 4)
+    conferir_fatias(fatias)
+    assert fatias == [(0, 2000), (2000, 3000), (3000, 4000), (4000, FIM_CNPJ)]
+    assert "min(cnpj)" in engine.consultas[1][0]
+
+
+def test_modelo_de_leitura_vazio_nao_tem_fatias():
+    assert fatias_postgres(EngineFalsa(None, (None, None)), 4) == []
+
+
+# --- sincronizar ---
+
+class ElasticFalso:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def ping(self):
+        return True
+
+
+def test_origem_vazia_nao_cria_nem_publica_indice(monkeypatch, capsys):
+    monkeypatch.setattr(etl_sync_es, "Elasticsearch", ElasticFalso)
+    monkeypatch.setattr(etl_sync_es, "ORIGEM_PARQUET", False)
+    monkeypatch.setattr(etl_sync_es, "get_engine", lambda: EngineFalsa())
+    monkeypatch.setattr(etl_sync_es, "indices_do_alias", lambda es: ["empresas-index-1"])
+    monkeypatch.setattr(etl_sync_es, "alteracoes_refletidas", lambda engine: 10)
+    monkeypatch.setattr(etl_sync_es, "fatias_postgres", lambda engine, quantidade: [])
+    monkeypatch.setattr(etl_sync_es.progresso, "garantir_progresso", lambda engine: None)
+    monkeypatch.setattr(etl_sync_es.progresso, "carga_pendente", lambda engine: None)
+
+    def nao_chamar(*args, **kwargs):
+        raise AssertionError("não deveria criar, registrar nem publicar índice")
+    for nome in ("criar_indice", "publicar", "apagar_versoes_antigas"):
+        monkeypatch.setattr(etl_sync_es, nome, nao_chamar)
+    monkeypatch.setattr(etl_sync_es.progresso, "registrar_fatias", nao_chamar)
+
+    etl_sync_es.sincronizar()
+    assert "continua em empresas-index-1" in capsys.readouterr().out
+
+
+# --- Incremental ---
+
+def linha_alterada(cnpj, uf, municipio):
+    return (cnpj, True, cnpj, "FANTASIA", uf, municipio, "02", "20150101", "RAZAO", 10.0, "4711301", "4712100,", "1", "2062", "01")
+
+
+LINHAS_ALTERADAS = [
+    linha_alterada("00000000000191", "MA", "0921"),
+    ("00000000000272", False) + (None,) * 13,
+    linha_alterada("00000000000353", "SP", "7107"),
+]
+
+
+def test_acoes_alteradas_indexa_os_atuais_e_apaga_os_removidos(monkeypatch):
+    monkeypatch.setattr(etl_sync_es.etl_subconjunto, "UFS", set())
+    monkeypatch.setattr(etl_sync_es.etl_subconjunto, "MUNICIPIOS", set())
+    conn = EngineFalsa(LINHAS_ALTERADAS)
+    acoes = list(etl_sync_es.acoes_alteradas(conn, 10, 20))
+    assert [acao.get("_op_type", "index") for acao in acoes] == ["index", "delete", "index"]
+    assert acoes[0]["_source"]["cnae_fiscal_secundaria"] == ["4712100"]
+    assert acoes[1] == {"_op_type": "delete", "_id": "00000000000272"}
+    assert conn.consultas[0][1]["de"] == 10 and conn.consultas[0][1]["ate"] == 20
+
+
+def test_acoes_alteradas_respeitam_o_subconjunto(monkeypatch):
+    monkeypatch.setattr(etl_sync_es.etl_subconjunto, "UFS", {"MA"})
+    monkeypatch.setattr(etl_sync_es.etl_subconjunto, "MUNICIPIOS", set())
+    acoes = list(etl_sync_es.acoes_alteradas(EngineFalsa(LINHAS_ALTERADAS), 0, 5))
+    # O de SP fica de fora; o delete passa sempre (o documento pode ter entrado antes do filtro)
+    assert [acao["_id"] for acao in acoes] == ["00000000000191", "00000000000272"]
+
+    monkeypatch.setattr(etl_sync_es.etl_subconjunto, "MUNICIPIOS", {"7107"})
+    assert len(list(etl_sync_es.acoes_alteradas(EngineFalsa(LINHAS_ALTERADAS), 0, 5))) == 3
+
+
+class BulkFalso:
+    def __init__(self):
+        self.enviados = []
+
+    def streaming_bulk(self, es, acoes, **kwargs):
+        for acao in acoes:
+            self.enviados.append(acao)
+            yield True, {acao.get("_op_type", "index"): {"status": 200}}
+
+
+@pytest.fixture
+def incremental(monkeypatch, tmp_path):
+    """sincronizar_incremental com Elastic, Postgres e marca falsos; devolve o estado para conferir."""
+    estado = {"marca": 100, "refletidas": 150, "ultimo": 200, "lotes": [], "marcas": [], "completa": False}
+    bulk = BulkFalso()
+    estado["bulk"] = bulk
+    monkeypatch.setattr(etl_sync_es.etl_telemetria, "PASTA_RELATORIOS", str(tmp_path))
+    monkeypatch.setattr(etl_sync_es, "Elasticsearch", ElasticFalso)
+    monkeypatch.setattr(etl_sync_es, "helpers", bulk)
+    monkeypatch.setattr(etl_sync_es, "LOTE_ALTERACOES", 20)
+    # Sem recarga total ('*') entre a marca e o limite
+    monkeypatch.setattr(etl_sync_es, "get_engine", lambda: EngineFalsa(False))
+    monkeypatch.setattr(etl_sync_es, "indices_do_alias", lambda es: ["empresas-index-1"])
+    monkeypatch.setattr(etl_sync_es, "mapeamento_desatualizado", lambda es, indice: False)
+    monkeypatch.setattr(etl_sync_es, "alteracoes_refletidas", lambda engine: estado["refletidas"])
+    monkeypatch.setattr(etl_sync_es, "ultimo_id_alteracoes", lambda engine: estado["ultimo"])
+    monkeypatch.setattr(etl_sync_es, "sincronizar", lambda: estado.update(completa=True))
+    monkeypatch.setattr(etl_sync_es.progresso, "garantir_progresso", lambda engine: None)
+    monkeypatch.setattr(etl_sync_es.progresso, "marca_atual", lambda engine, alias: estado["marca"])
+    monkeypatch.setattr(etl_sync_es.progresso, "gravar_marca", lambda engine, alias, ultimo, indice: estado["marcas"].append(ultimo))
+
+    def acoes(conn, de, ate):
+        estado["lotes"].append((de, ate))
+        return [{"_id": f"{ate:014d}", "_source": {}}]
+    monkeypatch.setattr(etl_sync_es, "acoes_alteradas", acoes)
+    return estado
+
+
+def test_incremental_para_na_marca_do_modelo_de_leitura(incremental):
+    etl_sync_es.sincronizar_incremental()
+    # As alterações 151 a 200 ainda não estão no modelo de leitura: ficam para a próxima execução
+    assert incremental["lotes"] == [(100, 120), (120, 140), (140, 150)]
+    assert incremental["marcas"] == [120, 140, 150]
+    assert len(incremental["bulk"].enviados) == 3
+
+
+def test_incremental_vai_ate_o_ultimo_quando_o_modelo_esta_em_dia(incremental):
+    incremental.update(refletidas=300, ultimo=130)
+    etl_sync_es.sincronizar_incremental()
+    assert incremental["marcas"] == [120, 130]
+
+
+def test_incremental_sem_marca_do_modelo_nao_envia_nada(incremental):
+    incremental["refletidas"] = None
+    etl_sync_es.sincronizar_incremental()
+    assert (incremental["lotes"], incremental["marcas"], incremental["completa"]) == ([], [], False)
+
+
+def test_incremental_em_dia_nao_envia_nada(incremental):
+    incremental["refletidas"] = 100
+    etl_sync_es.sincronizar_incremental()
+    assert (incremental["lotes"], incremental["marcas"]) == ([], [])
+
+
+def test_incremental_sem_marca_faz_a_carga_completa(incremental):
+    incremental["marca"] = None
+    etl_sync_es.sincronizar_incremental()
+    assert incremental["completa"] and incremental["lotes"] == []
+
+
+def test_incremental_com_recusa_nao_avanca_a_marca(incremental, monkeypatch):
+    def recusar(es, acoes, **kwargs):
+        for acao in acoes:
+            yield False, {"index": {"status": 429}}
+    monkeypatch.setattr(incremental["bulk"], "streaming_bulk", recusar)
+    etl_sync_es.sincronizar_incremental()
+    assert incremental["lotes"] == [(100, 120)]
+    assert incremental["marcas"] == []
+
+
+# --- Extração por COPY ---
+
+def test_valor_copy():
+    assert etl_sync_es._valor_copy("\\N") is None
+    assert etl_sync_es._valor_copy("") == ""
+    assert etl_sync_es._valor_copy("RUA A, 10") == "RUA A, 10"
+    assert etl_sync_es._valor_copy("A\\tB\\nC\\\\D\\rE") == "A\tB\nC\\D\rE"
+    # Barra invertida seguida de outro caractere vale o próprio caractere
+    assert etl_sync_es._valor_copy("\\N\\x") == "Nx"
+
+
+def test_copy_em_blocos_pequenos_devolve_os_valores_do_banco(engine, monkeypatch):
+    # Uma mensagem do COPY por bloco: nenhuma linha pode ficar dividida entre dois blocos
+    monkeypatch.setattr(etl_sync_es, "TAMANHO_BLOCO_COPY", 1)
+    sql = ("SELECT * FROM (VALUES (1, E'TAB\\tNO MEIO', E'LINHA\\nQUEBRADA'), (2, E'BARRA \\\\ FINAL\\\\', NULL), "
+           "(3, '', E'\\\\N LITERAL')) v(id, a, b) ORDER BY id")
+    fila = queue.Queue()
+    etl_sync_es._ler_copy(engine, sql, fila, threading.Event())
+    blocos = []
+    while (bloco := fila.get()) is not None:
+        assert not isinstance(bloco, BaseException), bloco
+        blocos.append(bloco)
+    assert len(blocos) == 3
+    lidos = [tuple(map(etl_sync_es._valor_copy, bloco.decode("utf-8").rstrip("\n").split("\t"))) for bloco in blocos]
+    with engine.connect() as conn:
+        esperados = [(str(i), a, b) for i, a, b in conn.exec_driver_sql(sql).all()]
+    assert lidos == esperados
@@ -0,0 +1,116 @@
+import io
+
+from etl_transcoder import (ler_blocos, transcodificar_bloco, reparar_bloco, converter_tipos, _converter_tipos_csv,
+                            converter_data, converter_numero, converter_codigo, conversoes_das_colunas)
+from etl_subconjunto import Filtro
+
+COLUNAS = ["cnpj_basico", "nome", "data_inicio_atividade", "capital_social", "porte_empresa", "uf"]
+TIPOS = {"data_inicio_atividade": "data", "capital_social": "numero", "porte_empresa": "codigo"}
+
+
+def registro(basico, nome="EMPRESA", data="20150101", capital="1000,50", porte="02", uf="MA"):
+    return f'"{basico:08d}";"{nome}";"{data}";"{capital}";"{porte}";"{uf}"\n'.encode("latin-1")
+
+
+def blocos(dados, tamanho):
+    return list(ler_blocos(io.BytesIO(dados), tamanho))
+
+
+# --- ler_blocos ---
+
+def test_ler_blocos_entrada_vazia():
+    assert blocos(b"", 16) == []
+
+
+def test_ler_blocos_termina_sempre_em_registro_completo():
+    dados = b"".join(registro(i) for i in range(200))
+    resultado = blocos(dados, 100)
+    assert b"".join(resultado) == dados
+    assert all(bloco.endswith(b"\n") for bloco in resultado)
+
+
+def test_ler_blocos_nao_corta_quebra_de_linha_dentro_de_aspas():
+    dados = b"".join(registro(i, nome="LINHA\nQUEBRADA" if i % 3 == 0 else "EMPRESA") for i in range(100))
+    resultado = blocos(dados, 64)
+    assert b"".join(resultado) == dados
+    for bloco in resultado:
+        # Aspas balanceadas: nenhum registro ficou dividido entre dois blocos
+        assert bloco.count(b'"') % 2 == 0
+
+
+def test_ler_blocos_ultimo_registro_sem_quebra_de_linha():
+    dados = registro(1) + registro(2).rstrip(b"\n")
+    assert b"".join(blocos(dados, 8)) == dados
+
+
+def test_ler_blocos_consulta_tamanho_chamavel_a_cada_leitura():
+    tamanhos = []
+
+    def tamanho():
+        tamanhos.append(len(tamanhos))
+        return 50
+
+    dados = b"".join(registro(i) for i in range(20))
+    assert b"".join(ler_blocos(io.BytesIO(dados), tamanho)) == dados
+    assert len(tamanhos) > 1
+
+
+# --- transcodificar_bloco / reparar_bloco ---
+
+def test_transcodificar_bloco_remove_espacos_nulos_e_converte_para_utf8():
+    bloco = '"  PADARIA SÃO JOÃO  ";"\x00X";"  "\n'.encode("latin-1")
+    assert transcodificar_bloco(bloco) == '"PADARIA SÃO JOÃO";"X";""\n'.encode("utf-8")
+
+
+def test_reparar_bloco_descarta_linhas_com_campos_a_mais_ou_a_menos():
+    bloco = b'"1";"a"\n"2";"b";"extra"\n"3"\n"4";" d "\n'
+    corrigido, descartadas = reparar_bloco(bloco, 2)
+    assert descartadas == 2
+    assert corrigido == b'"1";"a"\n"4";"d"\n'
+
+
+# --- conversões de tipo ---
+
+def test_conversores():
+    assert converter_data("20150101") == "2015-01-01"
+    assert converter_data("00000000") == converter_data("0") == converter_data("20150231") == ""
+    assert converter_numero("1.000,50") == "1000.50"
+    assert converter_numero("abc") == ""
+    assert converter_codigo("02") == "2"
+    assert converter_codigo("") == converter_codigo("X") == ""
+
+
+def conversoes():
+    return conversoes_das_colunas(COLUNAS, TIPOS)
+
+
+def test_converter_tipos_so_toca_as_colunas_tipadas():
+    saida = converter_tipos(registro(1) + registro(2, data="0", capital="", porte="X"), len(COLUNAS), conversoes())
+    assert saida == (b'"00000001";"EMPRESA";"2015-01-01";"1000.50";"2";"MA"\n'
+                     b'"00000002";"EMPRESA";"";"";"";"MA"\n')
+
+
+def test_converter_tipos_igual_ao_caminho_csv():
+    bloco = b"".join(registro(i, nome="LINHA\nDUAS" if i % 5 == 0 else "EMPRESA", data="2015010" + str(i % 10)) for i in range(50))
+    filtro = Filtro(COLUNAS, {"cnpj_basico": {f"{i:08d}" for i in range(0, 50, 3)}})
+    for f in (None, filtro):
+        assert converter_tipos(bloco, len(COLUNAS), conversoes(), f) == _converter_tipos_csv(bloco.decode(), len(COLUNAS), conversoes(), f)
+
+
+def test_converter_tipos_bloco_fora_do_layout_vai_pelo_csv():
+    # Aspas duplicadas dentro do campo e linha com campos a menos (passa intacta para o COPY/reparo)
+    bloco = registro(1, nome='A ""B"" C') + b'"2";"curta"\n'
+    saida = converter_tipos(bloco, len(COLUNAS), conversoes())
+    assert saida == b'"00000001";"A ""B"" C";"2015-01-01";"1000.50";"2";"MA"\n"2";"curta"\n'
+
+
+def test_converter_tipos_com_filtro():
+    bloco = registro(1, uf="MA") + registro(2, uf="SP") + registro(3, uf="PI")
+    filtro = Filtro(COLUNAS, {"uf": {"MA", "PI"}})
+    saida = converter_tipos(bloco, len(COLUNAS), conversoes(), filtro)
+    assert [linha.split(b";")[0] for linha in saida.splitlines()] == [b'"00000001"', b'"00000003"']
+    assert converter_tipos(bloco, len(COLUNAS), conversoes(), Filtro(COLUNAS, {"uf": {"RJ"}})) == b""
+
+
+def test_converter_tipos_bloco_vazio():
+    assert converter_tipos(b"", len(COLUNAS), conversoes()) == b""